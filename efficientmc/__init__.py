@@ -6,105 +6,1220 @@ import scipy.stats as sps
 import efficientmc.assets as assets
 import efficientmc.pricemodels as pricemodels
 import efficientmc.generators as generators
+import efficientmc.computations as computations
+import efficientmc.analytic as analytic
+import efficientmc.scenarios as scenarios
+from efficientmc.computations import MtMComputation, DeltaComputation, \
+    GreeksComputation, Replications
+from efficientmc.paths import Paths
+from efficientmc.schedule import Schedule
+from efficientmc.results import LabeledArray, Results, loadresults
+from efficientmc.scenarios import Scenarios
+from efficientmc.utils import setdtype, getdtype, Workspace
 from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import time
 
 MCResults = namedtuple('MCResults', ('mean', 'iclow', 'icup'))
 
-def runmc(*allassets):
+BLOCKSIZE = 4096
+
+def runmc(*allassets, computations=None, chunksize=None, blocksize=BLOCKSIZE,
+          nprocs=None, controls=False, greeks=False, directory=None,
+          workspace=None):
     """
     Calcule par simulation Monte-Carlo les cash-flows des actifs de
     `allassets`, sous la probabilité risque-neutre.
+
+    Par défaut, toutes les trajectoires sont conservées et renvoyées sous la
+    forme d'un objet `Results`, qui peut être décomposé en
+    `earnings, volumes, prices`.
+
+    Si `computations` (liste d'objets `Computation`) est renseigné, les
+    résultats de chaque date sont transmis à ces calculs au fur et à mesure,
+    sans être conservés, et ce sont les calculs qui sont renvoyés.
+
+    Paramètres :
+    ------------
+    allassets
+        Actifs à simuler.
+    computations : liste de `Computation`, optionnel
+        Calculs à alimenter pendant la simulation.
+    chunksize : entier positif, optionnel
+        Si renseigné, les simulations sont effectuées par lots de
+        `chunksize` simulations, de sorte que la mémoire utilisée ne dépende
+        pas du nombre total de simulations ; `computations` vaut alors par
+        défaut `[MtMComputation(), DeltaComputation()]`. Avec des
+        générateurs utilisant un `RandomStream`, les résultats ne dépendent
+        pas de `chunksize`.
+    blocksize : entier positif
+        Taille des blocs de simulations sur lesquels les statistiques des
+        calculs sont agrégées ; `chunksize` doit en être un multiple.
+    nprocs : entier positif, optionnel
+        Si renseigné, les lots sont répartis sur `nprocs` processus. Les
+        générateurs doivent alors utiliser un `RandomStream`, ce qui
+        garantit des résultats identiques au bit près quel que soit le
+        nombre de processus. Par défaut, `chunksize` est choisi de façon à
+        créer un lot par processus.
+    controls : booléen
+        Si `True`, les variables de contrôle déclarées par les actifs
+        (cf. `getcontrols`) sont simulées en même temps que les cash-flows,
+        et `getmtm` corrige la MtM de chaque actif par régression sur ses
+        variables de contrôle, dont l'espérance est connue.
+    greeks : booléen
+        Si `True`, les dérivées des cash-flows actualisés par rapport aux
+        paramètres des marchés (cf. `getgreeks` des actifs) sont simulées
+        sur les mêmes trajectoires que les cash-flows ; `getgreeks` en
+        déduit les grecques. `computations` contient alors par défaut un
+        `GreeksComputation`.
+    directory : optionnel
+        Si renseigné (et si `computations` ne l'est pas), les résultats
+        sont écrits dans des fichiers `.npy` de ce répertoire au lieu
+        d'être conservés en mémoire, et peuvent être relus depuis un autre
+        processus par `loadresults`. Si `chunksize` est également
+        renseigné, les simulations sont effectuées par lots, dont seuls les
+        résultats transitent par la mémoire.
+    workspace : Workspace, optionnel
+        Espace de travail dont les tampons sont réutilisés par les marchés
+        et les actifs d'une date et d'un lot à l'autre ; par défaut, un
+        nouvel espace est créé pour la simulation. Le renseigner permet de
+        mesurer la mémoire allouée à chaque date (cf. `Workspace(trace=
+        True)`) dans le cas d'une simulation séquentielle.
+    """
+    allmarkets, alldates = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    if nprocs is not None and workspace is not None:
+        raise ValueError("a workspace can only be used by a sequential "\
+                         "simulation.")
+    if workspace is None:
+        workspace = Workspace()
+    if directory is not None:
+        if computations is not None or nprocs is not None:
+            raise ValueError("results can only be stored on disk by a "\
+                             "sequential simulation without computations.")
+        return _runtodisk(allassets, allmarkets, alldates, nsims, chunksize,
+                          directory, controls, greeks, workspace)
+    if nprocs is not None:
+        return _runparallel(allassets, allmarkets, alldates, nsims,
+                            computations, chunksize, blocksize, nprocs,
+                            controls, greeks)
+    if computations is None and chunksize is None:
+        res = _mkresults(allassets, allmarkets, alldates, nsims, controls,
+                         _isweighted(allmarkets), _getstrata(allmarkets),
+                         greeks)
+        _simulatebatch(allassets, allmarkets, alldates, res,
+                       workspace=workspace)
+        return res
+    if computations is None:
+        computations = _defaultcomputations(greeks)
+    if chunksize is not None and chunksize % blocksize != 0:
+        raise ValueError("the chunk size should be a multiple of the block "\
+                         "size.")
+    _startcomputations(computations, allassets, allmarkets, alldates,
+                       blocksize, controls, greeks)
+    if chunksize is None:
+        _runbatch(allassets, allmarkets, alldates, computations, 0, nsims,
+                  controls=controls, greeks=greeks, workspace=workspace)
+    else:
+        for offset in range(0, nsims, chunksize):
+            _runbatch(allassets, allmarkets, alldates, computations, offset,
+                      min(chunksize, nsims - offset), reset=True,
+                      controls=controls, greeks=greeks, workspace=workspace)
+        _setchunk(allassets, allmarkets, 0, nsims)
+    return computations
+
+def _runtodisk(allassets, allmarkets, alldates, nsims, chunksize, directory,
+               controls=False, greeks=False, workspace=None):
+    """
+    Simule les actifs de `allassets` (par lots de `chunksize` simulations
+    si renseigné) et écrit les résultats dans le répertoire `directory`.
+    """
+    if chunksize is None:
+        res = _mkresults(allassets, allmarkets, alldates, nsims, controls,
+                         _isweighted(allmarkets), _getstrata(allmarkets),
+                         greeks, directory)
+        _simulatebatch(allassets, allmarkets, alldates, res,
+                       workspace=workspace)
+        res.flush()
+        return res
+    _setchunk(allassets, allmarkets, 0, nsims)
+    res = _mkresults(allassets, allmarkets, alldates, nsims, controls,
+                     _isweighted(allmarkets), _getstrata(allmarkets), greeks,
+                     directory)
+    for offset in range(0, nsims, chunksize):
+        size = min(chunksize, nsims - offset)
+        _setchunk(allassets, allmarkets, offset, size)
+        chunk = _mkresults(allassets, allmarkets, alldates, size, controls,
+                           _isweighted(allmarkets), _getstrata(allmarkets),
+                           greeks)
+        _simulatebatch(allassets, allmarkets, alldates, chunk,
+                       workspace=workspace)
+        res.write(offset, chunk)
+    _setchunk(allassets, allmarkets, 0, nsims)
+    res.flush()
+    return res
+
+def _defaultcomputations(greeks=False):
+    "Renvoie les calculs alimentés par défaut par `runmc`."
+    computations = [MtMComputation(), DeltaComputation()]
+    if greeks:
+        computations.append(GreeksComputation())
+    return computations
+
+def _runparallel(allassets, allmarkets, alldates, nsims, computations,
+                 chunksize, blocksize, nprocs, controls=False, greeks=False):
+    "Répartit les lots de simulations de `runmc` sur `nprocs` processus."
+    for market in allmarkets:
+        if not isinstance(market.randomgen.randomfunc,
+                          generators.RandomStream):
+            raise ValueError("parallel simulations require generators based "\
+                             "on a RandomStream.")
+    if computations is None:
+        computations = _defaultcomputations(greeks)
+    if chunksize is None:
+        nblocks = -(-nsims // (nprocs * blocksize))
+        chunksize = nblocks * blocksize
+    elif chunksize % blocksize != 0:
+        raise ValueError("the chunk size should be a multiple of the block "\
+                         "size.")
+    offsets = range(0, nsims, chunksize)
+    with ProcessPoolExecutor(max_workers=nprocs) as executor:
+        allresults = list(executor.map(
+            _runworker, [allassets] * len(offsets),
+            [computations] * len(offsets), offsets,
+            [min(chunksize, nsims - offset) for offset in offsets],
+            [blocksize] * len(offsets), [controls] * len(offsets),
+            [greeks] * len(offsets), [getdtype()] * len(offsets)))
+    _startcomputations(computations, allassets, allmarkets, alldates,
+                       blocksize, controls, greeks)
+    for results in allresults:
+        for comp, result in zip(computations, results):
+            comp.merge(result)
+    return computations
+
+def _runworker(allassets, computations, offset, nsims, blocksize,
+               controls=False, greeks=False, dtype=None):
+    """
+    Simule, dans un processus de `_runparallel`, le lot des simulations
+    d'indices `offset` à `offset + nsims - 1` (avec le type flottant
+    `dtype` du processus principal, cf. `setdtype`).
+    """
+    if dtype is not None:
+        setdtype(dtype)
+    allmarkets, alldates = _getgrid(allassets)
+    _startcomputations(computations, allassets, allmarkets, alldates,
+                       blocksize, controls, greeks)
+    _runbatch(allassets, allmarkets, alldates, computations, offset, nsims,
+              reset=True, controls=controls, greeks=greeks)
+    return computations
+
+def _startcomputations(computations, allassets, allmarkets, alldates,
+                       blocksize, controls=False, greeks=False):
+    "Prépare les calculs `computations` avant la simulation."
+    res = _mkresults(allassets, allmarkets, [None], 0, controls,
+                     greeks=greeks)
+    for comp in computations:
+        comp.start(res.earnings.coords['asset'],
+                   res.volumes.coords['exposure'],
+                   res.prices.coords['market'], alldates, blocksize,
+                   res.controlmeans,
+                   None if res.greeks is None else res.greeks.coords['greek'],
+                   _getpricemeans(allassets, allmarkets, alldates))
+
+def _runbatch(allassets, allmarkets, alldates, computations, offset, nsims,
+              reset=False, controls=False, greeks=False, workspace=None):
+    """
+    Simule le lot des simulations d'indices `offset` à `offset + nsims - 1`
+    et transmet les résultats à `computations`. Si `reset` vaut `True`, les
+    générateurs sont restreints au lot et les caches des marchés et des
+    actifs sont vidés au préalable.
+    """
+    if reset:
+        _setchunk(allassets, allmarkets, offset, nsims)
+    strata = _getstrata(allmarkets)
+    res = _mkresults(allassets, allmarkets, [None], nsims, controls,
+                     _isweighted(allmarkets), strata, greeks)
+    ctrlvalues = None if res.controls is None else res.controls.values[:, 0]
+    greekvalues = None if res.greeks is None else res.greeks.values[:, 0]
+    weights = None if res.weights is None else res.weights[0]
+    for comp in computations:
+        comp.startbatch(offset, strata)
+    def update(didx):
+        for comp in computations:
+            comp.update(didx, res.earnings.values[:, 0],
+                        res.volumes.values[:, 0], res.prices.values[:, 0],
+                        ctrlvalues, weights, greekvalues)
+    _simulatebatch(allassets, allmarkets, alldates, res, update, workspace)
+    for comp in computations:
+        comp.endbatch()
+
+def _setchunk(allassets, allmarkets, offset, nsims):
     """
-    allmarkets = set([m for asset in allassets for m in asset.getmarkets()])
+    Restreint les générateurs des marchés `allmarkets` aux simulations
+    d'indices `offset` à `offset + nsims - 1` et vide les caches.
+    """
+    for gen in dict.fromkeys(market.randomgen for market in allmarkets):
+        gen.setchunk(offset, nsims)
+    for obj in list(allmarkets) + list(allassets):
+        obj.cache.clear()
+
+def _resetcaches(allassets, allmarkets):
+    """
+    Vide les caches des marchés, des actifs et des générateurs (sans
+    changer le lot de simulations de ces derniers), afin qu'une simulation
+    ne dépende pas des précédentes.
+    """
+    for gen in dict.fromkeys(market.randomgen for market in allmarkets):
+        gen.setchunk(gen.start, gen.nsims)
+    for obj in list(allmarkets) + list(allassets):
+        obj.cache.clear()
+
+def _simulatebatch(allassets, allmarkets, alldates, res, update=None,
+                   workspace=None):
+    """
+    Simule les marchés et les actifs à chacune des dates de `alldates` et
+    enregistre les résultats dans `res`. Si `update` est renseigné, les
+    résultats de chaque date sont écrits dans le premier emplacement de
+    `res`, puis `update(didx)` est appelée.
+
+    Pendant la simulation, les marchés et les actifs écrivent leurs
+    résultats dans les tampons de l'espace de travail `workspace` (un
+    nouvel espace par défaut, cf. `Workspace`), qui sont réutilisés d'une
+    date à l'autre.
+
+    Seuls les marchés et les actifs concernés par une date y sont simulés
+    (cf. `Schedule`) : les cash-flows et volumes des autres actifs sont
+    nuls, et les prix des marchés qui n'avancent pas valent `NaN`.
+    """
+    earnings, volumes, prices = res
+    rows, expidx = _getrows(allassets, res)
+    ctrlidx = dict(_getcontrolslices(allassets, res))
+    greekidx = dict(_getgreekslices(allassets, res))
+    schedule = Schedule(allassets, allmarkets, alldates)
+    if workspace is None:
+        workspace = Workspace()
+    # Les caches de l'éventuelle simulation précédente des mêmes marchés et
+    # actifs (dates déjà simulées, rangs des dates des générateurs) sont
+    # vidés.
+    _resetcaches(allassets, allmarkets)
+    objects = list(allmarkets) + list(allassets)
+    for obj in objects:
+        obj.workspace = workspace
+    try:
+        for didx, (date, (marketidx, idleidx, assetidx)) in enumerate(
+                zip(alldates, schedule)):
+            slot = didx if update is None else 0
+            workspace.startdate()
+            # Mise à jour des marchés :
+            for midx in marketidx:
+                allmarkets[midx].simulate(date)
+            # Mise à jour des objets :
+            daterows = [_getdaterows(allassets[aidx], rows[aidx],
+                                     expidx[aidx], date)
+                        for aidx in assetidx]
+            for aidx, (arows, erows) in zip(assetidx, daterows):
+                asset = allassets[aidx]
+                earnings.values[arows, slot] = asset.get_discounted_cf(date)
+                for market, eidx in zip(asset.getmarkets(), erows):
+                    volumes.values[eidx, slot] = asset.getvolume(date,
+                                                                 market)
+                if asset in ctrlidx:
+                    res.controls.values[ctrlidx[asset], slot] = \
+                        asset.getcontrols(date)
+                if asset in greekidx:
+                    res.greeks.values[greekidx[asset], slot] = \
+                        asset.getgreeks(date)
+            for midx in marketidx:
+                #FIXME: on peut avoir besoin d'autre chose que du spot.
+                prices.values[midx, slot] = allmarkets[midx].getspot(date)
+            for midx in idleidx:
+                prices.values[midx, slot] = np.nan
+            if res.weights is not None:
+                # Rapport de vraisemblance des bruits tirés jusqu'à cette
+                # date.
+                res.weights[slot] = _getweights(allmarkets)
+            if update is not None:
+                update(didx)
+                # L'emplacement est réutilisé à la date suivante : les
+                # résultats des actifs évalués sont remis à zéro.
+                for aidx, (arows, erows) in zip(assetidx, daterows):
+                    asset = allassets[aidx]
+                    earnings.values[arows, slot] = 0.
+                    for eidx in erows:
+                        volumes.values[eidx, slot] = 0.
+                    if asset in ctrlidx:
+                        res.controls.values[ctrlidx[asset], slot] = 0.
+                    if asset in greekidx:
+                        res.greeks.values[greekidx[asset], slot] = 0.
+            workspace.enddate(date)
+    finally:
+        # Les tampons ne sont plus utilisés en dehors de la simulation, et le
+        # suivi de la mémoire éventuellement démarré est arrêté.
+        for obj in objects:
+            obj.workspace = None
+        workspace.close()
+
+def runrqmc(*allassets, nreplications=16, seed=None, **kwargs):
+    """
+    Quasi-Monte Carlo randomisé : simule `nreplications` fois les actifs de
+    `allassets`, en randomisant à chaque fois de façon indépendante les
+    suites quasi-aléatoires des générateurs (brouillage ou décalage
+    aléatoire, cf. `generators.randomize`).
+
+    Chaque réplication fournit une estimation sans biais ; `getmtm` et
+    `getdelta` appliqués au résultat en déduisent des intervalles de
+    confiance à partir de la variance entre réplications, seule mesure
+    d'erreur valable pour des points quasi-aléatoires.
+
+    Paramètres :
+    ------------
+    allassets
+        Actifs à simuler.
+    nreplications : entier supérieur ou égal à 2
+        Nombre de randomisations indépendantes.
+    seed : entier positif, optionnel
+        Graine des randomisations.
+    kwargs
+        Arguments supplémentaires transmis à `runmc` (`chunksize`,
+        `nprocs`...).
+    """
+    allmarkets, _ = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    allgens = list(dict.fromkeys(market.randomgen for market in allmarkets))
+    basefuncs = [gen.randomfunc for gen in allgens]
+    seeds = np.random.SeedSequence(seed).spawn(nreplications)
+    mtm, delta = [], []
+    try:
+        for repseed in seeds:
+            for gen, func in zip(allgens, basefuncs):
+                gen.randomfunc = generators.randomize(
+                    func, int(repseed.generate_state(1)[0]))
+            _setchunk(allassets, allmarkets, 0, nsims)
+            comps = runmc(*allassets, computations=[MtMComputation(),
+                                                    DeltaComputation()],
+                          **kwargs)
+            mtm.append(comps[0])
+            delta.append(comps[1])
+    finally:
+        for gen, func in zip(allgens, basefuncs):
+            gen.randomfunc = func
+    return Replications(mtm, delta)
+
+def rununtil(*allassets, abstol=None, reltol=None, alpha=0.95,
+             batchsize=16 * BLOCKSIZE, maxsims=None, maxtime=None,
+             blocksize=BLOCKSIZE, controls=False):
+    """
+    Simulation adaptative : simule les actifs de `allassets` par lots de
+    `batchsize` simulations, met à jour les intervalles de confiance de la
+    MtM de chaque actif après chaque lot, et s'arrête dès que la
+    demi-largeur de chacun d'eux est inférieure à la tolérance, ou que le
+    budget (nombre de simulations ou durée) est épuisé.
+
+    Comme `runmc` avec `chunksize`, renvoie les calculs
+    `[MtMComputation(), DeltaComputation()]`, à transmettre à `getmtm` et
+    `getdelta`. Avec des générateurs utilisant un `RandomStream`, les
+    simulations effectuées sont les premières de celles qu'effectuerait
+    `runmc`.
+
+    Paramètres :
+    ------------
+    allassets
+        Actifs à simuler.
+    abstol : double positif, optionnel
+        Tolérance absolue sur la demi-largeur des intervalles.
+    reltol : double positif, optionnel
+        Tolérance relative (à la valeur absolue de la MtM) sur la
+        demi-largeur des intervalles. Si `abstol` et `reltol` sont
+        renseignées, la plus large des deux est retenue.
+    alpha : double compris entre 0. et 1.
+        Quantile à utiliser pour le calcul des intervalles de confiance.
+    batchsize : entier positif
+        Nombre de simulations par lot, multiple de `blocksize`.
+    maxsims : entier positif, optionnel
+        Nombre maximal de simulations ; par défaut, le nombre de
+        simulations des générateurs.
+    maxtime : double positif, optionnel
+        Durée maximale (en secondes) ; le lot en cours est toujours
+        terminé.
+    blocksize : entier positif
+        Taille des blocs de simulations (cf. `runmc`).
+    controls : booléen
+        Si `True`, les MtM sont corrigées par les variables de contrôle des
+        actifs (cf. `runmc`).
+    """
+    if abstol is None and reltol is None:
+        raise ValueError("abstol or reltol should be given.")
+    if batchsize % blocksize != 0:
+        raise ValueError("the batch size should be a multiple of the block "\
+                         "size.")
+    allmarkets, alldates = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    if _getstrata(allmarkets) is not None:
+        raise ValueError("stratified generators cannot be stopped early.")
+    if maxsims is None:
+        maxsims = nsims
+    computations = [MtMComputation(), DeltaComputation()]
+    _startcomputations(computations, allassets, allmarkets, alldates,
+                       blocksize, controls)
+    starttime = time.perf_counter()
+    try:
+        for offset in range(0, maxsims, batchsize):
+            _runbatch(allassets, allmarkets, alldates, computations, offset,
+                      min(batchsize, maxsims - offset), reset=True,
+                      controls=controls)
+            if _isprecise(getmtm(computations[0], alpha), abstol, reltol):
+                break
+            if maxtime is not None \
+               and time.perf_counter() - starttime >= maxtime:
+                break
+    finally:
+        _setchunk(allassets, allmarkets, 0, nsims)
+    return computations
+
+def _isprecise(mtm, abstol, reltol):
+    """
+    Indique si la demi-largeur de chacun des intervalles de confiance de
+    `mtm` est inférieure à la tolérance absolue `abstol` ou relative
+    `reltol`.
+    """
+    for res in mtm.values():
+        tol = max(abstol or 0., (reltol or 0.) * abs(res.mean))
+        if not 0.5 * (res.icup - res.iclow) <= tol:
+            return False
+    return True
+
+def optimizedrift(*allassets, target=None, npilot=BLOCKSIZE, niter=4):
+    """
+    Échantillonnage préférentiel : choisit le décalage des bruits des
+    générateurs des marchés (cf. `GaussianGenerator.setdrift`) qui
+    concentre les trajectoires là où les cash-flows des actifs sont non
+    nuls, puis l'applique aux générateurs. Les rapports de vraisemblance
+    sont ensuite propagés par `runmc` jusqu'à `getmtm` et `getdelta`.
+
+    Le décalage est obtenu par entropie croisée : à chaque itération, une
+    simulation pilote de `npilot` trajectoires est effectuée avec le
+    décalage courant, et le nouveau décalage est la moyenne des bruits
+    tirés, pondérée par la valeur absolue des cash-flows et par les
+    rapports de vraisemblance. Les simulations pilotes utilisent les
+    simulations d'indices `nsims` à `nsims + npilot - 1`, distinctes de
+    celles de la simulation principale.
+
+    Paramètres :
+    ------------
+    allassets
+        Actifs à simuler.
+    target : optionnel
+        Identifiant de l'actif dont les cash-flows guident le choix du
+        décalage. Par défaut, la somme des cash-flows de tous les actifs.
+    npilot : entier positif
+        Nombre de trajectoires des simulations pilotes.
+    niter : entier positif
+        Nombre d'itérations de la méthode d'entropie croisée.
+    """
+    allmarkets, alldates = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    allgens = list(dict.fromkeys(market.randomgen for market in allmarkets))
+    names = [member for asset in allassets for member in _getmembers(asset)] \
+        if target is None else [target]
+    try:
+        for _ in range(niter):
+            for gen in allgens:
+                gen.recorded = {}
+            _setchunk(allassets, allmarkets, nsims, npilot)
+            res = _mkresults(allassets, allmarkets, alldates, npilot,
+                             weighted=True)
+            _simulatebatch(allassets, allmarkets, alldates, res)
+            earnings = res.earnings.values.sum(axis=1)
+            score = np.abs(sum(earnings[res.earnings.index('asset', name)]
+                               for name in names)) * _getweights(allmarkets)
+            if score.sum() <= 0.:
+                break
+            score /= score.sum()
+            for gen in allgens:
+                gen.setdrift({date: noises @ score
+                              for date, noises in gen.recorded.items()})
+    finally:
+        for gen in allgens:
+            gen.recorded = None
+        _setchunk(allassets, allmarkets, 0, nsims)
+    return {gen: gen.drift for gen in allgens}
+
+def optimizestrata(*allassets, target=None, nstrata=16, npilot=BLOCKSIZE,
+                   allocation='neyman', direction=None):
+    """
+    Stratification : remplace le flux de bruits du générateur des marchés
+    par un `generators.StratifiedStream`, qui stratifie les trajectoires
+    selon une direction de l'espace des bruits, avec une allocation des
+    simulations entre strates choisie à partir d'une simulation pilote.
+
+    Par défaut, la direction de stratification est la direction principale
+    du payoff, :math:`E[f(Z) Z]` (coefficients de la régression linéaire
+    du payoff sur les bruits), estimée sur la simulation pilote. Les
+    simulations pilotes utilisent les simulations d'indices `nsims` à
+    `nsims + npilot - 1`, distinctes de celles de la simulation principale.
+
+    Paramètres :
+    ------------
+    allassets
+        Actifs à simuler ; leurs marchés doivent partager un même
+        générateur, utilisant un `RandomStream`.
+    target : optionnel
+        Identifiant de l'actif dont les cash-flows guident la
+        stratification. Par défaut, la somme des cash-flows de tous les
+        actifs.
+    nstrata : entier positif
+        Nombre de strates (équiprobables).
+    npilot : entier positif
+        Nombre de trajectoires de la simulation pilote.
+    allocation : 'neyman' ou 'proportional'
+        Allocation des simulations : proportionnelle à la probabilité des
+        strates, ou optimale (proportionnelle à l'écart-type du payoff dans
+        chaque strate, estimé sur la simulation pilote).
+    direction : matrice, optionnelle
+        Direction de stratification, de taille `(ndates, nnoises)` (cf.
+        `generators.StratifiedStream`).
+    """
+    if allocation not in ('neyman', 'proportional'):
+        raise ValueError("allocation should be 'neyman' or 'proportional'.")
+    allmarkets, alldates = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    allgens = list(dict.fromkeys(market.randomgen for market in allmarkets))
+    if len(allgens) != 1:
+        raise ValueError("stratification requires a single generator.")
+    gen = allgens[0]
+    stream = gen.randomfunc
+    if isinstance(stream, generators.StratifiedStream):
+        stream = stream.stream
+    if not isinstance(stream, generators.RandomStream):
+        raise ValueError("stratification requires a generator based on a "\
+                         "RandomStream.")
+    names = [member for asset in allassets for member in _getmembers(asset)] \
+        if target is None else [target]
+    original, gen.randomfunc = gen.randomfunc, stream
+    try:
+        gen.recorded = {}
+        _setchunk(allassets, allmarkets, nsims, npilot)
+        res = _mkresults(allassets, allmarkets, alldates, npilot,
+                         weighted=True)
+        _simulatebatch(allassets, allmarkets, alldates, res)
+        earnings = _weighted(res.earnings).sum(axis=1)
+        payoff = sum(earnings[res.earnings.index('asset', name)]
+                     for name in names)
+        # Bruits de la simulation pilote, rangés par rang de date.
+        noises = np.zeros((len(gen.recorded), gen.nnoises, npilot))
+        for date, values in gen.recorded.items():
+            noises[gen.getstep(date)] = values
+        if direction is None:
+            direction = noises @ payoff / npilot
+        direction = np.asarray(direction, dtype=float)
+        direction /= np.sqrt(np.square(direction).sum())
+        scores = np.ones(nstrata)
+        if allocation == 'neyman':
+            projection = np.einsum('ij,ijk->k', direction,
+                                   noises[:len(direction)])
+            strata = np.minimum((sps.norm.cdf(projection) * nstrata).astype(
+                int), nstrata - 1)
+            scores = np.array([payoff[strata == idx].std()
+                               if np.any(strata == idx) else 0.
+                               for idx in range(nstrata)])
+        counts = generators.allocate(scores, nsims)
+        original = generators.StratifiedStream(stream, direction, counts)
+    finally:
+        gen.recorded = None
+        gen.randomfunc = original
+        _setchunk(allassets, allmarkets, 0, nsims)
+    return gen.randomfunc
+
+def runmcpaths(*allassets, controls=False):
+    """
+    Variante vectorisée de `runmc` : la grille complète des dates est
+    construite au préalable, chaque marché est simulé sur toute la grille en
+    une seule passe, puis les cash-flows des actifs de `allassets` sont
+    évalués sur les trajectoires obtenues, uniquement aux dates où ils
+    en génèrent. Si `controls` vaut `True`, les variables de contrôle des
+    actifs sont également évaluées (cf. `runmc`).
+    """
+    allmarkets, alldates = _getgrid(allassets)
+    paths = Paths(allmarkets, alldates)
+    res = _mkresults(allassets, allmarkets, alldates, _getnsims(allmarkets),
+                     controls, _isweighted(allmarkets), _getstrata(allmarkets))
+    if res.weights is not None:
+        res.weights[:] = _getweights(allmarkets)
+    earnings, volumes, prices = res
+    rows, expidx = _getrows(allassets, res)
+    ctrlidx = dict(_getcontrolslices(allassets, res))
+    for aidx, asset in enumerate(allassets):
+        for date in asset.getdates():
+            didx = earnings.index('date', date)
+            arows, erows = _getdaterows(asset, rows[aidx], expidx[aidx], date)
+            earnings.values[arows, didx] = asset.getpathcf(paths, date)
+            for market, eidx in zip(asset.getmarkets(), erows):
+                volumes.values[eidx, didx] = asset.getpathvolume(paths, date,
+                                                                 market)
+            if asset in ctrlidx:
+                res.controls.values[ctrlidx[asset], didx] = \
+                    asset.getpathcontrols(paths, date)
+    for midx, market in enumerate(allmarkets):
+        prices.values[midx] = paths.values[paths.rowindex[(market.name, 0)]]
+    return res
+
+def runscenarios(*allassets, scenarios):
+    """
+    Évalue les cash-flows actualisés des actifs de `allassets` dans chacun
+    des scénarios de chocs `scenarios` (cf. `Scenarios`), à la manière de
+    `runmcpaths` : les bruits ne sont tirés qu'une fois et toutes les
+    trajectoires choquées en sont déduites, les scénarios formant un axe
+    supplémentaire des trajectoires et des payoffs. Les écarts entre
+    scénarios sont ainsi estimés avec des aléas communs.
+
+    Renvoie un `LabeledArray` d'axes `('scenario', 'asset', 'date', 'sim')`
+    (cf. `getscenariomtm`).
+    """
+    allmarkets, alldates = _getgrid(allassets)
+    nsims = _getnsims(allmarkets)
+    paths = Paths(allmarkets, alldates, scenarios)
+    weights = None
+    if _isweighted(allmarkets):
+        weights = np.empty((len(alldates), nsims), dtype=getdtype())
+        weights[:] = _getweights(allmarkets)
+    members = [member for asset in allassets
+               for member in _getmembers(asset)]
+    earnings = LabeledArray(
+        np.zeros((len(scenarios), len(members), len(alldates), nsims),
+                 dtype=getdtype()),
+        ('scenario', 'asset', 'date', 'sim'),
+        {'scenario': scenarios.getlabels(), 'asset': members,
+         'date': alldates},
+        weights, _getstrata(allmarkets))
+    rows, _ = _getrows(allassets, earnings)
+    for asset, row in zip(allassets, rows):
+        for date in asset.getdates():
+            didx = earnings.index('date', date)
+            arows, _ = _getdaterows(asset, row, [], date)
+            cf = asset.getpathcf(paths, date)
+            if isinstance(arows, slice):
+                # Axe des options de la famille placé après celui des
+                # scénarios.
+                cf = np.moveaxis(cf, 0, 1)
+            earnings.values[:, arows, didx] = cf
+    return earnings
+
+def _getgrid(allassets):
+    """
+    Renvoie la liste des marchés auxquels sont exposés les actifs de
+    `allassets` et la grille triée des dates à simuler, qui est transmise
+    aux marchés (cf. `setgrid`).
+    """
+    allmarkets = list(dict.fromkeys(m for asset in allassets
+                                    for m in asset.getmarkets()))
     marketsdates = set([d for market in allmarkets for d in market.getdates()])
     assetsdates = set([d for asset in allassets for d in asset.getdates()])
-    earnings = {asset.name: {} for asset in allassets}
-    prices = {market.name: {} for market in allmarkets}
-    volumes = {asset.name: {m.name: {} for m in asset.getmarkets()} \
-               for asset in allassets}
-    alldates = assetsdates.union(marketsdates)
-    for date in alldates:
-        #FIXME: utiliser une notion de `computation` pour sauvegarder et
-        # aggréger les résultats au fur et à mesure.
-        # Mise à jour des marchés :
-        for market in allmarkets:
-            market.simulate(date)
-        # Mise à jour des objets :
+    alldates = sorted(assetsdates.union(marketsdates))
+    for market in allmarkets:
+        market.setgrid(alldates)
+    return allmarkets, alldates
+
+def _getnsims(allmarkets):
+    "Renvoie le nombre de simulations des générateurs des marchés."
+    nsims = set(market.randomgen.nsims for market in allmarkets)
+    if len(nsims) != 1:
+        raise ValueError("all markets should use the same number of "\
+                         "simulations.")
+    return nsims.pop()
+
+def _mkresults(allassets, allmarkets, alldates, nsims, controls=False,
+               weighted=False, strata=None, greeks=False, directory=None):
+    """
+    Préalloue l'objet `Results` dans lequel stocker une simulation (et, si
+    `controls` vaut `True`, les variables de contrôle des actifs ; si
+    `weighted` vaut `True`, les poids des simulations ; les indices des
+    strates `strata` ; si `greeks` vaut `True`, les dérivées des cash-flows
+    des actifs), sur le disque si `directory` est renseigné.
+    """
+    exposures = [(member, m.name) for asset in allassets
+                 for m in asset.getmarkets() for member in _getmembers(asset)]
+    controlmeans = None
+    if controls:
+        controlmeans = {}
         for asset in allassets:
-            earnings[asset.name][date] = asset.get_discounted_cf(date)
-            for market in asset.getmarkets():
-                volumes[asset.name][market.name][date] = asset.getvolume(date,
-                                                                         market)
-                #FIXME: on peut avoir besoin d'autre chose que du spot.
-                if date not in prices[market.name]:
-                    prices[market.name][date] = market.getspot(date)
-    earnings = pd.Panel(earnings).transpose(1, 0, 2)
-    #FIXME: utiliser xarray.
-    volumes = {key: pd.Panel(value).transpose(1, 0, 2)
-               for key, value in volumes.items()}
-    prices = pd.Panel(prices).transpose(1, 0, 2)
-    return earnings, volumes, prices
+            if hasattr(asset, 'getcontrolmeans'):
+                for rank, mean in enumerate(asset.getcontrolmeans()):
+                    controlmeans[(asset.name, rank)] = mean
+    greeklabels = None
+    if greeks:
+        greeklabels = [(asset.name,) + label for asset in allassets
+                       if hasattr(asset, 'getgreeklabels')
+                       for label in asset.getgreeklabels()]
+    # Les lots de `_runbatch` n'ont pas de grille de dates.
+    pricemeans = None if None in alldates \
+        else _getpricemeans(allassets, allmarkets, alldates)
+    return Results([member for asset in allassets
+                    for member in _getmembers(asset)], exposures,
+                   [market.name for market in allmarkets], alldates, nsims,
+                   controlmeans, weighted, strata, greeklabels, pricemeans,
+                   directory)
+
+def _getpricemeans(allassets, allmarkets, alldates):
+    """
+    Renvoie les espérances des prix des marchés `allmarkets` à chaque date
+    de `alldates` (cf. `getspotmean`), sous la forme d'un tableau de taille
+    `(nmarkets, ndates)` : `NaN` pour les marchés dont l'espérance n'est pas
+    connue, 0 aux dates où un marché n'est pas simulé (cf. `Schedule`).
+    """
+    res = np.zeros((len(allmarkets), len(alldates)))
+    schedule = Schedule(allassets, allmarkets, alldates)
+    for didx, (date, (marketidx, _, _)) in enumerate(zip(alldates,
+                                                         schedule)):
+        for midx in marketidx:
+            market = allmarkets[midx]
+            res[midx, didx] = market.getspotmean(date) \
+                if hasattr(market, 'getspotmean') else np.nan
+    return res
+
+def _getmembers(asset):
+    """
+    Renvoie les identifiants des lignes de résultats de l'actif `asset` :
+    ceux des options d'une famille (cf. `EuropeanStrip.getmembers`), le
+    nom de l'actif sinon.
+    """
+    if hasattr(asset, 'getmembers'):
+        return asset.getmembers()
+    return [asset.name]
+
+def _getrows(allassets, res):
+    """
+    Renvoie, pour chaque actif de `allassets`, sa position sur l'axe
+    `asset` des cash-flows `res` (`Results` ou `LabeledArray`), une tranche
+    pour une famille d'options, et la liste des positions de ses volumes
+    sur l'axe `exposure` de `res.volumes`, pour chacun de ses marchés.
+    """
+    earnings = res.earnings if isinstance(res, Results) else res
+    rows, expidx = [], []
+    for asset in allassets:
+        members = _getmembers(asset)
+        if hasattr(asset, 'getmembers'):
+            first = earnings.index('asset', members[0])
+            rows.append(slice(first, first + len(members)))
+        else:
+            rows.append(earnings.index('asset', asset.name))
+        if not isinstance(res, Results):
+            continue
+        slices = []
+        for market in asset.getmarkets():
+            first = res.volumes.index('exposure', (members[0], market.name))
+            slices.append(first if not hasattr(asset, 'getmembers')
+                          else slice(first, first + len(members)))
+        expidx.append(slices)
+    return rows, expidx
+
+def _getdaterows(asset, rows, expidx, date):
+    """
+    Renvoie les positions `(rows, expidx)` (cf. `_getrows`) des résultats
+    de l'actif `asset` à la date `date` : pour une famille d'options,
+    seules les lignes des options arrivant à maturité à cette date.
+    """
+    if not hasattr(asset, 'getslice'):
+        return rows, expidx
+    sub = asset.getslice(date)
+    return (slice(rows.start + sub.start, rows.start + sub.stop),
+            [slice(eidx.start + sub.start, eidx.start + sub.stop)
+             for eidx in expidx])
+
+def _isweighted(allmarkets):
+    """
+    Indique si les simulations de l'un des générateurs des marchés
+    `allmarkets` doivent être pondérées (échantillonnage préférentiel ou
+    stratification).
+    """
+    return any(market.randomgen.isweighted() for market in allmarkets)
+
+def _getstrata(allmarkets):
+    """
+    Renvoie les indices des strates des simulations du lot courant si l'un
+    des générateurs des marchés `allmarkets` est stratifié, `None` sinon.
+    """
+    allstrata = [gen.getstrata() for gen in
+                 dict.fromkeys(market.randomgen for market in allmarkets)]
+    allstrata = [strata for strata in allstrata if strata is not None]
+    if len(allstrata) > 1:
+        raise ValueError("only one stratified generator is supported.")
+    return allstrata[0] if allstrata else None
+
+def _getweights(allmarkets):
+    """
+    Renvoie le rapport de vraisemblance de l'ensemble des bruits tirés par
+    les générateurs des marchés `allmarkets`, pour chaque simulation.
+    """
+    allgens = dict.fromkeys(market.randomgen for market in allmarkets)
+    return np.exp(sum(gen.getlogweights() for gen in allgens))
+
+def _getcontrolslices(allassets, res):
+    """
+    Renvoie la liste des couples `(actif, tranche)` donnant, pour chaque
+    actif disposant de variables de contrôle, leurs positions dans
+    `res.controls`.
+    """
+    if res.controls is None:
+        return []
+    labels = res.controls.coords['control']
+    slices = []
+    for asset in allassets:
+        ranks = [idx for idx, (name, _) in enumerate(labels)
+                 if name == asset.name]
+        if ranks:
+            slices.append((asset, slice(ranks[0], ranks[-1] + 1)))
+    return slices
+
+def _getgreekslices(allassets, res):
+    """
+    Renvoie la liste des couples `(actif, tranche)` donnant, pour chaque
+    actif dont les grecques sont calculées, leurs positions dans
+    `res.greeks`.
+    """
+    if res.greeks is None:
+        return []
+    labels = res.greeks.coords['greek']
+    slices = []
+    for asset in allassets:
+        ranks = [idx for idx, label in enumerate(labels)
+                 if label[0] == asset.name]
+        if ranks:
+            slices.append((asset, slice(ranks[0], ranks[-1] + 1)))
+    return slices
+
+def getgreeks(res, alpha=0.95):
+    """
+    Calcule les grecques (avec intervalles de confiance) de chaque actif,
+    estimées sur les trajectoires de la simulation des cash-flows (cf.
+    l'argument `greeks` de `runmc`) : méthode trajectorielle pour le delta,
+    le vega et le rho, et rapport de vraisemblance pour le gamma.
+
+    Paramètres
+    ----------
+    res : Results ou GreeksComputation
+        Résultats complets de `runmc` ou statistiques suffisantes agrégées
+        pendant la simulation.
+    alpha : double compris entre 0. et 1.
+        Quantile à utiliser pour le calcul des intervalles de confiances.
+
+    Renvoie un dictionnaire indexé par des triplets
+    `(actif, marché, grecque)`.
+    """
+    if isinstance(res, GreeksComputation):
+        keys = res.greeks
+        nsims, mean, std = res.stats.count, res.stats.mean, res.stats.std
+    else:
+        if res.greeks is None:
+            raise ValueError("the greeks were not simulated.")
+        keys = res.greeks.coords['greek']
+        nsims = res.greeks.shape[2]
+        cumvalues = _weighted(res.greeks).sum(axis=1, dtype=np.float64)
+        mean = cumvalues.mean(axis=1)
+        std = cumvalues.std(axis=1, ddof=1)
+    return {key: mkmcresults(mean[idx], std[idx], nsims, alpha)
+            for idx, key in enumerate(keys)}
+
+def getscenariomtm(cf, alpha=0.95, base=None):
+    """
+    Calcule la MtM (avec intervalles de confiance) de chaque actif listé
+    dans `cf` pour chacun des scénarios.
+
+    Paramètres
+    ----------
+    cf : LabeledArray
+        Cash-flows réalisés par scénario (axe `scenario`), actif (axe
+        `asset`), date (axe `date`) et simulation (axe `sim`), tels que
+        renvoyés par `runscenarios`.
+    alpha : double compris entre 0. et 1.
+        Quantile à utiliser pour le calcul des intervalles de confiances.
+    base : optionnel
+        Identifiant `(spot, vol, rate)` d'un scénario de référence. Si
+        renseigné, ce sont les écarts de MtM par rapport à ce scénario qui
+        sont calculés, simulation par simulation, ce qui tire parti des
+        aléas communs.
+
+    Renvoie un dictionnaire indexé par les actifs, dont les valeurs sont
+    des séries indexées par les scénarios.
+    """
+    nscenarios, nassets, _, nsims = cf.shape
+    cumvalues = _weighted(cf).sum(axis=2, dtype=np.float64)
+    if base is not None:
+        cumvalues = cumvalues - cumvalues[cf.index('scenario', base)]
+    cumvalues = cumvalues.reshape(nscenarios * nassets, nsims)
+    mean = cumvalues.mean(axis=1).reshape(nscenarios, nassets)
+    if cf.strata is None:
+        std = cumvalues.std(axis=1, ddof=1)
+    else:
+        std = _getstratifiedstd(cumvalues, cf.strata)
+    std = std.reshape(nscenarios, nassets)
+    index = pd.MultiIndex.from_tuples(cf.coords['scenario'],
+                                      names=('spot', 'vol', 'rate'))
+    res = {}
+    for aidx, key in enumerate(cf.coords['asset']):
+        res[key] = mkmcresults(pd.Series(mean[:, aidx], index=index),
+                               pd.Series(std[:, aidx], index=index), nsims,
+                               alpha)
+    return res
 
 def getmtm(cf, alpha=0.95):
     """
     Calcule la MtM (i.e. : les cash-flows moyens réalisés et un intervalle
     de confiance) de chaque actif listé dans `cf`.
 
+    Lorsque des variables de contrôle ont été simulées (cf. `runmc`), la
+    MtM de chaque actif est corrigée par régression de ses cash-flows sur
+    ses variables de contrôle (coefficients optimaux estimés sur les mêmes
+    trajectoires), ce qui réduit d'autant la largeur de l'intervalle.
+
     Paramètres
     ----------
-    cf : pandas.Panel
-        Cash-flows réalisés pour chaque simulation (`items`), chaque
-        actif (`major_axis`) et chaque date (`minor_axis`).
+    cf : LabeledArray, Results, MtMComputation ou Replications
+        Cash-flows réalisés pour chaque actif (axe `asset`), chaque date
+        (axe `date`) et chaque simulation (axe `sim`), résultats complets
+        de `runmc` (avec les variables de contrôle éventuelles),
+        statistiques suffisantes agrégées pendant la simulation, ou
+        réplications indépendantes (l'intervalle de confiance est alors
+        déduit de la variance entre réplications).
     alpha : double compris entre 0. et 1.
         Quantile à utiliser pour le calcul des intervalles de confiances.
     """
-    nsims = cf.shape[0]
-    cumvalues = cf.sum(axis=2)
-    mean = cumvalues.mean(axis=1)
-    std = cumvalues.std(axis=1)
+    if isinstance(cf, Replications):
+        keys = cf.mtm[0].assets
+        estimates = np.array([_getmtmmoments(comp)[1] for comp in cf.mtm])
+        res = {}
+        for idx, key in enumerate(keys):
+            res[key] = mkmcresults(estimates[:, idx].mean(),
+                                   estimates[:, idx].std(ddof=1),
+                                   cf.nreplications, alpha,
+                                   dof=cf.nreplications - 1)
+        return res
+    if isinstance(cf, MtMComputation):
+        keys = cf.assets
+        nsims, mean, std = _getmtmmoments(cf)
+    elif isinstance(cf, Results) and cf.controls is not None:
+        keys = cf.earnings.coords['asset']
+        nsims = cf.earnings.shape[2]
+        cumvalues = np.concatenate(
+            (_weighted(cf.earnings).sum(axis=1, dtype=np.float64),
+             _weighted(cf.controls).sum(axis=1, dtype=np.float64)))
+        mean, std = _applycontrols(
+            keys, cumvalues.mean(axis=1), np.atleast_2d(np.cov(cumvalues)),
+            cf.controls.coords['control'],
+            np.array(list(cf.controlmeans.values())))
+    else:
+        if isinstance(cf, Results):
+            cf = cf.earnings
+        keys = cf.coords['asset']
+        nsims = cf.shape[2]
+        # Accumulation en double précision, quel que soit le type des
+        # résultats (cf. `setdtype`).
+        cumvalues = _weighted(cf).sum(axis=1, dtype=np.float64)
+        mean = cumvalues.mean(axis=1)
+        if cf.strata is None:
+            std = cumvalues.std(axis=1, ddof=1)
+        else:
+            std = _getstratifiedstd(cumvalues, cf.strata)
     res = {}
-    for key, val in mean.items():
-        res[key] = mkmcresults(val, std[key], nsims)
+    for idx, key in enumerate(keys):
+        res[key] = mkmcresults(mean[idx], std[idx], nsims, alpha)
     return res
 
-def getdelta(volumes, prices, alpha=0.95):
+def _weighted(values):
+    """
+    Renvoie les réalisations du `LabeledArray` `values`, pondérées par les
+    rapports de vraisemblance éventuels.
+    """
+    if values.weights is None:
+        return values.values
+    return values.values * values.weights
+
+def _getmtmmoments(comp):
+    """
+    Renvoie le nombre de simulations, la moyenne et l'écart-type des
+    cash-flows de chaque actif d'un `MtMComputation`, corrigés par les
+    variables de contrôle éventuelles.
+    """
+    if not comp.controls:
+        if comp.stratastats:
+            allstats = list(comp.stratastats.values())
+            std = _poolstd(np.array([stats.count for stats in allstats]),
+                           np.array([stats.m2 for stats in allstats]).T)
+            return comp.stats.count, comp.stats.mean, std
+        return comp.stats.count, comp.stats.mean, comp.stats.std
+    mean, std = _applycontrols(comp.assets, comp.stats.mean, comp.stats.cov,
+                               comp.controls, comp.controlmeans)
+    return comp.stats.count, mean, std
+
+def _getstratifiedstd(values, strata):
+    """
+    Renvoie l'écart-type à transmettre à `mkmcresults` pour les réalisations
+    `values` (tableau de taille `(nrows, nsims)`) de simulations
+    stratifiées, d'indices de strates `strata`.
+    """
+    counts = np.bincount(strata)
+    m2 = np.empty((len(values), len(counts)))
+    for row, rowvalues in enumerate(values):
+        means = np.bincount(strata, rowvalues) / np.maximum(counts, 1)
+        m2[row] = np.bincount(strata, np.square(rowvalues - means[strata]),
+                              minlength=len(counts))
+    return _poolstd(counts, m2)
+
+def _poolstd(counts, m2):
+    r"""
+    Renvoie la racine de la moyenne des variances intra-strates, pondérée
+    par les effectifs `counts` des strates, à partir des sommes des carrés
+    des écarts `m2` (tableau de taille `(nrows, nstrata)`).
+
+    Les simulations étant pondérées par la probabilité de leur strate
+    rapportée à son effectif, la variance de l'estimateur stratifié
+    :math:`\sum_j p_j^2 s_j^2 / n_j` vaut la variance ainsi obtenue divisée
+    par le nombre total de simulations, comme pour un tirage classique.
+    """
+    valid = counts > 1
+    variance = (m2[:, valid] * (counts[valid] / (counts[valid] - 1.))).sum(
+        axis=1) / counts.sum()
+    return np.sqrt(variance)
+
+def _applycontrols(keys, mean, cov, controls, controlmeans):
+    """
+    Renvoie la moyenne et l'écart-type des cash-flows de chaque actif de
+    `keys`, corrigés par ses variables de contrôle.
+
+    Paramètres :
+    ------------
+    keys
+        Identifiants des actifs.
+    mean : numpy.ndarray
+        Moyennes empiriques des cash-flows des actifs, suivies de celles
+        des variables de contrôle.
+    cov : numpy.ndarray
+        Matrice de covariance empirique correspondante.
+    controls
+        Couples `(actif, rang)` identifiant les variables de contrôle.
+    controlmeans : numpy.ndarray
+        Espérances des variables de contrôle.
+    """
+    nassets = len(keys)
+    adjmean = mean[:nassets].copy()
+    variance = np.diagonal(cov)[:nassets].copy()
+    for aidx, key in enumerate(keys):
+        cidx = [nassets + idx for idx, (name, _) in enumerate(controls)
+                if name == key]
+        if not cidx:
+            continue
+        # Coefficients optimaux : Cov(C, C)^-1 Cov(C, Y).
+        beta = np.linalg.lstsq(cov[np.ix_(cidx, cidx)], cov[cidx, aidx],
+                               rcond=None)[0]
+        adjmean[aidx] -= beta @ (mean[cidx] - controlmeans[
+            np.array(cidx) - nassets])
+        variance[aidx] -= cov[aidx, cidx] @ beta
+    return adjmean, np.sqrt(np.maximum(variance, 0.))
+
+def getdelta(volumes, prices=None, alpha=0.95):
     """
     Calcule les deltas (avec intervalles de confiance) de chaque actif
-    listé dans `cf`.
+    listé dans `volumes`.
 
     Paramètres
     ----------
-    cf : pandas.Panel
-        Cash-flows réalisés pour chaque simulation (`items`), chaque
-        actif (`major_axis`) et chaque date (`minor_axis`).
-    volumes : dictionnaire de pandas.Panel
-        Volumes exercés pour chaque actif (clef du dictionnaire), chaque
-        simulation (`items`), chaque marché (`major_axis`) et chaque
-        date (`minor_axis`).
-    prices : pandas.Panel
-        Prix réalisés pour chaque simulation (`items`), chaque marché
-        (`major_axis`) et chaque date (`minor_axis`).
+    volumes : LabeledArray, DeltaComputation ou Replications
+        Volumes exercés pour chaque couple `(actif, marché)` (axe
+        `exposure`), chaque date (axe `date`) et chaque simulation
+        (axe `sim`), statistiques suffisantes agrégées pendant la
+        simulation ou réplications indépendantes (auquel cas `prices`
+        n'est pas utilisé).
+    prices : LabeledArray
+        Prix réalisés pour chaque marché (axe `market`), chaque date
+        (axe `date`) et chaque simulation (axe `sim`).
     alpha : double compris entre 0. et 1.
         Quantile à utiliser pour le calcul des intervalles de confiances.
     """
-    nsims = prices.shape[0]
+    if isinstance(volumes, Replications):
+        return _getdeltafromreplications(volumes, alpha)
+    if isinstance(volumes, DeltaComputation):
+        return _getdeltafromstats(volumes, alpha)
+    nsims = prices.shape[2]
+    dates = prices.coords['date']
+    res = {}
+    for asset, market in volumes.coords['exposure']:
+        #FIXME: laisser le choix du niveau d'agrégation du delta.
+        # Les prix valent `NaN` aux dates où le marché n'est pas simulé.
+        price = np.nan_to_num(prices.sel(market=market))
+        if prices.weights is not None:
+            price = price * prices.weights
+        initfwd = _getforwards(
+            price.mean(axis=1, dtype=np.float64).sum(),
+            None if prices.means is None
+            else prices.means[prices.index('market', market)])
+        delta = volumes.sel(exposure=(asset, market)) * price
+        delta /= initfwd
+        res[(asset, market)] = mkmcresults(
+            pd.Series(delta.mean(axis=1, dtype=np.float64), index=dates),
+            pd.Series(delta.std(axis=1, ddof=1, dtype=np.float64),
+                      index=dates), nsims, alpha)
+    return res
+
+def _getdeltafromstats(comp, alpha):
+    "Calcule les deltas à partir des statistiques d'un `DeltaComputation`."
+    nsims, mean, std = _getdeltamoments(comp)
     res = {}
-    for asset, volume in volumes.items():
-        for market in volume.major_axis:
-            #FIXME: laisser le choix du niveau d'agrégation du delta.
-            price = prices.loc[:, market, :]
-            initfwd = price.mean(axis=1)
-            tmp = (volume.loc[:, market, :] * price).T / initfwd
-            delta = (tmp * initfwd) / initfwd.sum()
-            res[(asset, market)] = mkmcresults(delta.mean(), delta.std(), nsims)
+    for eidx, key in enumerate(comp.exposures):
+        res[key] = mkmcresults(pd.Series(mean[:, eidx], index=comp.dates),
+                               pd.Series(std[:, eidx], index=comp.dates),
+                               nsims, alpha)
     return res
 
-def mkmcresults(mean, std, nsims, alpha=0.95):
+def _getdeltafromreplications(reps, alpha):
+    "Calcule les deltas à partir de réplications indépendantes."
+    estimates = np.array([_getdeltamoments(comp)[1] for comp in reps.delta])
+    mean, std = estimates.mean(axis=0), estimates.std(axis=0, ddof=1)
+    comp = reps.delta[0]
+    res = {}
+    for eidx, key in enumerate(comp.exposures):
+        res[key] = mkmcresults(pd.Series(mean[:, eidx], index=comp.dates),
+                               pd.Series(std[:, eidx], index=comp.dates),
+                               reps.nreplications, alpha,
+                               dof=reps.nreplications - 1)
+    return res
+
+def _getdeltamoments(comp):
+    """
+    Renvoie le nombre de simulations, la moyenne et l'écart-type des deltas
+    (tableaux de taille `(ndates, nexposures)`) d'un `DeltaComputation`.
+    """
+    initfwd = _getforwards(
+        np.array([stats.mean for stats in comp.prices]).sum(axis=0),
+        comp.pricemeans)
+    norm = initfwd[comp.marketidx]
+    mean = np.array([stats.mean for stats in comp.products]) / norm
+    std = np.array([stats.std for stats in comp.products]) / norm
+    return comp.prices[0].count, mean, std
+
+def _getforwards(estimated, means):
+    """
+    Renvoie les forwards (sommes sur les dates des prix moyens) qui
+    normalisent les deltas : leurs valeurs exactes, déduites des espérances
+    des prix `means` (cf. `_getpricemeans`) lorsqu'elles sont connues, leurs
+    estimations `estimated` sinon. Sous échantillonnage préférentiel,
+    l'estimation pondérée du forward est très bruitée, et le rapport qui en
+    résulte biaisé.
+    """
+    if means is None:
+        return estimated
+    known = np.sum(means, axis=-1)
+    return np.where(np.isnan(known), estimated, known)
+
+def mkmcresults(mean, std, nsims, alpha=0.95, dof=None):
     """
     Crée un objet `MCResults` contenant `mean` et l'intervalle de
-    confiance associé.
+    confiance associé. Si `dof` est renseigné, l'intervalle est construit
+    à partir des quantiles de la loi de Student à `dof` degrés de liberté
+    (typiquement pour un faible nombre de réplications indépendantes).
     """
-    coeff = sps.norm.ppf(0.5 + 0.5 * alpha)
+    if dof is None:
+        coeff = sps.norm.ppf(0.5 + 0.5 * alpha)
+    else:
+        coeff = sps.t.ppf(0.5 + 0.5 * alpha, dof)
     low = mean - coeff * std / np.sqrt(nsims)
     up = mean + coeff * std / np.sqrt(nsims)
     return MCResults(mean, low, up)
@@ -0,0 +1,84 @@
+"Formules fermées du modèle de Black-Scholes."
+
+import numpy as np
+from scipy.special import ndtr
+
+def blackscholes_call(spot, strike, rate, sigma, maturity):
+    """
+    Renvoie le prix en 0 du call européen de payoff :math:`(S_T - K)^+`
+    dans le modèle de Black-Scholes.
+
+    Paramètres :
+    ------------
+    spot : double
+        Prix spot initial (:math:`S_0`).
+    strike : double
+        Strike de l'option (:math:`K`).
+    rate : double
+        Taux sans risque.
+    sigma : double
+        Volatilité du sous-jacent.
+    maturity : double
+        Maturité de l'option (:math:`T`).
+    """
+    df = np.exp(-rate * maturity)
+    return lognormal_call(np.log(spot) + (rate - 0.5 * sigma**2) * maturity,
+                          sigma**2 * maturity, strike, df)
+
+def margrabe(spot1, spot2, sigma1, sigma2, rho, maturity):
+    """
+    Renvoie le prix en 0 de l'option d'échange de payoff
+    :math:`(S^1_T - S^2_T)^+` lorsque les deux sous-jacents suivent des
+    modèles de Black-Scholes de même taux, de volatilités `sigma1` et
+    `sigma2` et de corrélation `rho` (formule de Margrabe).
+    """
+    sigma = np.sqrt(sigma1**2 + sigma2**2 - 2. * rho * sigma1 * sigma2)
+    stddev = sigma * np.sqrt(maturity)
+    if stddev == 0.:
+        return max(spot1 - spot2, 0.)
+    d1 = np.log(spot1 / spot2) / stddev + 0.5 * stddev
+    return spot1 * ndtr(d1) - spot2 * ndtr(d1 - stddev)
+
+def geometric_basket_call(spots, weights, strike, rate, sigmas, corrmatrix,
+                          maturity):
+    r"""
+    Renvoie le prix en 0 du call européen de payoff
+    :math:`(\prod_i (S^i_T)^{w_i} - K)^+` portant sur la moyenne géométrique
+    pondérée de sous-jacents suivant des modèles de Black-Scholes corrélés :
+    le logarithme de cette moyenne est gaussien.
+
+    Paramètres :
+    ------------
+    spots : vecteur
+        Prix spot initiaux (:math:`S^i_0`).
+    weights : vecteur
+        Poids des sous-jacents (:math:`w_i`).
+    strike : double
+        Strike de l'option (:math:`K`).
+    rate : double
+        Taux sans risque.
+    sigmas : vecteur
+        Volatilités des sous-jacents.
+    corrmatrix : matrice carrée
+        Matrice de corrélation des sous-jacents.
+    maturity : double
+        Maturité de l'option (:math:`T`).
+    """
+    spots, weights = np.asarray(spots, float), np.asarray(weights, float)
+    sigmas = np.asarray(sigmas, float)
+    logmean = weights @ (np.log(spots) + (rate - 0.5 * sigmas**2) * maturity)
+    weighted = weights * sigmas
+    logvar = weighted @ np.asarray(corrmatrix, float) @ weighted * maturity
+    return lognormal_call(logmean, logvar, strike, np.exp(-rate * maturity))
+
+def lognormal_call(logmean, logvar, strike, df=1.):
+    r"""
+    Renvoie :math:`df \cdot E[(X - K)^+]` lorsque :math:`\ln X` est gaussien
+    de moyenne `logmean` et de variance `logvar`.
+    """
+    mean = np.exp(logmean + 0.5 * logvar)
+    if logvar <= 0.:
+        return df * max(mean - strike, 0.)
+    stddev = np.sqrt(logvar)
+    d2 = (logmean - np.log(strike)) / stddev
+    return df * (mean * ndtr(d2 + stddev) - strike * ndtr(d2))
@@ -1,5 +1,9 @@
 import numpy as np
-from efficientmc.utils import timecached, DateCache
+from efficientmc.utils import timecached, DateCache, getbuffer
+from efficientmc.analytic import geometric_basket_call
+from efficientmc.pricemodels import getscores
+
+GREEKS = ('delta', 'gamma', 'vega', 'rho')
 
 class EuropeanCall:
     "Call européen : option de payoff :math:`(S_T - K)^+`."
@@ -26,6 +30,7 @@ class EuropeanCall:
         self.strike = strike
         self.maturity = maturity
         self.cache = DateCache()
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
 
     def getdates(self):
         """
@@ -45,7 +50,9 @@ class EuropeanCall:
             #FIXME: l'option peut aussi porter sur un forward, introduire
             # plutôt la notion de produit.
             prices = self.market.getspot(date)
-            return np.maximum(prices - self.strike, 0.)
+            cf = getbuffer(self, 'getcf', prices.shape, prices.dtype)
+            np.subtract(prices, self.strike, out=cf)
+            return np.maximum(cf, 0., out=cf)
         else:
             return 0.
 
@@ -56,7 +63,7 @@ class EuropeanCall:
         date `date`.
         """
         if date == self.maturity:
-           return self.market.getdf(date) * self.getcf(date)
+           return _discount(self, self.market.getdf(date), self.getcf(date))
         else:
             return 0.
 
@@ -69,7 +76,92 @@ class EuropeanCall:
         if market == self.market and date == self.maturity:
             #FIXME: même remarque que pour `getcf`.
             prices = self.market.getspot(date)
-            return np.where(prices > self.strike, 1., 0.)
+            return np.greater(prices, self.strike,
+                              out=getbuffer(self, 'getvolume', prices.shape,
+                                            prices.dtype))
+        else:
+            return 0.
+
+    def getpathcf(self, paths, date):
+        """
+        Renvoie les cash-flows actualisés générés par l'option à la date
+        `date`, évalués sur les trajectoires `paths`.
+        """
+        if date == self.maturity:
+            prices = paths.getspot(self.market, date)
+            return paths.getdf(self.market, date) \
+                * np.maximum(prices - self.strike, 0.)
+        else:
+            return 0.
+
+    def getpathvolume(self, paths, date, market):
+        """
+        Renvoie les volumes exercés au titre de l'option sur le marché
+        `market` à la date `date`, évalués sur les trajectoires `paths`.
+        """
+        if market == self.market and date == self.maturity:
+            prices = paths.getspot(self.market, date)
+            return np.where(prices > self.strike, prices.dtype.type(1.), 0.)
+        else:
+            return 0.
+
+    def getcontrolmeans(self):
+        """
+        Renvoie les espérances des variables de contrôle de l'option (cf.
+        `getcontrols`) : le sous-jacent actualisé, d'espérance :math:`S_0`.
+        """
+        return np.array([self.market.initvalue])
+
+    @timecached
+    def getcontrols(self, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        sous la forme d'un tableau de taille `(ncontrols, nsims)` : le prix
+        spot actualisé à maturité.
+        """
+        if date == self.maturity:
+            prices = self.market.getspot(date)
+            return (self.market.getdf(date) * prices)[np.newaxis]
+        else:
+            return 0.
+
+    def getpathcontrols(self, paths, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        évaluées sur les trajectoires `paths`.
+        """
+        if date == self.maturity:
+            prices = paths.getspot(self.market, date)
+            return (paths.getdf(self.market, date) * prices)[np.newaxis]
+        else:
+            return 0.
+
+    def getgreeklabels(self):
+        """
+        Renvoie les identifiants `(marché, grecque)` des sensibilités
+        calculées par `getgreeks`.
+        """
+        return [(self.market.name, greek) for greek in GREEKS]
+
+    @timecached
+    def getgreeks(self, date):
+        """
+        Renvoie les dérivées des cash-flows actualisés générés par l'option
+        à la date `date` par rapport aux paramètres du marché (cf.
+        `getgreeklabels`), sous la forme d'un tableau de taille
+        `(ngreeks, nsims)` dont la moyenne estimera les grecques :
+        dérivées trajectorielles pour le delta, le vega et le rho, et
+        estimateur mixte (rapport de vraisemblance appliqué au delta
+        trajectoriel, discontinu) pour le gamma.
+        """
+        if date == self.maturity:
+            df = self.market.getdf(date)
+            greeks = _pathwisegreeks(self.market, date, df,
+                                     self.getvolume(date, self.market),
+                                     getscores([self.market], date)[0])
+            greeks[3] += self.market.getdfderivative(date, 'rho') \
+                * self.getcf(date)
+            return np.stack(greeks)
         else:
             return 0.
 
@@ -99,6 +191,7 @@ class EuropeanSpread:
         self.market2 = market2
         self.maturity = maturity
         self.cache = DateCache()
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
 
     def getdates(self):
         """
@@ -121,7 +214,9 @@ class EuropeanSpread:
             # monnaie.
             prices1 = self.market1.getspot(date)
             prices2 = self.market2.getspot(date)
-            return np.maximum(prices1 - prices2, 0.)
+            cf = getbuffer(self, 'getcf', prices1.shape, prices1.dtype)
+            np.subtract(prices1, prices2, out=cf)
+            return np.maximum(cf, 0., out=cf)
         else:
             return 0.
 
@@ -134,7 +229,7 @@ class EuropeanSpread:
         if date == self.maturity:
             # Par convention, les cash-flows sont exprimés dans la devise
             # de `self.market1`.
-           return self.market1.getdf(date) * self.getcf(date)
+           return _discount(self, self.market1.getdf(date), self.getcf(date))
         else:
             return 0.
 
@@ -148,10 +243,102 @@ class EuropeanSpread:
             #FIXME: même remarque que pour `getcf`.
             prices1 = self.market1.getspot(date)
             prices2 = self.market2.getspot(date)
+            volume = np.greater(prices1, prices2, out=getbuffer(
+                self, ('getvolume', market.name), prices1.shape,
+                prices1.dtype))
             if market == self.market1:
-                return np.where(prices1 > prices2, 1., 0.)
+                return volume
             elif market == self.market2:
-                return np.where(prices1 > prices2, -1., 0.)
+                return np.negative(volume, out=volume)
+        else:
+            return 0.
+
+    def getpathcf(self, paths, date):
+        """
+        Renvoie les cash-flows actualisés générés par l'option à la date
+        `date`, évalués sur les trajectoires `paths`.
+        """
+        if date == self.maturity:
+            prices1 = paths.getspot(self.market1, date)
+            prices2 = paths.getspot(self.market2, date)
+            return paths.getdf(self.market1, date) \
+                * np.maximum(prices1 - prices2, 0.)
+        else:
+            return 0.
+
+    def getpathvolume(self, paths, date, market):
+        """
+        Renvoie les volumes exercés au titre de l'option sur le marché
+        `market` à la date `date`, évalués sur les trajectoires `paths`.
+        """
+        if date == self.maturity and market in self.getmarkets():
+            prices1 = paths.getspot(self.market1, date)
+            prices2 = paths.getspot(self.market2, date)
+            if market == self.market1:
+                return np.where(prices1 > prices2, prices1.dtype.type(1.), 0.)
+            elif market == self.market2:
+                return np.where(prices1 > prices2, prices1.dtype.type(-1.), 0.)
+        else:
+            return 0.
+
+    def getcontrolmeans(self):
+        """
+        Renvoie les espérances des variables de contrôle de l'option (cf.
+        `getcontrols`) : les sous-jacents actualisés, d'espérances
+        :math:`S^1_0` et :math:`S^2_0`.
+        """
+        return np.array([self.market1.initvalue, self.market2.initvalue])
+
+    @timecached
+    def getcontrols(self, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        sous la forme d'un tableau de taille `(ncontrols, nsims)` : les prix
+        spot des deux marchés à maturité, chacun actualisé dans sa devise.
+        """
+        if date == self.maturity:
+            return np.stack([market.getdf(date) * market.getspot(date)
+                             for market in (self.market1, self.market2)])
+        else:
+            return 0.
+
+    def getpathcontrols(self, paths, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        évaluées sur les trajectoires `paths`.
+        """
+        if date == self.maturity:
+            return np.stack([paths.getdf(market, date) \
+                             * paths.getspot(market, date)
+                             for market in (self.market1, self.market2)])
+        else:
+            return 0.
+
+    def getgreeklabels(self):
+        """
+        Renvoie les identifiants `(marché, grecque)` des sensibilités
+        calculées par `getgreeks`.
+        """
+        return [(market.name, greek) for market in self.getmarkets()
+                for greek in GREEKS]
+
+    @timecached
+    def getgreeks(self, date):
+        """
+        Renvoie les dérivées des cash-flows actualisés générés par l'option
+        à la date `date` par rapport aux paramètres de chacun des marchés
+        (cf. `EuropeanCall.getgreeks`).
+        """
+        if date == self.maturity:
+            df = self.market1.getdf(date)
+            scores = getscores(self.getmarkets(), date)
+            greeks = []
+            for market, score in zip(self.getmarkets(), scores):
+                greeks += _pathwisegreeks(market, date, df,
+                                          self.getvolume(date, market), score)
+            greeks[3] += self.market1.getdfderivative(date, 'rho') \
+                * self.getcf(date)
+            return np.stack(greeks)
         else:
             return 0.
 
@@ -188,7 +375,11 @@ class BasketOption:
         self.numbersA=numbersA
         self.maturity = maturity
         self.strike = strike
+        # Poids normalisés une fois pour toutes.
+        numbersA = np.asarray(numbersA, dtype=float)
+        self.weights = numbersA / np.sum(numbersA)
         self.cache = DateCache()
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
     
     def getdates(self):
         """
@@ -201,21 +392,20 @@ class BasketOption:
         return [self.markets]
     
     def getweight(self,index):
-        compt=0
-        totalweight=0
-        weight=np.empty((len(self.numbersA)))
-        for i in range(0,len(self.numbersA),1):
-            totalweight+=self.numbersA[i]
-     
-        for i in range(0,len(self.numbersA)-1,1):
-            weight[i]=self.numbersA[i]/totalweight
-        return weight[index]
+        "Renvoie le poids normalisé du sous-jacent i=index dans le panier."
+        return self.weights[index]
     
+    @timecached
     def getsum(self,date):
-        prices=0
-        for i in range(0,len(self.numbersA),1):
-            prices+= self.markets.getspot(date,i)*self.getweight(i)
-        return prices
+        """
+        Renvoie la valeur du panier à la date `date`, calculée comme un
+        unique produit matrice-vecteur entre les poids et les prix de tous
+        les sous-jacents.
+        """
+        spots = self.markets.getspots(date)
+        return np.dot(self.weights.astype(spots.dtype), spots,
+                      out=getbuffer(self, 'getsum', spots.shape[1:],
+                                    spots.dtype))
     
     @timecached
     def getcf(self,date):
@@ -224,7 +414,10 @@ class BasketOption:
             #FIXME: l'option peut aussi porter sur un forward, introduire
             # plutôt la notion de produit.
             if self.typeO=="call":
-                return np.maximum(self.getsum(date) - self.strike, 0.)
+                prices = self.getsum(date)
+                cf = getbuffer(self, 'getcf', prices.shape, prices.dtype)
+                np.subtract(prices, self.strike, out=cf)
+                return np.maximum(cf, 0., out=cf)
         else:
             return 0
         
@@ -235,7 +428,7 @@ class BasketOption:
         date `date`.
         """
         if date == self.maturity:
-           return self.markets.getdf(date) * self.getcf(date)
+           return _discount(self, self.markets.getdf(date), self.getcf(date))
         else:
             return 0.
 
@@ -248,9 +441,332 @@ class BasketOption:
         if market == self.markets and date == self.maturity:
             #FIXME: même remarque que pour `getcf`.
             prices = self.getsum(date)
-            return np.where(prices > self.strike, 1., 0.)
+            return np.greater(prices, self.strike,
+                              out=getbuffer(self, 'getvolume', prices.shape,
+                                            prices.dtype))
+        else:
+            return 0.
+
+    def getpathsum(self, paths, date):
+        "Renvoie la valeur du panier à la date `date` sur les trajectoires `paths`."
+        spots = paths.getspots(self.markets, date)
+        return np.tensordot(self.weights.astype(spots.dtype), spots, axes=1)
+
+    def getpathcf(self, paths, date):
+        """
+        Renvoie les cash-flows actualisés générés par l'option à la date
+        `date`, évalués sur les trajectoires `paths`.
+        """
+        if date == self.maturity:
+            if self.typeO=="call":
+                return paths.getdf(self.markets, date) \
+                    * np.maximum(self.getpathsum(paths, date) - self.strike, 0.)
+        else:
+            return 0.
+
+    def getpathvolume(self, paths, date, market):
+        """
+        Renvoie les volumes exercés au titre de l'option sur le marché
+        `market` à la date `date`, évalués sur les trajectoires `paths`.
+        """
+        if market == self.markets and date == self.maturity:
+            prices = self.getpathsum(paths, date)
+            return np.where(prices > self.strike, prices.dtype.type(1.), 0.)
         else:
             return 0.
         
     
         
+
+    def getgeometricweights(self):
+        "Renvoie les poids normalisés utilisés par la variable de contrôle."
+        return self.weights
+
+    def getcontrolmeans(self):
+        """
+        Renvoie les espérances des variables de contrôle de l'option (cf.
+        `getcontrols`) : le call sur la moyenne géométrique pondérée des
+        sous-jacents, dont le prix est connu en formule fermée.
+        """
+        if self.typeO != "call":
+            return np.empty(0)
+        return np.array([geometric_basket_call(
+            np.broadcast_to(self.markets.initvalue, (self.numbersU,)),
+            self.getgeometricweights(), self.strike, self.markets.rate,
+            np.broadcast_to(self.markets.sigma, (self.numbersU,)),
+            self.markets.getcorrmatrix(), self.maturity)])
+
+    def _getgeometriccontrol(self, prices, df):
+        """
+        Renvoie le payoff actualisé du call sur la moyenne géométrique des
+        prix `prices` (tableau des prix de chaque sous-jacent, de taille
+        `(numbersU, ...)`).
+        """
+        logsum = np.tensordot(self.weights.astype(prices.dtype),
+                              np.log(prices), axes=1)
+        return (df * np.maximum(np.exp(logsum) - self.strike, 0.))[np.newaxis]
+
+    @timecached
+    def getcontrols(self, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        sous la forme d'un tableau de taille `(ncontrols, nsims)`.
+        """
+        if date == self.maturity and self.typeO == "call":
+            return self._getgeometriccontrol(self.markets.getspots(date),
+                                             self.markets.getdf(date))
+        else:
+            return 0.
+
+    def getpathcontrols(self, paths, date):
+        """
+        Renvoie les variables de contrôle de l'option à la date `date`,
+        évaluées sur les trajectoires `paths`.
+        """
+        if date == self.maturity and self.typeO == "call":
+            return self._getgeometriccontrol(paths.getspots(self.markets, date),
+                                             paths.getdf(self.markets, date))
+        else:
+            return 0.
+
+    def getgreeklabels(self):
+        """
+        Renvoie les identifiants `(marché, grecque)` des sensibilités
+        calculées par `getgreeks` : delta et vega par rapport au prix
+        initial et à la volatilité de chaque sous-jacent (numérotés à
+        partir de 1), et rho.
+        """
+        return [(self.markets.name, '%s%d' % (greek, i + 1))
+                for greek in ('delta', 'vega')
+                for i in range(self.numbersU)] + [(self.markets.name, 'rho')]
+
+    @timecached
+    def getgreeks(self, date):
+        """
+        Renvoie les dérivées trajectorielles des cash-flows actualisés
+        générés par l'option à la date `date` (cf. `getgreeklabels`). Le
+        payoff n'étant pas deux fois dérivable par rapport aux prix
+        initiaux, le gamma n'est pas calculé.
+        """
+        if date == self.maturity and self.typeO == "call":
+            df = self.markets.getdf(date)
+            volume = df * self.getvolume(date, self.markets)
+            greeks = []
+            for param in ('delta', 'vega'):
+                for i in range(self.numbersU):
+                    greeks.append(volume * self.getweight(i) * \
+                        self.markets.getspotderivative(date, param, i))
+            rho = self.markets.getdfderivative(date, 'rho') * self.getcf(date)
+            for i in range(self.numbersU):
+                rho = rho + volume * self.getweight(i) * \
+                    self.markets.getspotderivative(date, 'rho', i)
+            greeks.append(rho)
+            return np.stack(greeks)
+        else:
+            return 0.
+
+class EuropeanStrip:
+    """
+    Famille d'options européennes (calls ou puts) de strikes et de
+    maturités variés portant sur un même marché : les payoffs de toutes les
+    options arrivant à maturité à une date donnée sont calculés en une
+    seule opération vectorisée, de taille `(noptions, nsims)`.
+
+    Les options sont rangées par maturité croissante (puis dans l'ordre
+    donné), de sorte que celles qui arrivent à maturité à une même date
+    occupent des lignes contiguës (cf. `getslice`) : à chaque date, seules
+    ces lignes sont calculées et renvoyées.
+    """
+
+    def __init__(self, name, market, strikes, maturities, typeO="call"):
+        """
+        Initialise une nouvelle instance de la classe `EuropeanStrip`.
+
+        Paramètres :
+        ------------
+        name
+            Identifiant associé à l'instance ; chaque option est identifiée
+            dans les résultats par le triplet `(name, strike, maturité)`.
+        market
+            Le marché sur lequel portent les options (:math:`(S_t)`) ; le
+            sous-jacent est le produit spot.
+        strikes : vecteur
+            Strikes des options (:math:`K_i`).
+        maturities : vecteur
+            Maturités des options (:math:`T_i`), de même taille que
+            `strikes` (ou scalaire).
+        typeO : "call" ou "put"
+            Type des options.
+        """
+        if typeO not in ("call", "put"):
+            raise ValueError("unknown option type: %s." % typeO)
+        strikes, maturities = np.broadcast_arrays(
+            np.atleast_1d(np.asarray(strikes, dtype=float)),
+            np.atleast_1d(np.asarray(maturities, dtype=float)))
+        order = np.argsort(maturities, kind='stable')
+        self.name = name
+        self.market = market
+        self.strikes = strikes[order]
+        self.maturities = maturities[order]
+        self.typeO = typeO
+        self.sign = 1. if typeO == "call" else -1.
+        dates, starts = np.unique(self.maturities, return_index=True)
+        stops = np.append(starts[1:], len(self.maturities))
+        self.slices = {date: slice(start, stop) for date, start, stop
+                       in zip(dates.tolist(), starts.tolist(), stops.tolist())}
+        # Nombre maximal d'options arrivant à maturité à une même date.
+        self.maxoptions = int(np.max(stops - starts)) if len(starts) else 0
+        self.cache = DateCache()
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
+
+    def getdates(self):
+        """
+        Renvoie l'ensemble des dates pour lesquelles l'objet nécessite
+        un calcul spécifique.
+        """
+        return sorted(self.slices)
+
+    def getmarkets(self):
+        "Renvoie l'ensemble des marchés auxquels est exposé l'actif."
+        return [self.market]
+
+    def getmembers(self):
+        """
+        Renvoie les identifiants `(name, strike, maturité)` des options de
+        la famille, dans l'ordre des lignes des tableaux renvoyés par les
+        autres méthodes.
+        """
+        return [(self.name, strike, maturity) for strike, maturity
+                in zip(self.strikes.tolist(), self.maturities.tolist())]
+
+    def getslice(self, date):
+        """
+        Renvoie la tranche des options (cf. `getmembers`) arrivant à
+        maturité à la date `date`.
+        """
+        return self.slices[date]
+
+    def _getpayoffs(self, prices, date, exercise=False, name=None):
+        """
+        Renvoie les payoffs (ou, si `exercise` vaut `True`, les volumes
+        exercés) des options arrivant à maturité à la date `date` pour les
+        prix `prices`, sous la forme d'un tableau de taille
+        `(len(self.getslice(date)),) + prices.shape`. Si `name` est
+        renseigné, le résultat est écrit dans le tampon `name` de l'espace
+        de travail (cf. `getbuffer`), dimensionné pour `self.maxoptions`
+        options et partagé par toutes les dates.
+        """
+        sub = self.slices[date]
+        strikes = self.strikes[sub].astype(prices.dtype)
+        out = None
+        if name is not None:
+            out = getbuffer(self, name, (self.maxoptions,) + prices.shape,
+                            prices.dtype)[:sub.stop - sub.start]
+        gains = np.subtract.outer(strikes, prices, out=out)
+        if self.sign > 0.:
+            np.negative(gains, out=gains)
+        if exercise:
+            np.greater(gains, 0., out=gains)
+            if self.sign < 0.:
+                np.negative(gains, out=gains)
+            return gains
+        return np.maximum(gains, 0., out=gains)
+
+    @timecached
+    def getcf(self, date):
+        """
+        Renvoie les cash-flows générés par les options arrivant à maturité
+        à la date `date` (cf. `getslice`), sous la forme d'un tableau de
+        taille `(noptions, nsims)`.
+        """
+        if date in self.slices:
+            return self._getpayoffs(self.market.getspot(date), date,
+                                    name='getcf')
+        else:
+            return 0.
+
+    @timecached
+    def get_discounted_cf(self, date):
+        """
+        Renvoie les cash-flows actualisés générés par les options arrivant à
+        maturité à la date `date`.
+        """
+        if date in self.slices:
+            cf = self.getcf(date)
+            out = getbuffer(self, 'get_discounted_cf',
+                            (self.maxoptions,) + cf.shape[1:],
+                            cf.dtype)[:len(cf)]
+            return np.multiply(self.market.getdf(date), cf, out=out)
+        else:
+            return 0.
+
+    @timecached
+    def getvolume(self, date, market):
+        """
+        Renvoie les volumes exercés au titre des options arrivant à maturité
+        à la date `date` sur le marché `market` (négatifs pour les puts).
+        """
+        if market == self.market and date in self.slices:
+            return self._getpayoffs(self.market.getspot(date), date, True,
+                                    'getvolume')
+        else:
+            return 0.
+
+    def getpathcf(self, paths, date):
+        """
+        Renvoie les cash-flows actualisés générés par les options arrivant à
+        maturité à la date `date`, évalués sur les trajectoires `paths`.
+        """
+        if date in self.slices:
+            return paths.getdf(self.market, date) \
+                * self._getpayoffs(paths.getspot(self.market, date), date)
+        else:
+            return 0.
+
+    def getpathvolume(self, paths, date, market):
+        """
+        Renvoie les volumes exercés au titre des options arrivant à maturité
+        à la date `date` sur le marché `market`, évalués sur les
+        trajectoires `paths`.
+        """
+        if market == self.market and date in self.slices:
+            return self._getpayoffs(paths.getspot(self.market, date), date,
+                                    True)
+        else:
+            return 0.
+
+def _pathwisegreeks(market, date, df, volume, score):
+    r"""
+    Renvoie les réalisations du delta, du gamma, du vega et du rho (hors
+    dérivée du facteur d'actualisation) d'un cash-flow de la forme
+    :math:`df \cdot f(S_T)` par rapport aux paramètres du marché `market`.
+
+    Paramètres :
+    ------------
+    market
+        Marché de Black-Scholes portant le sous-jacent :math:`S`.
+    date : date
+        Date du cash-flow (:math:`T`).
+    df : double
+        Facteur d'actualisation du cash-flow.
+    volume : numpy.ndarray
+        Dérivée :math:`f'(S_T)` du payoff par rapport au sous-jacent.
+    score : numpy.ndarray
+        Dérivée par rapport à :math:`S_0` du logarithme de la densité des
+        sous-jacents (cf. `getscores`).
+    """
+    volume = df * volume
+    delta = volume * market.getspotderivative(date, 'delta')
+    gamma = delta * (score - 1. / market.initvalue)
+    vega = volume * market.getspotderivative(date, 'vega')
+    rho = volume * market.getspotderivative(date, 'rho')
+    return [delta, gamma, vega, rho]
+
+def _discount(asset, df, cf):
+    """
+    Renvoie les cash-flows `cf` de l'actif `asset` actualisés par le
+    facteur `df`, écrits dans un tampon de son espace de travail (cf.
+    `getbuffer`).
+    """
+    return np.multiply(df, cf, out=getbuffer(asset, 'get_discounted_cf',
+                                             cf.shape, cf.dtype))
@@ -0,0 +1,420 @@
+import numpy as np
+
+class RunningStats:
+    """
+    Moyenne et variance calculées au fil de l'eau (algorithme de Welford,
+    dans sa version par lots de Chan et al.).
+
+    Lorsque `blocksize` est renseigné, les réalisations sont regroupées en
+    blocs de `blocksize` simulations, repérés par leur position dans
+    l'ensemble de la simulation, et les statistiques des blocs sont
+    agrégées selon un arbre binaire qui ne dépend que de ces positions :
+    le résultat est alors identique au bit près quel que soit le découpage
+    des simulations en lots (à condition que les lots soient alignés sur
+    les blocs) et l'ordre dans lequel les lots sont agrégés par `merge`.
+
+    Lorsque `covariance` vaut `True`, la matrice de covariance entre les
+    éléments d'un vecteur (`shape` de longueur 1) est suivie en plus des
+    variances.
+    """
+
+    def __init__(self, shape=(), blocksize=None, covariance=False):
+        """
+        Initialise une nouvelle instance de la classe `RunningStats`.
+
+        Paramètres :
+        ------------
+        shape
+            Dimensions des statistiques suivies (une moyenne et une
+            variance par élément).
+        blocksize : entier positif, optionnel
+            Taille des blocs de simulations.
+        covariance : booléen
+            Si `True`, suit la matrice de covariance des éléments.
+        """
+        self.shape = shape
+        self.blocksize = blocksize
+        self.covariance = covariance
+        # Pile des sous-arbres agrégés : (niveau, premier bloc, effectif,
+        # moyenne, somme des carrés des écarts).
+        self._stack = []
+
+    def push(self, values, offset=None):
+        """
+        Ajoute les réalisations `values` aux statistiques ; le dernier axe
+        de `values` correspond aux simulations.
+
+        Paramètres :
+        ------------
+        values : numpy.ndarray
+            Réalisations à ajouter.
+        offset : entier positif, optionnel
+            Indice de la simulation correspondant à `values[..., 0]` ; doit
+            être un multiple de `self.blocksize`. Par défaut, les
+            réalisations suivent immédiatement celles déjà ajoutées.
+        """
+        nvalues = values.shape[-1]
+        if nvalues == 0:
+            return
+        if self.blocksize is None:
+            self._accumulate(nvalues, *_blockstats(values, self.covariance))
+            return
+        if offset is None:
+            offset = self.count
+        if offset % self.blocksize != 0:
+            raise ValueError("offset should be a multiple of the block size.")
+        nfull = nvalues // self.blocksize
+        if nfull > 0:
+            full = values[..., :nfull * self.blocksize]
+            full = full.reshape(values.shape[:-1] + (nfull, self.blocksize))
+            means, m2s = _blockstats(full, self.covariance)
+            for idx in range(nfull):
+                self._pushtree(0, offset // self.blocksize + idx,
+                               self.blocksize, means[..., idx], m2s[..., idx])
+        if nvalues > nfull * self.blocksize:
+            self._pushtree(0, offset // self.blocksize + nfull,
+                           nvalues - nfull * self.blocksize,
+                           *_blockstats(values[..., nfull * self.blocksize:],
+                                        self.covariance))
+
+    def merge(self, other):
+        """
+        Agrège les statistiques `other`, qui portent sur les simulations
+        suivant celles des statistiques courantes.
+        """
+        if self.blocksize is None:
+            if other.count > 0:
+                self._accumulate(*other._fold())
+            return
+        for item in other._stack:
+            self._pushtree(*item)
+
+    def _accumulate(self, count, mean, m2):
+        if self._stack:
+            _, _, topcount, topmean, topm2 = self._stack.pop()
+            count, mean, m2 = _combine(topcount, topmean, topm2,
+                                       count, mean, m2, self.covariance)
+        self._stack.append((0, 0, count, mean, m2))
+
+    def _pushtree(self, level, first, count, mean, m2):
+        while self._stack:
+            toplevel, topfirst, topcount, topmean, topm2 = self._stack[-1]
+            width = 1 << toplevel
+            if toplevel != level or topfirst % (2 * width) != 0 \
+               or topfirst + width != first:
+                break
+            self._stack.pop()
+            count, mean, m2 = _combine(topcount, topmean, topm2,
+                                       count, mean, m2, self.covariance)
+            level, first = level + 1, topfirst
+        self._stack.append((level, first, count, mean, m2))
+
+    def _fold(self):
+        shape = tuple(self.shape)
+        m2shape = shape + shape[-1:] if self.covariance else shape
+        count, mean, m2 = 0, np.zeros(shape), np.zeros(m2shape)
+        for _, _, itemcount, itemmean, itemm2 in self._stack:
+            count, mean, m2 = _combine(count, mean, m2,
+                                       itemcount, itemmean, itemm2,
+                                       self.covariance)
+        return count, mean, m2
+
+    @property
+    def count(self):
+        "Nombre de réalisations ajoutées."
+        return sum(item[2] for item in self._stack)
+
+    @property
+    def mean(self):
+        "Moyenne empirique des réalisations."
+        return self._fold()[1]
+
+    @property
+    def m2(self):
+        """
+        Somme des carrés des écarts à la moyenne (des produits des écarts
+        lorsque la covariance est suivie).
+        """
+        return self._fold()[2]
+
+    @property
+    def variance(self):
+        "Variance empirique (non biaisée) des réalisations."
+        if self.covariance:
+            return np.diagonal(self.cov).copy()
+        count, _, m2 = self._fold()
+        return m2 / (count - 1)
+
+    @property
+    def cov(self):
+        "Matrice de covariance empirique (non biaisée) des réalisations."
+        if not self.covariance:
+            raise ValueError("the covariance is not tracked.")
+        count, _, m2 = self._fold()
+        return m2 / (count - 1)
+
+    @property
+    def std(self):
+        "Écart-type empirique des réalisations."
+        return np.sqrt(self.variance)
+
+def _blockstats(values, covariance=False):
+    """
+    Renvoie la moyenne et la somme des carrés des écarts à la moyenne de
+    `values` selon son dernier axe ; si `covariance` vaut `True`, la somme
+    des produits des écarts entre éléments du premier axe de `values`.
+    """
+    # Accumulation en double précision, quel que soit le type des
+    # réalisations (cf. `setdtype`).
+    mean = values.mean(axis=-1, dtype=np.float64)
+    deviations = values - mean[..., np.newaxis]
+    if covariance:
+        m2 = np.einsum('i...k,j...k->ij...', deviations, deviations)
+    else:
+        m2 = np.square(deviations).sum(axis=-1)
+    return mean, m2
+
+def _combine(count1, mean1, m21, count2, mean2, m22, covariance=False):
+    "Agrège deux jeux de statistiques (formule de Chan et al.)."
+    if count1 == 0:
+        return count2, mean2, m22
+    total = count1 + count2
+    delta = mean2 - mean1
+    mean = mean1 + delta * (count2 / total)
+    if covariance:
+        square = delta[:, np.newaxis] * delta[np.newaxis, :]
+    else:
+        square = np.square(delta)
+    m2 = m21 + m22 + square * (count1 * count2 / total)
+    return total, mean, m2
+
+class Computation:
+    """
+    Calcul alimenté par `runmc` au fur et à mesure de la simulation, qui
+    permet d'agréger les résultats sans conserver toutes les trajectoires.
+
+    Les simulations sont traitées par lots : pour chaque lot, `startbatch`
+    est appelée, puis `update` pour chaque date, puis `endbatch`.
+    """
+
+    def start(self, assets, exposures, markets, dates, blocksize=None,
+              controls=None, greeks=None, pricemeans=None):
+        """
+        Prépare le calcul avant la simulation.
+
+        Paramètres :
+        ------------
+        assets
+            Identifiants des actifs simulés.
+        exposures
+            Couples `(actif, marché)` pour lesquels des volumes sont
+            simulés.
+        markets
+            Identifiants des marchés simulés.
+        dates
+            Grille de dates, triée par ordre croissant.
+        blocksize : entier positif, optionnel
+            Taille des blocs de simulations utilisés par `RunningStats`.
+        controls : dictionnaire, optionnel
+            Espérances des variables de contrôle simulées, indexées par des
+            couples `(actif, rang)`.
+        greeks : liste, optionnelle
+            Identifiants `(actif, marché, grecque)` des dérivées des
+            cash-flows simulées.
+        pricemeans : numpy.ndarray, optionnel
+            Espérances des prix de chaque marché à chaque date, lorsqu'elles
+            sont connues (cf. `Results`).
+        """
+        self.blocksize = blocksize
+        self.pricemeans = pricemeans
+
+    def startbatch(self, offset, strata=None):
+        """
+        Prépare le traitement du lot de simulations dont la première
+        simulation a pour indice `offset` ; `strata` contient les indices
+        des strates de ces simulations lorsque les bruits sont stratifiés.
+        """
+        self.offset = offset
+        self.batchstrata = strata
+
+    def update(self, didx, earnings, volumes, prices, controls=None,
+               weights=None, greeks=None):
+        """
+        Met à jour le calcul avec les résultats de la date d'indice `didx`.
+
+        Paramètres :
+        ------------
+        didx : entier
+            Position de la date dans la grille.
+        earnings : numpy.ndarray
+            Cash-flows actualisés, de taille `(nassets, nsims)`.
+        volumes : numpy.ndarray
+            Volumes exercés, de taille `(nexposures, nsims)`.
+        prices : numpy.ndarray
+            Prix spot, de taille `(nmarkets, nsims)` (`NaN` pour les marchés
+            qui ne sont pas simulés à cette date).
+        controls : numpy.ndarray, optionnel
+            Variables de contrôle actualisées, de taille
+            `(ncontrols, nsims)`.
+        weights : numpy.ndarray, optionnel
+            Rapports de vraisemblance des simulations (échantillonnage
+            préférentiel), de taille `(nsims,)`, par lesquels les
+            réalisations doivent être pondérées.
+        greeks : numpy.ndarray, optionnel
+            Dérivées des cash-flows actualisés, de taille
+            `(ngreeks, nsims)`.
+        """
+        pass
+
+    def endbatch(self):
+        "Termine le traitement du lot de simulations courant."
+        pass
+
+    def merge(self, other):
+        """
+        Agrège le calcul `other`, qui porte sur les simulations suivant
+        celles du calcul courant.
+        """
+        raise NotImplementedError
+
+class MtMComputation(Computation):
+    """
+    Statistiques suffisantes pour le calcul de la MtM de chaque actif. En
+    présence de variables de contrôle, la covariance entre les cash-flows
+    des actifs et les variables de contrôle est également suivie.
+    """
+
+    def start(self, assets, exposures, markets, dates, blocksize=None,
+              controls=None, greeks=None, pricemeans=None):
+        super().start(assets, exposures, markets, dates, blocksize, controls,
+                      greeks, pricemeans)
+        self.assets = list(assets)
+        controls = controls or {}
+        self.controls = list(controls)
+        self.controlmeans = np.array(list(controls.values()), dtype=float)
+        self.stats = RunningStats((len(self.assets) + len(self.controls),),
+                                  blocksize, covariance=bool(self.controls))
+        # Statistiques par strate, lorsque les bruits sont stratifiés.
+        self.stratastats = {}
+        self._total = None
+
+    def update(self, didx, earnings, volumes, prices, controls=None,
+               weights=None, greeks=None):
+        if self.controls:
+            earnings = np.concatenate((earnings, controls))
+        if weights is not None:
+            earnings = earnings * weights
+        if self._total is None:
+            self._total = earnings.copy()
+        else:
+            self._total += earnings
+
+    def endbatch(self):
+        self.stats.push(self._total, self.offset)
+        if self.batchstrata is not None:
+            for stratum in np.unique(self.batchstrata):
+                if stratum not in self.stratastats:
+                    self.stratastats[stratum] = RunningStats(
+                        self.stats.shape)
+                self.stratastats[stratum].push(
+                    self._total[:, self.batchstrata == stratum])
+        self._total = None
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        for stratum, stats in other.stratastats.items():
+            if stratum not in self.stratastats:
+                self.stratastats[stratum] = RunningStats(self.stats.shape)
+            self.stratastats[stratum].merge(stats)
+
+class DeltaComputation(Computation):
+    "Statistiques suffisantes pour le calcul du delta de chaque actif."
+
+    def start(self, assets, exposures, markets, dates, blocksize=None,
+              controls=None, greeks=None, pricemeans=None):
+        super().start(assets, exposures, markets, dates, blocksize, controls,
+                      greeks, pricemeans)
+        self.exposures = list(exposures)
+        self.markets = list(markets)
+        self.dates = list(dates)
+        marketindex = {market: idx for idx, market in enumerate(self.markets)}
+        self.marketidx = [marketindex[m] for _, m in self.exposures]
+        # Numérateurs (volume * prix) par exposition et par date, et prix
+        # moyens par marché et par date.
+        self.products = [RunningStats((len(self.exposures),), blocksize)
+                         for _ in self.dates]
+        self.prices = [RunningStats((len(self.markets),), blocksize)
+                       for _ in self.dates]
+
+    def update(self, didx, earnings, volumes, prices, controls=None,
+               weights=None, greeks=None):
+        # Les prix des marchés qui ne sont pas simulés à cette date valent
+        # `NaN` et ne contribuent pas.
+        prices = np.nan_to_num(prices)
+        if weights is not None:
+            prices = prices * weights
+        self.products[didx].push(volumes * prices[self.marketidx], self.offset)
+        self.prices[didx].push(prices, self.offset)
+
+    def merge(self, other):
+        for stats, otherstats in zip(self.products + self.prices,
+                                     other.products + other.prices):
+            stats.merge(otherstats)
+
+class GreeksComputation(Computation):
+    """
+    Statistiques suffisantes pour le calcul des grecques de chaque actif
+    (cf. `getgreeks`).
+    """
+
+    def start(self, assets, exposures, markets, dates, blocksize=None,
+              controls=None, greeks=None, pricemeans=None):
+        super().start(assets, exposures, markets, dates, blocksize, controls,
+                      greeks, pricemeans)
+        if greeks is None:
+            raise ValueError("the greeks should be simulated (greeks=True).")
+        self.greeks = list(greeks)
+        self.stats = RunningStats((len(self.greeks),), blocksize)
+        self._total = None
+
+    def update(self, didx, earnings, volumes, prices, controls=None,
+               weights=None, greeks=None):
+        if weights is not None:
+            greeks = greeks * weights
+        if self._total is None:
+            self._total = greeks.copy()
+        else:
+            self._total += greeks
+
+    def endbatch(self):
+        self.stats.push(self._total, self.offset)
+        self._total = None
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+
+class Replications:
+    """
+    Résultats de plusieurs simulations indépendantes des mêmes actifs
+    (typiquement, les randomisations d'une suite quasi-aléatoire), dont la
+    dispersion fournit les intervalles de confiance.
+    """
+
+    def __init__(self, mtm, delta):
+        """
+        Initialise une nouvelle instance de la classe `Replications`.
+
+        Paramètres :
+        ------------
+        mtm
+            Liste des `MtMComputation` de chaque réplication.
+        delta
+            Liste des `DeltaComputation` de chaque réplication.
+        """
+        self.mtm = list(mtm)
+        self.delta = list(delta)
+
+    @property
+    def nreplications(self):
+        "Nombre de réplications."
+        return len(self.mtm)
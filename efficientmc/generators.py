@@ -1,9 +1,14 @@
 import numpy as np
-from efficientmc.utils import timecached, DateCache
-import sobol_seq
-import ghalton as gh
+from efficientmc.utils import timecached, DateCache, getdtype
+import os
+import inspect
+import scipy.stats
+from functools import lru_cache
+from collections import OrderedDict
 from scipy.stats import norm
-from math import ceil, fmod, floor, log
+from scipy.special import ndtr, ndtri
+from scipy.linalg.blas import get_blas_funcs
+from math import log
 from pyDOE import *
 
 class GaussianGenerator:
@@ -27,33 +32,169 @@ class GaussianGenerator:
             apparaissent dans `corrmatrix`.
         randomfunc
             Fonction permettant de générer des bruits gaussiens indépendants
-            (typiquement `np.random.randn`).
+            (typiquement `np.random.randn`), ou instance de `RandomStream`.
+            Seul un `RandomStream` garantit que les bruits d'une simulation
+            ne dépendent pas du découpage en lots (cf. `setchunk`).
         """
         self.corrmatrix = corrmatrix
         self.corrkeys = corrkeys
         self.nsims = nsims
         self.randomfunc = randomfunc
         self.cache = DateCache()
+        self.start = 0
+        self._steps = {}
+        self._pathnoises = None
+        # Échantillonnage préférentiel : décalage des bruits indépendants
+        # par date, logarithmes des rapports de vraisemblance des bruits
+        # tirés et, pendant les simulations pilotes, bruits tirés.
+        self.drift = {}
+        self._logweights = {}
+        self.recorded = None
         try:
-            np.linalg.cholesky(self.corrmatrix)
+            self.cholesky = np.linalg.cholesky(self.corrmatrix)
         except np.linalg.LinAlgError:
             raise np.linalg.LinAlgError("the correlation matrix is not "\
                                         "positive definite.") from None
+        self._independent = np.array_equal(self.cholesky,
+                                           np.eye(self.nnoises))
+        self.keyindex = {key: idx for idx, key in enumerate(self.corrkeys)}
+        self._selections = {}
 
     @property
     def nnoises(self):
         "Nombre de bruits gaussiens distincts à simuler."
         return self.corrmatrix.shape[0]
 
+    def setchunk(self, start, nsims):
+        """
+        Restreint le générateur au lot des simulations d'indices
+        `start` à `start + nsims - 1` et vide ses caches.
+        """
+        self.start = start
+        self.nsims = nsims
+        self.cache.clear()
+        self._steps = {}
+        self._pathnoises = None
+        self._logweights = {}
+
+    def getstep(self, date):
+        """
+        Renvoie le rang de la date `date` parmi les dates pour lesquelles des
+        bruits ont été demandés depuis le dernier appel à `setchunk`.
+        """
+        return self._steps.setdefault(date, len(self._steps))
+
     @timecached
     def getallnoises(self, date):
         """
         Renvoie `self.nsims` réalisations de `self.nnoises` bruits
-        gaussiens corrélés.
+        gaussiens corrélés, dans le type flottant `getdtype()`.
         """
-        whitenoises = self.randomfunc(self.nnoises, self.nsims)
-        noises = np.dot(np.linalg.cholesky(self.corrmatrix), whitenoises)
-        return noises
+        # Les bruits déjà tirés pour une grille complète sont réutilisés, de
+        # sorte que les modèles simulés date par date et ceux construits sur
+        # toute la grille reçoivent les mêmes bruits.
+        if self._pathnoises is not None and date in self._pathnoises[2]:
+            return self._pathnoises[1][self._pathnoises[2][date]]
+        if isinstance(self.randomfunc, RandomStream):
+            whitenoises = self.randomfunc(self.nnoises, self.nsims,
+                                          start=self.start,
+                                          step=self.getstep(date))
+        else:
+            whitenoises = self.randomfunc(self.nnoises, self.nsims)
+        # Les bruits sont tirés en double précision puis convertis, de sorte
+        # que la simple précision ne modifie que leurs arrondis.
+        whitenoises = np.asarray(whitenoises, dtype=getdtype())
+        if date in self.drift:
+            whitenoises = self.shift(date, whitenoises)
+        if self.recorded is not None:
+            self.recorded[date] = whitenoises.copy()
+        return self.correlate(whitenoises)
+
+    def setdrift(self, drift):
+        """
+        Renseigne le décalage des bruits (échantillonnage préférentiel) :
+        `drift` associe à une date le vecteur, de taille `self.nnoises`,
+        des moyennes des bruits indépendants (avant corrélation) tirés à
+        cette date. Les dates absentes de `drift` ne sont pas décalées.
+        """
+        self.drift = {date: np.asarray(value, dtype=float)
+                      for date, value in drift.items()}
+        self.setchunk(self.start, self.nsims)
+
+    def shift(self, date, whitenoises):
+        """
+        Décale les bruits indépendants `whitenoises` tirés à la date `date`
+        de `self.drift[date]` et enregistre le logarithme du rapport de
+        vraisemblance correspondant.
+        """
+        drift = self.drift[date]
+        if not whitenoises.flags.writeable:
+            whitenoises = whitenoises.copy()
+        whitenoises += drift[:, np.newaxis]
+        self._logweights[date] = 0.5 * drift @ drift - drift @ whitenoises
+        return whitenoises
+
+    def getlogweights(self):
+        """
+        Renvoie le logarithme du rapport de vraisemblance (loi des bruits
+        sans décalage sur loi des bruits décalés) de l'ensemble des bruits
+        tirés depuis le dernier appel à `setchunk`, pour chaque simulation,
+        auquel s'ajoute le logarithme du poids de stratification éventuel
+        (cf. `StratifiedStream.getweights`).
+        """
+        res = sum(self._logweights.values(), np.zeros(self.nsims))
+        if isinstance(self.randomfunc, StratifiedStream):
+            res += np.log(self.randomfunc.getweights(self.start, self.nsims))
+        return res
+
+    def isweighted(self):
+        """
+        Indique si les simulations du générateur doivent être pondérées
+        (échantillonnage préférentiel ou stratification).
+        """
+        return bool(self.drift) \
+            or isinstance(self.randomfunc, StratifiedStream)
+
+    def getstrata(self):
+        """
+        Renvoie les indices des strates des simulations du lot courant si
+        les bruits sont stratifiés (cf. `StratifiedStream`), `None` sinon.
+        """
+        if isinstance(self.randomfunc, StratifiedStream):
+            return self.randomfunc.getstrata(self.start, self.nsims)
+        return None
+
+    def correlate(self, whitenoises):
+        """
+        Corrèle les bruits indépendants `whitenoises`, de taille
+        `(self.nnoises, nsims)`, en les multipliant (en place lorsque c'est
+        possible) par la factorisée de Cholesky de `self.corrmatrix`.
+        """
+        if self._independent:
+            return whitenoises
+        if not (whitenoises.flags.c_contiguous and whitenoises.flags.writeable):
+            whitenoises = np.array(whitenoises, order='C')
+        # `whitenoises.T` est contigu au sens Fortran : le produit
+        # triangulaire `whitenoises.T * L.T` peut être effectué en place.
+        trmm = get_blas_funcs('trmm', (whitenoises,))
+        trmm(1., self.cholesky, whitenoises.T, side=1, lower=1, trans_a=1,
+             overwrite_b=1)
+        return whitenoises
+
+    def getselection(self, keys):
+        """
+        Renvoie l'indexeur permettant d'extraire les bruits identifiés par
+        les clefs `keys` : une tranche (qui donne une vue, sans copie) si les
+        bruits sont contigus, une liste d'indices sinon.
+        """
+        keys = tuple(keys)
+        if keys not in self._selections:
+            idx = [self.keyindex[key] for key in keys]
+            if idx == list(range(idx[0], idx[0] + len(idx))):
+                self._selections[keys] = slice(idx[0], idx[0] + len(idx))
+            else:
+                self._selections[keys] = idx
+        return self._selections[keys]
 
     @timecached
     def getnoises(self, date, keys):
@@ -62,12 +203,212 @@ class GaussianGenerator:
         gaussiens corrélés correspondants aux aléas identifiés par les
         clefs `keys`.
         """
-        noises = self.getallnoises(date)
-        res = np.empty((len(keys), self.nsims))
-        for idx, key in enumerate(keys):
-            keyidx = self.corrkeys.index(key)
-            res[idx, :] = noises[keyidx, :]
-        return res
+        return self.getallnoises(date)[self.getselection(keys)]
+
+    def getallpathnoises(self, dates):
+        """
+        Renvoie un tableau de taille `(len(dates), self.nnoises, self.nsims)`
+        contenant les bruits corrélés de toutes les dates de `dates`.
+
+        Les bruits sont tirés une seule fois pour une grille donnée, de sorte
+        que tous les modèles qui partagent le générateur reçoivent des
+        trajectoires cohérentes.
+        """
+        dates = tuple(dates)
+        if self._pathnoises is None or self._pathnoises[0] != dates:
+            noises = np.empty((len(dates), self.nnoises, self.nsims),
+                              dtype=getdtype())
+            for idx, date in enumerate(dates):
+                noises[idx] = self.getallnoises(date)
+            self._pathnoises = (dates, noises,
+                                {date: idx for idx, date in enumerate(dates)})
+        return self._pathnoises[1]
+
+    def getpathnoises(self, dates, keys):
+        """
+        Renvoie un tableau de taille `(len(dates), len(keys), self.nsims)`
+        de bruits gaussiens corrélés correspondants aux aléas identifiés par
+        les clefs `keys`, pour chacune des dates de `dates`.
+        """
+        return self.getallpathnoises(dates)[:, self.getselection(keys), :]
+
+class RandomStream:
+    """
+    Source de bruits gaussiens indépendants adressable : le bruit de la
+    simulation d'indice `i` pour la date de rang `step` ne dépend que de
+    `(i, step)`, et non de la façon dont les simulations sont découpées
+    en lots.
+    """
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        """
+        Renvoie un tableau de taille `(nnoises, nsims)` de bruits gaussiens
+        indépendants, correspondant aux simulations d'indices `start` à
+        `start + nsims - 1` pour la date de rang `step`.
+        """
+        raise NotImplementedError
+
+    def getkey(self):
+        """
+        Renvoie une chaîne identifiant de façon reproductible les bruits
+        du flux (cf. `NoiseStore`), ou `None` s'ils ne le sont pas.
+        """
+        return None
+
+class PseudoRandomStream(RandomStream):
+    """
+    Bruits pseudo-aléatoires découpés en blocs de `blocksize` simulations,
+    chaque bloc étant tiré par un générateur indépendant dérivé de la
+    graine `seed` (`numpy.random.SeedSequence`).
+    """
+
+    def __init__(self, seed, blocksize=4096):
+        """
+        Initialise une nouvelle instance de la classe `PseudoRandomStream`.
+
+        Paramètres :
+        ------------
+        seed : entier positif
+            Graine du flux.
+        blocksize : entier positif
+            Nombre de simulations tirées par un même générateur.
+        """
+        self.seed = seed
+        self.blocksize = blocksize
+
+    def getblock(self, nnoises, block, step=0):
+        """
+        Renvoie les bruits, de taille `(nnoises, self.blocksize)`, du bloc
+        d'indice `block` pour la date de rang `step`.
+        """
+        seq = np.random.SeedSequence(self.seed, spawn_key=(step, block))
+        return np.random.default_rng(seq).standard_normal((nnoises,
+                                                           self.blocksize))
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        first = start // self.blocksize
+        last = (start + nsims - 1) // self.blocksize
+        noises = np.concatenate([self.getblock(nnoises, block, step)
+                                 for block in range(first, last + 1)], axis=1)
+        offset = start - first * self.blocksize
+        return noises[:, offset:offset + nsims]
+
+    def getkey(self):
+        if not isinstance(self.seed, (int, np.integer)):
+            return None
+        return 'pseudo%d-%d' % (self.seed, self.blocksize)
+
+class NoiseStore(RandomStream):
+    """
+    Stockage sur disque des bruits d'un flux `RandomStream` : les bruits
+    sont tirés par blocs de `blocksize` simulations, enregistrés dans des
+    fichiers `.npy` identifiés par le flux (cf. `RandomStream.getkey`), le
+    nombre de bruits, le rang de la date et l'indice du bloc, puis relus
+    sous la forme de vues `numpy.memmap` en lecture seule. Les simulations
+    suivantes, y compris dans d'autres processus, partagent ainsi une même
+    copie des bruits (via le cache de pages du système) sans les générer à
+    nouveau.
+    """
+
+    def __init__(self, stream, directory, blocksize=4096, key=None,
+                 maxblocks=64):
+        """
+        Initialise une nouvelle instance de la classe `NoiseStore`.
+
+        Paramètres :
+        ------------
+        stream : RandomStream
+            Flux dont les bruits sont stockés.
+        directory
+            Répertoire des fichiers de bruits, créé si besoin.
+        blocksize : entier positif
+            Nombre de simulations par fichier.
+        key : chaîne, optionnelle
+            Identifiant du flux dans les noms de fichiers ; par défaut,
+            `stream.getkey()`.
+        maxblocks : entier positif
+            Nombre maximal de fichiers gardés ouverts (les plus récemment
+            utilisés) ; chaque vue `numpy.memmap` mobilisant un descripteur
+            de fichier, les autres fichiers sont rouverts à la demande.
+        """
+        if key is None:
+            key = stream.getkey()
+        if key is None:
+            raise ValueError("the stream cannot be identified, a key should "\
+                             "be given.")
+        self.stream = stream
+        self.directory = directory
+        self.blocksize = blocksize
+        self.key = key
+        self.maxblocks = maxblocks
+        self._blocks = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def getkey(self):
+        return self.key
+
+    def getpath(self, nnoises, block, step=0):
+        """
+        Renvoie le chemin du fichier contenant les bruits du bloc d'indice
+        `block` pour la date de rang `step`.
+        """
+        return os.path.join(self.directory, '%s-n%d-s%d-b%d-%d.npy'
+                            % (self.key, nnoises, step, self.blocksize, block))
+
+    def getblock(self, nnoises, block, step=0):
+        """
+        Renvoie les bruits, de taille `(nnoises, self.blocksize)`, du bloc
+        d'indice `block` pour la date de rang `step`, en les générant et en
+        les enregistrant s'ils ne sont pas encore sur le disque.
+        """
+        path = self.getpath(nnoises, block, step)
+        if path in self._blocks:
+            self._blocks.move_to_end(path)
+        else:
+            if not os.path.exists(path):
+                noises = self.stream(nnoises, self.blocksize,
+                                     start=block * self.blocksize, step=step)
+                # Écriture dans un fichier temporaire puis renommage, pour
+                # que les autres processus ne lisent pas de fichier partiel.
+                tmppath = '%s.%d.tmp' % (path, os.getpid())
+                with open(tmppath, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(noises, dtype=float))
+                os.replace(tmppath, path)
+            self._blocks[path] = np.load(path, mmap_mode='r')
+            while len(self._blocks) > self.maxblocks:
+                # Fermeture du fichier le moins récemment utilisé (dès que
+                # plus aucune vue n'y fait référence).
+                self._blocks.popitem(last=False)
+        return self._blocks[path]
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        first = start // self.blocksize
+        last = (start + nsims - 1) // self.blocksize
+        offset = start - first * self.blocksize
+        if first == last:
+            # Vue sur le fichier, sans copie.
+            return self.getblock(nnoises, first, step)[:, offset:offset + nsims]
+        noises = np.concatenate([self.getblock(nnoises, block, step)
+                                 for block in range(first, last + 1)], axis=1)
+        return noises[:, offset:offset + nsims]
+
+    def randomize(self, seed):
+        """
+        Renvoie le stockage des bruits de la version aléatoire, de graine
+        `seed`, du flux (cf. `randomize`).
+        """
+        stream = randomize(self.stream, seed)
+        key = stream.getkey()
+        if key is None:
+            key = '%s-random%d' % (self.key, seed)
+        return NoiseStore(stream, self.directory, self.blocksize, key,
+                          self.maxblocks)
+
+    def __getstate__(self):
+        # Les vues sur les fichiers sont rouvertes par chaque processus.
+        state = self.__dict__.copy()
+        state['_blocks'] = OrderedDict()
+        return state
 
 "Variables antithétiques"
 
@@ -95,208 +436,622 @@ def antithetic_randn(nnoises, nsims):
 
 "Quasi-Monte Carlo"
 
+class QMCStream(RandomStream):
+    """
+    Flux de bruits gaussiens issus d'une suite à discrépance faible : la
+    date de rang `step` utilise les dimensions `step * nnoises` à
+    `(step + 1) * nnoises - 1` de la suite, et la simulation d'indice `i`
+    le `i`-ème point de la suite.
+    """
+
+    def __init__(self, sequence):
+        """
+        Initialise une nouvelle instance de la classe `QMCStream`.
+
+        Paramètres :
+        ------------
+        sequence
+            Fonction de la forme `sequence(nnoises, nsims, start, firstdim)`
+            renvoyant les bruits gaussiens associés aux points `start` à
+            `start + nsims - 1` de la suite, dimensions `firstdim` à
+            `firstdim + nnoises - 1` (typiquement `haltonF`).
+        """
+        self.sequence = sequence
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        return self.sequence(nnoises, nsims, start=start,
+                             firstdim=step * nnoises)
+
+    def getkey(self):
+        if hasattr(self.sequence, 'getkey'):
+            return self.sequence.getkey()
+        return self.sequence.__name__
+
+    def randomize(self, seed):
+        """
+        Renvoie une version aléatoire du flux, de graine `seed` : la suite
+        est brouillée si elle le permet (`SobolSequence`), décalée
+        aléatoirement modulo 1 sinon.
+        """
+        if hasattr(self.sequence, 'randomize'):
+            return QMCStream(self.sequence.randomize(seed))
+        return RandomShift(self, seed)
+
+class RandomShift(RandomStream):
+    """
+    Décalage aléatoire modulo 1 (Cranley-Patterson) des points d'une suite à
+    discrépance faible : chaque dimension de la suite est décalée d'un
+    uniforme indépendant, ce qui donne des points uniformes sur le cube
+    tout en préservant leur structure.
+    """
+
+    def __init__(self, sequence, seed):
+        """
+        Initialise une nouvelle instance de la classe `RandomShift`.
+
+        Paramètres :
+        ------------
+        sequence
+            Suite à randomiser : `RandomStream` ou fonction de suite
+            adressable (cf. `asstream`).
+        seed : entier positif
+            Graine des décalages.
+        """
+        self.sequence = asstream(sequence)
+        self.seed = seed
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        noises = self.sequence(nnoises, nsims, start=start, step=step)
+        firstdim = step * nnoises
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed))
+        shifts = rng.random(firstdim + nnoises)[firstdim:]
+        points = ndtr(noises)
+        points += shifts[:, np.newaxis]
+        np.fmod(points, 1., out=points)
+        return ndtri(points, out=points)
+
+    def getkey(self):
+        if self.sequence.getkey() is None:
+            return None
+        return '%s-shift%d' % (self.sequence.getkey(), self.seed)
+
+def asstream(randomfunc):
+    """
+    Renvoie la source de bruits `randomfunc` sous la forme d'un
+    `RandomStream` : telle quelle si c'en est un, enveloppée dans un
+    `QMCStream` s'il s'agit d'une fonction de suite adressable, de la forme
+    `randomfunc(nnoises, nsims, start, firstdim)` (typiquement `haltonF`).
+    Les autres fonctions (`np.random.randn`...) renvoient des points qui ne
+    dépendent ni de la date ni du lot de simulations, et ne peuvent donc
+    pas être converties.
+    """
+    if isinstance(randomfunc, RandomStream):
+        return randomfunc
+    try:
+        params = inspect.signature(randomfunc).parameters
+    except (TypeError, ValueError):
+        params = {}
+    if 'start' not in params or 'firstdim' not in params:
+        raise ValueError("%s is not an addressable sequence: use a "\
+                         "RandomStream or a function accepting start and "\
+                         "firstdim." % getattr(randomfunc, '__name__',
+                                               randomfunc))
+    return QMCStream(randomfunc)
+
+def randomize(randomfunc, seed):
+    """
+    Renvoie une version aléatoire, de graine `seed`, de la source de bruits
+    quasi-aléatoires `randomfunc` (cf. `QMCStream.randomize`), convertie au
+    préalable en `RandomStream` si besoin (cf. `asstream`).
+    """
+    stream = asstream(randomfunc)
+    if hasattr(stream, 'randomize'):
+        return stream.randomize(seed)
+    return RandomShift(stream, seed)
+
+def primes(nprimes):
+    "Renvoie les `nprimes` premiers nombres premiers."
+    bound = max(16, int(nprimes * (log(nprimes + 1) + log(log(nprimes + 3))))
+                + 3)
+    sieve = np.ones(bound + 1, dtype=bool)
+    sieve[:2] = False
+    for idx in range(2, int(bound**0.5) + 1):
+        if sieve[idx]:
+            sieve[idx * idx::idx] = False
+    return np.flatnonzero(sieve)[:nprimes]
+
+def radical_inverse(indices, base):
+    """
+    Renvoie l'inverse radical en base `base` de chacun des entiers de
+    `indices` (i.e. : leur écriture en base `base` renversée de part et
+    d'autre de la virgule), calculé simultanément pour tous les entiers.
+    """
+    indices = np.array(indices, dtype=np.int64)
+    digits = np.empty_like(indices)
+    res = np.zeros(indices.shape)
+    factor = 1. / base
+    while indices.any():
+        np.divmod(indices, base, out=(indices, digits))
+        res += digits * factor
+        factor /= base
+    return res
+
+def radical_inverse_block(bases, nsims, start=0):
+    """
+    Renvoie un tableau de taille `(len(bases), nsims)` contenant les
+    inverses radicaux des entiers `start` à `start + nsims - 1`, dans
+    chacune des bases de `bases`.
+    """
+    indices = np.arange(start, start + nsims, dtype=np.int64)
+    res = np.empty((len(bases), nsims))
+    for row, base in enumerate(bases):
+        res[row] = radical_inverse(indices, base)
+    return res
+
 "Suite de Van der Corput"
 
 def vdc(n, base):
     """
     Cette fonction permet de calculer le n-ieme nombre de la base b de la
-    séquence de Van Der Corput
+    séquence de Van Der Corput (`n` peut être un tableau d'entiers).
     """
-    vdc, denom = 0,1
-    while n:
-        denom *= base
-        n, remainder = divmod(n, base)
-        vdc += remainder / denom
-    return norm.ppf(vdc)
+    return ndtri(radical_inverse(n, base))
 
-def van_der_corput(nsims,b):
+def van_der_corput(nsims, b, start=0):
     """
-    Cette fonction permet de générer la séquence de Van Der Corput en base b
+    Cette fonction permet de générer la séquence de Van Der Corput en base b,
+    à partir de son `start + 1`-ième point.
     """
-    array=np.empty(nsims)
-    for i in range(nsims):
-        array[i]=vdc(i+1,b)
-    return array
+    return vdc(np.arange(start + 1, start + nsims + 1), b)
 
-def van_der_corput_dimension(dim,nsims):
-    array=np.empty((dim,nsims))
+def van_der_corput_dimension(dim, nsims, start=0, firstdim=0):
     """
     Cette fonction génère dans un tableau de taille (dim,nsims) toutes les séquences
-    de la suite de Van der Corput de la base 2 à la base dim+2
+    de la suite de Van der Corput de la base `firstdim + 2` à la base
+    `firstdim + dim + 1`, à partir de leur `start + 1`-ième point.
     """
-    for i in range(2,dim+2,1):
-        array[i-2,:]=van_der_corput(nsims, i)
-    return array
+    bases = range(firstdim + 2, firstdim + dim + 2)
+    return ndtri(radical_inverse_block(bases, nsims, start + 1))
 
 "Suite de Halton"
 
-def halton2(dim, nsims):
-    """
-    la fonction ne crash plus.
-    Version 2 de la suite d'halton sans la librairie Python existante.
-    """
-    h = np.empty(nsims * dim)
-    h.fill(np.nan)
-    p = np.empty(nsims)
-    p.fill(np.nan)
-    Base = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31]
-    lognsims = log(nsims + 1)
-    for i in range(dim):
-        base = Base[i]
-        n = int(ceil(lognsims / log(base)))
-        for t in range(n):
-            p[t] = pow(base, -(t + 1) )
-        for j in range(nsims):
-            d = j + 1
-            somme = fmod(d, base) * p[0]
-            for t in range(1, n):
-                d = floor(d / base)
-                somme += fmod(d, base) * p[t]
-
-            h[j*dim + i] = somme
-
-    return norm.ppf(h.reshape(dim, nsims))
-
-def haltonF(nnoises,nsims):
-    Prime=[2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53,\
-            59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103, 107, 109, 113,\
-             127, 131, 137, 139, 149, 151, 157, 163, 167, 173, 179, 181,\
-              191, 193, 197, 199, 211, 223, 227, 229, 233, 239, 241, 251,\
-               257, 263, 269, 271, 277, 281]
-    halton=np.empty((nnoises,nsims))
-    for i in range(0,nsims,1):
-        for j in range(0,nnoises,1):
-            prime=Prime[j]
-            halton[j,i]=vdc(i,prime)
-    return halton
+def halton2(dim, nsims, start=0, firstdim=0):
+    """
+    Version 2 de la suite d'halton sans la librairie Python existante :
+    renvoie un tableau de taille `(dim, nsims)` contenant les points
+    `start + 1` à `start + nsims` de la suite de Halton, dimensions
+    `firstdim` à `firstdim + dim - 1`.
+    """
+    bases = primes(firstdim + dim)[firstdim:]
+    return ndtri(radical_inverse_block(bases, nsims, start + 1))
+
+def haltonF(nnoises, nsims, start=0, firstdim=0):
+    """
+    Renvoie un tableau de taille `(nnoises, nsims)` de bruits gaussiens
+    obtenus à partir des points `start + 1` à `start + nsims` de la suite de
+    Halton (le point d'indice 0, nul, est écarté car son image par
+    l'inverse de la fonction de répartition gaussienne est infinie),
+    dimensions `firstdim` à `firstdim + nnoises - 1`.
+    """
+    return halton2(nnoises, nsims, start, firstdim)
 
 "Suite de Hammersley"
 
-def hammersley(nnoises,nsims):
-    Prime=[2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53,\
-            59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103, 107, 109, 113,\
-             127, 131, 137, 139, 149, 151, 157, 163, 167, 173, 179, 181,\
-              191, 193, 197, 199, 211, 223, 227, 229, 233, 239, 241, 251,\
-               257, 263, 269, 271, 277, 281]
-    hammersley=np.empty((nnoises,nsims))
-    for i in range(0,nsims,1):
-        hammersley[0,i]=i/nsims
-    for i in range(0,nsims,1):
-        for j in range(1,nnoises-1,1):
-            prime=Prime[j]
-            hammersley[j,i]=vdc(i,prime)
-    return hammersley
+def hammersley(nnoises, nsims, start=0, firstdim=0, npoints=None):
+    """
+    Renvoie un tableau de taille `(nnoises, nsims)` de bruits gaussiens
+    obtenus à partir de l'ensemble de Hammersley à `npoints` points (par
+    défaut, `nsims`) : la première coordonnée du point `i` vaut
+    `(i + 0.5) / npoints`, les suivantes sont celles du point `i + 1` de la
+    suite de Halton. Les points `start` à `start + nsims - 1` sont renvoyés.
+
+    L'ensemble de Hammersley est de taille fixe : pour en obtenir une partie
+    (`start > 0`, typiquement par lots), `npoints` doit être renseigné, sans
+    quoi chaque lot serait mis à l'échelle de son propre effectif.
+    """
+    if npoints is None:
+        if start > 0:
+            raise ValueError("the Hammersley set has a fixed size: npoints "\
+                             "should be given when start > 0.")
+        npoints = nsims
+    if start + nsims > npoints:
+        raise ValueError("points beyond the size of the Hammersley set "\
+                         "were requested.")
+    points = np.empty((nnoises, nsims))
+    if firstdim == 0:
+        points[0] = (np.arange(start, start + nsims) + 0.5) / npoints
+        bases = primes(nnoises - 1)
+        points[1:] = radical_inverse_block(bases, nsims, start + 1)
+    else:
+        bases = primes(firstdim + nnoises - 1)[firstdim - 1:]
+        points[:] = radical_inverse_block(bases, nsims, start + 1)
+    return ndtri(points, out=points)
 
 "Suite de Faure"
 
-def toDigits2(n, b):
-    """Convert a positive number n to its digit representation in base b."""
-    digits = []
-    while n > 0:
-        digits.insert(0, n % b)
-        n  = n // b
-    digits.reverse()
-    i=0
-    for i in range(0,len(digits),1):
-        digits[i]/=b**(i+1)
-    return digits
-
-def toDigits3(n, b,dim):
-    if n!=0:
-        I=int(math.log(n)/math.log(b))+1
-    else:
-        I=0
-    z=[]
-    a=toDigits2(n,b)
-    if dim==1:
-        return a
-    else:
-        for i in range(0,I-1,1):
-            h=0
-            for j in range(i,I-1,1):
-                h+=(comb(i,j)*toDigits3(n,b,dim-1)[i])%b
-            z.append(h)
-        return z
-
-def sumDigits(n,b):
-        a=toDigits2(n,b)
-        return np.sum(a)
-
-def faureF(dim,nsims):
-    array=np.empty((dim,nsims))
-    p=2
-    Prime=[2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41, 43, 47, 53,\
-            59, 61, 67, 71, 73, 79, 83, 89, 97, 101, 103, 107, 109, 113,\
-             127, 131, 137, 139, 149, 151, 157, 163, 167, 173, 179, 181,\
-              191, 193, 197, 199, 211, 223, 227, 229, 233, 239, 241, 251,\
-               257, 263, 269, 271, 277, 281]
-    i=0
-    for i in range(0,nsims,1):
-        array[0,i]=sumDigits(i,2)
-    if dim==1:
-        "Si la dimension est égale à 1, on prend 2 comme base"
-        return array
-    else:
-        i=0
-        while p<dim:
-            p=Prime[i+1]
-        j=0
-        s=1
-        for s in range(1,dim,1):
-            for j in range(0,nsims,1):
-                array[s,j]=np.sum(toDigits3(j,p,s+1))
-        return norm.ppf(array)
+def faure_base(ndims):
+    """
+    Renvoie la base de la suite de Faure de dimension `ndims` : le plus
+    petit nombre premier supérieur ou égal à `ndims` (et à 2).
+    """
+    nprimes = 1
+    while primes(nprimes)[-1] < ndims:
+        nprimes *= 2
+    allprimes = primes(nprimes)
+    return int(allprimes[np.searchsorted(allprimes, max(ndims, 2))])
+
+@lru_cache(maxsize=None)
+def pascal_matrix(base, ndigits):
+    """
+    Renvoie la matrice de Pascal modulo `base`, de taille
+    `(ndigits, ndigits)`, dont le terme `(i, j)` vaut `C(j, i) mod base`.
+    """
+    res = np.zeros((ndigits, ndigits), dtype=np.int64)
+    res[0, :] = 1
+    for col in range(1, ndigits):
+        res[1:, col] = (res[:-1, col - 1] + res[1:, col - 1]) % base
+    return res
+
+@lru_cache(maxsize=None)
+def faure_matrix(base, ndigits, dim):
+    """
+    Renvoie la matrice génératrice de la dimension `dim` de la suite de
+    Faure en base `base` : la puissance `dim`-ième de la matrice de Pascal
+    modulo `base`, dont le terme `(i, j)` vaut
+    `C(j, i) * dim**(j - i) mod base`.
+    """
+    expo = np.subtract.outer(np.arange(ndigits), np.arange(ndigits)).T
+    powers = np.array([pow(dim, int(e), base) if e >= 0 else 0
+                       for e in expo.ravel()], dtype=np.int64)
+    return pascal_matrix(base, ndigits) * powers.reshape(expo.shape) % base
+
+def faure_points(ndims, nsims, start=0, firstdim=0, base=None):
+    """
+    Renvoie un tableau de taille `(ndims, nsims)` contenant les points
+    `start` à `start + nsims - 1` de la suite de Faure en base `base`,
+    dimensions `firstdim` à `firstdim + ndims - 1`. La base doit être
+    commune à toutes les dimensions utilisées : elle ne peut être omise
+    (elle vaut alors `faure_base(ndims)`) que si `firstdim` est nul.
+
+    Les chiffres en base `base` de tous les indices sont calculés en une
+    fois, puis transformés pour chaque dimension par la matrice génératrice
+    correspondante (cf. `faure_matrix`).
+    """
+    if base is None:
+        if firstdim > 0:
+            # La base par défaut dépendrait des dimensions demandées, et des
+            # tranches de dimensions différentes proviendraient de suites
+            # différentes.
+            raise ValueError("the base of the Faure sequence should be given "\
+                             "when firstdim > 0: fix it from the total "\
+                             "number of dimensions with faure_base.")
+        base = faure_base(ndims)
+    if firstdim + ndims > base:
+        raise ValueError("the Faure sequence in base %d is limited to %d "\
+                         "dimensions." % (base, base))
+    indices = np.arange(start, start + nsims, dtype=np.int64)
+    ndigits = 1
+    while base**ndigits <= start + nsims:
+        ndigits += 1
+    digits = np.empty((ndigits, nsims), dtype=np.int64)
+    for row in range(ndigits):
+        np.divmod(indices, base, out=(indices, digits[row]))
+    weights = float(base) ** -np.arange(1, ndigits + 1)
+    res = np.empty((ndims, nsims))
+    for row in range(ndims):
+        transformed = faure_matrix(base, ndigits, firstdim + row) @ digits
+        res[row] = weights @ (transformed % base)
+    return res
+
+def faureF(nnoises, nsims, start=0, firstdim=0, base=None):
+    """
+    Renvoie un tableau de taille `(nnoises, nsims)` de bruits gaussiens
+    obtenus à partir des points `start + 1` à `start + nsims` de la suite de
+    Faure (le point d'indice 0, nul, est écarté), dimensions `firstdim` à
+    `firstdim + nnoises - 1`.
+
+    La base doit être commune à toutes les dimensions utilisées (cf.
+    `faure_points`) : avec un `QMCStream`, qui affecte des dimensions
+    différentes à chaque date, il faut la fixer (par exemple
+    `partial(faureF, base=faure_base(ndims))`, où `ndims` est le nombre
+    total de dimensions), faute de quoi une erreur est levée dès la
+    deuxième date.
+    """
+    return ndtri(faure_points(nnoises, nsims, start + 1, firstdim, base))
 
 "Suite de Sobol"
 
-def sobolF(nnoises,nsims):
+SOBOL_MAXBIT = 32
+
+@lru_cache(maxsize=None)
+def sobol_directions(ndims):
+    """
+    Renvoie les nombres directeurs de la suite de Sobol pour les `ndims`
+    premières dimensions, sous la forme d'un tableau d'entiers de taille
+    `(ndims, SOBOL_MAXBIT)`.
+
+    Les polynômes primitifs et les nombres directeurs initiaux sont ceux de
+    Joe et Kuo (2008, jusqu'à 21201 dimensions), distribués avec SciPy.
+    """
+    table = np.load(os.path.join(os.path.dirname(scipy.stats.__file__),
+                                 '_sobol_direction_numbers.npz'))
+    if ndims > table['poly'].shape[0]:
+        raise ValueError("the Sobol sequence is limited to %d dimensions." \
+                         % table['poly'].shape[0])
+    poly, vinit = table['poly'], table['vinit']
+    directions = np.empty((ndims, SOBOL_MAXBIT), dtype=np.uint64)
+    directions[0] = 1
+    for dim in range(1, ndims):
+        p = int(poly[dim])
+        deg = p.bit_length() - 1
+        v = [int(x) for x in vinit[dim, :deg]]
+        for j in range(deg, SOBOL_MAXBIT):
+            newv = v[j - deg]
+            for k in range(1, deg + 1):
+                if (p >> (deg - k)) & 1:
+                    newv ^= v[j - k] << k
+            v.append(newv)
+        directions[dim] = v
+    shifts = np.arange(SOBOL_MAXBIT - 1, -1, -1, dtype=np.uint64)
+    return (directions << shifts).astype(np.uint32)
+
+def sobol_integers(directions, nsims, start=0, out=None):
+    """
+    Renvoie les points `start` à `start + nsims - 1` de la suite de Sobol
+    (en ordre de Gray) associée aux nombres directeurs `directions`, sous
+    la forme d'entiers de `SOBOL_MAXBIT` bits, dans le tableau `out` de taille
+    `(len(directions), nsims)` (alloué si nécessaire).
+
+    Le premier point est calculé directement à partir de l'écriture de
+    `start` en code de Gray (saut en `SOBOL_MAXBIT` opérations au plus), les
+    suivants par des « ou exclusifs » cumulés.
+    """
+    if start + nsims > 2**SOBOL_MAXBIT:
+        raise ValueError("the Sobol sequence is limited to 2**%d points." \
+                         % SOBOL_MAXBIT)
+    if out is None:
+        out = np.empty((directions.shape[0], nsims), dtype=np.uint32)
+    gray = start ^ (start >> 1)
+    bits = [j for j in range(SOBOL_MAXBIT) if (gray >> j) & 1]
+    out[:, 0] = np.bitwise_xor.reduce(directions[:, bits], axis=1) \
+        if bits else 0
+    if nsims > 1:
+        indices = np.arange(start + 1, start + nsims, dtype=np.int64)
+        lowbits = indices & -indices
+        ctz = np.frexp(lowbits.astype(float))[1] - 1
+        out[:, 1:] = directions[:, ctz]
+        np.bitwise_xor.accumulate(out, axis=1, out=out)
+    return out
+
+def _reverse_bits(values):
+    "Renverse l'ordre des 32 bits de chacun des entiers de `values`."
+    values = ((values >> 1) & 0x55555555) | ((values & 0x55555555) << 1)
+    values = ((values >> 2) & 0x33333333) | ((values & 0x33333333) << 2)
+    values = ((values >> 4) & 0x0F0F0F0F) | ((values & 0x0F0F0F0F) << 4)
+    values = ((values >> 8) & 0x00FF00FF) | ((values & 0x00FF00FF) << 8)
+    return ((values >> 16) | (values << 16)).astype(np.uint32)
+
+def owen_scramble(values, seeds):
+    """
+    Applique à `values` (entiers de 32 bits) un brouillage d'Owen
+    (« nested uniform scrambling ») par hachage, selon Burley (2020),
+    avec les graines `seeds` (une par ligne de `values`).
+    """
+    seeds = seeds.astype(np.uint32)[:, np.newaxis]
+    with np.errstate(over='ignore'):
+        x = _reverse_bits(values)
+        x ^= x * np.uint32(0x3d20adea)
+        x += seeds
+        x *= (seeds >> np.uint32(16)) | np.uint32(1)
+        x ^= x * np.uint32(0x05526c56)
+        x ^= x * np.uint32(0x53a22864)
+    return _reverse_bits(x)
+
+class SobolSequence:
+    """
+    Bruits gaussiens issus de la suite de Sobol, éventuellement brouillée
+    (décalage digital ou brouillage d'Owen).
+    """
+
+    def __init__(self, scramble=None, seed=None):
+        """
+        Initialise une nouvelle instance de la classe `SobolSequence`.
+
+        Paramètres :
+        ------------
+        scramble : None, 'shift' ou 'owen'
+            Brouillage à appliquer : aucun, décalage digital aléatoire
+            (« ou exclusif » avec un entier aléatoire par dimension) ou
+            brouillage d'Owen.
+        seed : entier positif, optionnel
+            Graine du brouillage ; chaque dimension reçoit toujours le même
+            aléa, quelle que soit la façon dont la suite est découpée.
+        """
+        if scramble not in (None, 'shift', 'owen'):
+            raise ValueError("unknown scrambling method: %s." % scramble)
+        self.scramble = scramble
+        self.seed = seed
+
+    def randomize(self, seed):
+        """
+        Renvoie la suite brouillée (brouillage d'Owen, sauf si un autre
+        brouillage a été choisi) de graine `seed`.
+        """
+        return SobolSequence(self.scramble or 'owen', seed)
+
+    def getkey(self):
+        "Renvoie une chaîne identifiant la suite (cf. `NoiseStore`)."
+        if self.scramble is None:
+            return 'sobol'
+        if self.seed is None:
+            return None
+        return 'sobol%s%d' % (self.scramble, self.seed)
+
+    def getscrambling(self, ndims):
+        "Renvoie les aléas de brouillage des `ndims` premières dimensions."
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed))
+        return rng.integers(0, 2**32, size=ndims, dtype=np.uint32)
+
+    def __call__(self, nnoises, nsims, start=0, firstdim=0, out=None):
+        """
+        Renvoie un tableau de taille `(nnoises, nsims)` (écrit dans `out` si
+        renseigné) de bruits gaussiens obtenus à partir des points `start` à
+        `start + nsims - 1` de la suite (décalés d'un rang en l'absence de
+        brouillage, le point nul étant écarté), dimensions `firstdim` à
+        `firstdim + nnoises - 1`.
+        """
+        directions = sobol_directions(firstdim + nnoises)[firstdim:]
+        if self.scramble is None:
+            start += 1
+        points = sobol_integers(directions, nsims, start)
+        if self.scramble == 'shift':
+            points ^= self.getscrambling(firstdim + nnoises)[firstdim:,
+                                                            np.newaxis]
+        elif self.scramble == 'owen':
+            points = owen_scramble(points,
+                                   self.getscrambling(firstdim + nnoises)[firstdim:])
+        if out is None:
+            out = np.empty((nnoises, nsims))
+        np.add(points, 0.5, out=out)
+        out *= 2.**-SOBOL_MAXBIT
+        return ndtri(out, out=out)
+
+def sobolF(nnoises, nsims, start=0, firstdim=0):
     """
     Renvoie un tableau de valeurs générés par la suite de Sobol
-    de taille (nnoises,nsims)
+    de taille (nnoises,nsims), à partir de son `start + 1`-ième point et
+    de sa dimension `firstdim`.
     """
-    noises = np.empty((nnoises,nsims))
-    #  Utilisation de la fonction sobol_seq.i4_sobol_generate_std_normal
-    # pour générer des variables quasi-aléatoires suivant une loi normale.
-    noises = sobol_seq.i4_sobol_generate_std_normal(nnoises, nsims)
-    noises=np.transpose(noises)
-    return noises
+    return SobolSequence()(nnoises, nsims, start, firstdim)
 
 "Stratification"
 
-def stratified_sampling1(M,nsims):
-    array=np.empty(nsims)
-    array=lh.sample(M,nsims)
-    array=norm.ppf(array)
-    return array.reshape(M,nsims)
+class StratifiedStream(RandomStream):
+    r"""
+    Stratification des trajectoires selon une direction de l'espace des
+    bruits indépendants : la projection :math:`\xi = u \cdot Z` des bruits
+    d'une trajectoire (toutes dates confondues) sur la direction unitaire
+    :math:`u` est gaussienne, et son domaine est découpé en `len(counts)`
+    strates équiprobables. Les simulations sont rangées par strate : les
+    `counts[0]` premières appartiennent à la première strate, etc.
 
-def stratified_sampling2(nnoises,nsims):
-    """On divise l'intervalle [0,1] en plusieurs stratas, m stratas"""
-    noises = np.empty((nnoises,nsims))
-    m=int(nnoises/nsims)
-    i=0
-    """Pour chaque strata, on prend l échantillons suivant la loi uniforme
-    tel que nsims=m*l et enfin on prend le pdf du cdf."""
-    for i in range(m+1,1):
-        noises[i,:]=norm.ppf(np.random.uniform(i/m,(i+1)/m,nsims))
-    return noises
+    Les bruits d'une trajectoire sont obtenus à partir de ceux du flux
+    `stream` (:math:`Z'`) en remplaçant leur composante selon :math:`u` par
+    un tirage conditionnel dans la strate de la simulation :
+    :math:`Z = Z' + u (\xi - u \cdot Z')`, où
+    :math:`\xi = \Phi^{-1}((j + \Phi(u \cdot Z')) / m)` pour la strate
+    :math:`j` parmi :math:`m`.
+    """
 
-def stratified_sampling3(l,nsims):
-    """On divisie l'intervalle [0,1] en plusieurs stratas, m stratas"""
-    """m=500"""
-    m=5000
-    l=nsims/m
-    noises=np.empty((l,nsims))
-    for i in range(0,m,1):
-        noises[:,i]=norm.ppf(np.random.uniform(i/m,(i+1)/m,l))
-    return noises
+    def __init__(self, stream, direction, counts):
+        """
+        Initialise une nouvelle instance de la classe `StratifiedStream`.
 
-def stratified_sampling4(M,nsims):
-    L=nsims/M
-    i=0
-    noises=np.empty((M,nsims))
-    for i in range(M):
-        noises[i,:]=norm.ppf(np.random.uniform(i/M,(i+1)/M,nsims))
-    return noises
+        Paramètres :
+        ------------
+        stream : RandomStream
+            Flux de bruits indépendants à stratifier.
+        direction : matrice
+            Direction de stratification, de taille `(nsteps, nnoises)` : la
+            ligne `step` porte sur les bruits de la date de rang `step` ;
+            les dates de rang supérieur ne sont pas stratifiées. La
+            direction est normalisée.
+        counts : vecteur d'entiers
+            Nombre de simulations allouées à chaque strate ; leur somme
+            est le nombre total de simulations.
+        """
+        direction = np.asarray(direction, dtype=float)
+        norm2 = np.sqrt(np.square(direction).sum())
+        if norm2 == 0.:
+            raise ValueError("the stratification direction should not be "\
+                             "null.")
+        self.stream = stream
+        self.direction = direction / norm2
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.bounds = np.concatenate(([0], np.cumsum(self.counts)))
+        self._projection = None
+
+    @property
+    def nstrata(self):
+        "Nombre de strates."
+        return len(self.counts)
+
+    def getstrata(self, start, nsims):
+        """
+        Renvoie les indices des strates des simulations d'indices `start`
+        à `start + nsims - 1`.
+        """
+        indices = np.arange(start, start + nsims)
+        if start + nsims > self.bounds[-1]:
+            raise ValueError("the simulation indices exceed the allocated "\
+                             "number of simulations.")
+        return np.searchsorted(self.bounds, indices, side='right') - 1
+
+    def getweights(self, start, nsims):
+        """
+        Renvoie les poids des simulations d'indices `start` à
+        `start + nsims - 1` : rapport de la probabilité de leur strate et
+        de la proportion des simulations qui lui sont allouées.
+        """
+        ratios = self.bounds[-1] / (self.nstrata * self.counts)
+        return ratios[self.getstrata(start, nsims)]
+
+    def getshift(self, nnoises, nsims, start):
+        r"""
+        Renvoie, pour les simulations d'indices `start` à
+        `start + nsims - 1`, l'écart :math:`\xi - u \cdot Z'` à ajouter à
+        la composante des bruits selon la direction de stratification.
+        """
+        if self._projection is not None \
+           and self._projection[:2] == (start, nsims):
+            return self._projection[2]
+        projection = np.zeros(nsims)
+        for step, row in enumerate(self.direction):
+            if row.any():
+                projection += row @ self.stream(nnoises, nsims, start=start,
+                                                step=step)
+        strata = self.getstrata(start, nsims)
+        xi = ndtri((strata + ndtr(projection)) / self.nstrata)
+        shift = xi - projection
+        self._projection = (start, nsims, shift)
+        return shift
+
+    def randomize(self, seed):
+        """
+        Renvoie une version aléatoire (cf. `randomize`) du flux, dont seul
+        le flux sous-jacent est randomisé.
+        """
+        return StratifiedStream(randomize(self.stream, seed), self.direction,
+                                self.counts)
+
+    def __call__(self, nnoises, nsims, start=0, step=0):
+        noises = self.stream(nnoises, nsims, start=start, step=step)
+        if step < len(self.direction) and self.direction[step].any():
+            shift = self.getshift(nnoises, nsims, start)
+            noises = noises + np.multiply.outer(self.direction[step], shift)
+        return noises
+
+def allocate(scores, nsims, minimum=2):
+    """
+    Répartit `nsims` simulations entre des strates proportionnellement à
+    `scores` (méthode des plus forts restes), avec au moins `minimum`
+    simulations par strate.
+
+    Avec des strates équiprobables, des scores constants donnent
+    l'allocation proportionnelle ; des scores égaux aux écarts-types des
+    payoffs dans chaque strate donnent l'allocation optimale de Neyman.
+    """
+    scores = np.asarray(scores, dtype=float)
+    nstrata = len(scores)
+    if nstrata * minimum > nsims:
+        raise ValueError("too many strata for the number of simulations.")
+    if scores.sum() <= 0.:
+        scores = np.ones(nstrata)
+    target = (nsims - nstrata * minimum) * scores / scores.sum()
+    counts = np.floor(target).astype(np.int64)
+    remainder = nsims - nstrata * minimum - counts.sum()
+    counts[np.argsort(counts - target)[:remainder]] += 1
+    return counts + minimum
 
 def stratified_samplingF(dim,nsims):
     "Latin Hypercube Sample, une forme efficient de stratification à plusieurs dimensions"
@@ -0,0 +1,77 @@
+import numpy as np
+
+class Paths:
+    "Trajectoires simulées d'un ensemble de marchés sur une grille de dates."
+
+    def __init__(self, markets, dates, scenarios=None):
+        """
+        Initialise une nouvelle instance de la classe `Paths` en simulant
+        les marchés `markets` sur toute la grille `dates`.
+
+        Les prix spot sont stockés dans un unique tableau `values` de taille
+        `(nrows, len(dates), nsims)`, où chaque marché occupe une ligne par
+        actif modélisé (une seule pour `BlackScholesModel`, `numbersU` pour
+        `MultiAssetsBlackScholesModel`). Si `scenarios` est renseigné, un
+        axe des scénarios est inséré avant l'axe des simulations, de sorte
+        que les payoffs évalués sur les trajectoires le soient pour tous
+        les scénarios à la fois.
+
+        Paramètres :
+        ------------
+        markets
+            Liste des marchés à simuler.
+        dates
+            Grille de dates, triée par ordre croissant.
+        scenarios : Scenarios, optionnel
+            Chocs à appliquer aux paramètres des marchés, tous les
+            scénarios étant simulés à partir des mêmes bruits.
+        """
+        self.dates = list(dates)
+        self.dateindex = {date: idx for idx, date in enumerate(self.dates)}
+        self.rowindex = {}
+        self.nrows = {}
+        spots = []
+        dfs = {}
+        ndim = 2 if scenarios is None else 3
+        for market in markets:
+            if scenarios is None:
+                spot = market.getspotpaths(self.dates)
+                dfs[market.name] = market.getdfpaths(self.dates)
+            else:
+                shocks = scenarios.getshocks(market)
+                spot = market.getscenariopaths(self.dates, *shocks)
+                dfs[market.name] = market.getscenariodfpaths(self.dates,
+                                                             shocks[2])
+            if spot.ndim == ndim:
+                spot = spot[np.newaxis]
+            self.nrows[market.name] = spot.shape[0]
+            for index in range(spot.shape[0]):
+                self.rowindex[(market.name, index)] = len(spots)
+                spots.append(spot[index])
+        self.values = np.stack(spots) if spots else None
+        self.dfs = dfs
+
+    def getspot(self, market, date, index=0):
+        """
+        Renvoie le prix spot simulé du marché `market` (de l'actif
+        `index` pour les marchés multi-actifs) à la date `date`.
+        """
+        row = self.rowindex[(market.name, index)]
+        return self.values[row, self.dateindex[date]]
+
+    def getspots(self, market, date):
+        """
+        Renvoie les prix spot simulés de tous les actifs du marché `market`
+        à la date `date`, sous la forme d'un tableau de taille
+        `(nactifs, ...)` (les lignes d'un même marché étant contiguës).
+        """
+        row = self.rowindex[(market.name, 0)]
+        nrows = self.nrows[market.name]
+        return self.values[row:row + nrows, self.dateindex[date]]
+
+    def getdf(self, market, date):
+        """
+        Renvoie le facteur d'actualisation du marché `market` à la date
+        `date`.
+        """
+        return self.dfs[market.name][self.dateindex[date]]
@@ -1,10 +1,143 @@
 import numpy as np
-from efficientmc.utils import timecached, DateCache
+from functools import lru_cache
+from efficientmc.utils import timecached, DateCache, getdtype, getbuffer
+
+class IncrementalConstruction:
+    """
+    Construction classique d'un mouvement brownien sur une grille de dates :
+    le `k`-ième bruit donne l'accroissement entre les dates `k - 1` et `k`.
+    """
+
+    def __init__(self, dates):
+        """
+        Initialise une nouvelle instance de la classe
+        `IncrementalConstruction` pour la grille `dates` (triée par ordre
+        croissant).
+        """
+        self.dates = np.asarray(dates, dtype=float)
+        self.stddevs = np.sqrt(np.diff(self.dates, prepend=0.))
+
+    def build(self, noises):
+        """
+        Renvoie les valeurs du mouvement brownien aux dates de la grille,
+        construites à partir des bruits gaussiens indépendants `noises`
+        (dont le premier axe correspond aux dimensions de la construction).
+        """
+        stddevs = self.stddevs.astype(noises.dtype).reshape(
+            (-1,) + (1,) * (noises.ndim - 1))
+        return np.cumsum(stddevs * noises, axis=0)
+
+class BrownianBridge(IncrementalConstruction):
+    """
+    Construction d'un mouvement brownien par pont brownien : le premier
+    bruit donne la valeur à la dernière date de la grille, les suivants
+    remplissent récursivement les dates intermédiaires (par dichotomie) en
+    conditionnant par les valeurs déjà construites. Les premières
+    dimensions, les plus efficaces des suites quasi-aléatoires, portent
+    ainsi l'essentiel de la variance des trajectoires.
+    """
+
+    def __init__(self, dates):
+        """
+        Initialise une nouvelle instance de la classe `BrownianBridge` pour
+        la grille `dates` (triée par ordre croissant).
+        """
+        self.dates = np.asarray(dates, dtype=float)
+        ndates = len(self.dates)
+        # Pour chaque dimension : date construite, dates encadrantes déjà
+        # construites (-1 pour l'origine des temps) et coefficients.
+        self.steps = []
+        if ndates == 0:
+            return
+        self.steps.append((ndates - 1, -1, -1, 0., 0.,
+                           float(np.sqrt(self.dates[-1]))))
+        intervals = [(-1, ndates - 1)]
+        while intervals:
+            left, right = intervals.pop(0)
+            if right - left < 2:
+                continue
+            mid = (left + right + 1) // 2
+            tleft = self.dates[left] if left >= 0 else 0.
+            tmid, tright = self.dates[mid], self.dates[right]
+            span = tright - tleft
+            # Coefficients convertis en flottants Python, qui n'imposent pas
+            # leur précision aux bruits (cf. `setdtype`).
+            self.steps.append((mid, left, right,
+                               float((tright - tmid) / span),
+                               float((tmid - tleft) / span),
+                               float(np.sqrt((tmid - tleft) * (tright - tmid) \
+                                             / span))))
+            intervals += [(left, mid), (mid, right)]
+
+    def build(self, noises):
+        res = np.empty_like(noises)
+        for dim, (date, left, right, wleft, wright, stddev) in \
+                enumerate(self.steps):
+            res[date] = stddev * noises[dim]
+            if left >= 0:
+                res[date] += wleft * res[left]
+            if right >= 0:
+                res[date] += wright * res[right]
+        return res
+
+class PCAConstruction(IncrementalConstruction):
+    """
+    Construction d'un mouvement brownien par analyse en composantes
+    principales : le `k`-ième bruit est associé au `k`-ième vecteur propre
+    (par valeur propre décroissante) de la matrice de covariance
+    :math:`\min(t_i, t_j)` des valeurs du mouvement brownien sur la grille.
+    """
+
+    def __init__(self, dates):
+        """
+        Initialise une nouvelle instance de la classe `PCAConstruction`
+        pour la grille `dates` (triée par ordre croissant).
+        """
+        self.dates = np.asarray(dates, dtype=float)
+        eigvals, eigvecs = np.linalg.eigh(np.minimum.outer(self.dates,
+                                                           self.dates))
+        order = np.argsort(eigvals)[::-1]
+        self.matrix = eigvecs[:, order] * np.sqrt(np.maximum(eigvals[order],
+                                                             0.))
+
+    def build(self, noises):
+        return np.tensordot(self.matrix.astype(noises.dtype, copy=False),
+                            noises, axes=1)
+
+CONSTRUCTIONS = {'incremental': IncrementalConstruction,
+                 'bridge': BrownianBridge,
+                 'pca': PCAConstruction}
+
+@lru_cache(maxsize=32)
+def getconstruction(name, dates):
+    """
+    Renvoie la construction de trajectoires `name` ('incremental',
+    'bridge' ou 'pca') associée à la grille `dates` (tuple trié).
+    """
+    return CONSTRUCTIONS[name](dates)
+
+def brownianpaths(construction, dates, noises):
+    """
+    Renvoie les valeurs d'un mouvement brownien aux dates `dates` (dans un
+    ordre quelconque), construites selon `construction` à partir des bruits
+    `noises`, dont la `k`-ième ligne est affectée à la `k`-ième dimension de
+    la construction.
+    """
+    dates = np.asarray(dates, dtype=float)
+    order = np.argsort(dates, kind='stable')
+    if np.any(dates[order] < 0.):
+        raise ValueError("dates should be positive.")
+    paths = getconstruction(construction or 'incremental',
+                            tuple(dates[order])).build(noises)
+    res = np.empty_like(paths)
+    res[order] = paths
+    return res
 
 class BlackScholesModel:
     "Modèle de Black-Scholes : :math:`\frac{dS_t}{S_t} = r dt + \sigma dW_t`."
 
-    def __init__(self, name, initvalue, rate, sigma, randomgen):
+    def __init__(self, name, initvalue, rate, sigma, randomgen,
+                 construction=None):
         """
         Initialise une nouvelle instance de la classe `BlackScholesModel`,
         de dynamique :
@@ -23,13 +156,24 @@ class BlackScholesModel:
         randomgen
             Générateur aléatoire permettant de simuler des bruits
             gaussiens.
+        construction : None, 'incremental', 'bridge' ou 'pca'
+            Construction des trajectoires. Par défaut, chaque date est
+            simulée à partir de la précédente, et les dates doivent donc
+            être simulées par ordre croissant. Sinon, la trajectoire est
+            construite d'un bloc sur toute la grille renseignée par
+            `setgrid` (cf. `IncrementalConstruction`, `BrownianBridge` et
+            `PCAConstruction`), et les dates peuvent être simulées dans un
+            ordre quelconque.
         """
         self.name = name
         self.initvalue = initvalue
         self.rate = rate
         self.sigma = sigma
         self.randomgen = randomgen
+        self.construction = construction
         self.cache = DateCache()
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
+        self.setgrid([])
 
     def getdates(self):
         """
@@ -42,21 +186,134 @@ class BlackScholesModel:
         "Renvoie les identifiants des bruits associés au modèle."
         return (self.name,)
 
+    def setgrid(self, dates):
+        """
+        Renseigne la grille complète des dates à simuler, utilisée lorsque
+        les trajectoires sont construites d'un bloc (cf. `construction`).
+        """
+        self.grid = sorted(dates)
+        self.gridindex = {date: idx for idx, date in enumerate(self.grid)}
+        self._gridpaths = None
+
+    def getgridpaths(self):
+        """
+        Renvoie les trajectoires simulées sur toute la grille `self.grid`,
+        sous la forme d'un tableau de taille `(len(self.grid), nsims)` ; les
+        trajectoires ne sont reconstruites que lorsque le générateur fournit
+        de nouveaux bruits.
+        """
+        noises = self.randomgen.getallpathnoises(self.grid)
+        if self._gridpaths is None or self._gridpaths[0] is not noises:
+            self._gridpaths = (noises, self.simulatepaths(self.grid))
+        return self._gridpaths[1]
+
     @timecached
     def simulate(self, date):
         "Simule le modèle à la date `date`."
+        if self.construction is not None:
+            if date not in self.gridindex:
+                raise ValueError("date %s is not in the simulation grid." \
+                                 % date)
+            return self.getgridpaths()[self.gridindex[date]]
         try:
             prevdate, prevvalues = self.cache.getprev('simulate')
         except KeyError as e:
             prevdate = 0.
             prevvalues = 1.
         if date < prevdate:
-            raise NotImplementedError("brownian bridge not implemented.")
+            raise ValueError("dates should be simulated in increasing order "\
+                             "unless a path construction is used.")
         dt = date - prevdate
         noises = self.randomgen.getnoises(date, self.getnoisekeys()).squeeze()
-        incr = np.exp((self.rate - 0.5 * self.sigma**2) * dt \
-                      + self.sigma * np.sqrt(dt) * noises)
-        return prevvalues * incr
+        # Coefficients convertis dans le type des bruits (cf. `setdtype`).
+        scalar = noises.dtype.type
+        # Calcul en place dans l'un des deux tampons alternés de l'espace de
+        # travail, jamais dans celui qui contient `prevvalues` (ce qui peut
+        # arriver si la valeur de la date a été évincée du cache).
+        values = getbuffer(self, 'simulate', noises.shape, noises.dtype, 2)
+        if values is prevvalues:
+            values = getbuffer(self, 'simulate', noises.shape, noises.dtype, 2)
+        np.multiply(noises, scalar(self.sigma * np.sqrt(dt)), out=values)
+        values += scalar((self.rate - 0.5 * self.sigma**2) * dt)
+        np.exp(values, out=values)
+        values *= prevvalues
+        return values
+
+    def simulatepaths(self, dates):
+        """
+        Simule le modèle sur toute la grille `dates` (dans un ordre
+        quelconque) en une seule passe, selon la construction
+        `self.construction` ; renvoie un tableau de taille
+        `(len(dates), nsims)`.
+        """
+        dates = np.asarray(dates, dtype=float)
+        paths = self.getbrownianpaths(dates)
+        paths *= self.sigma
+        paths += ((self.rate - 0.5 * self.sigma**2) * dates)[:, np.newaxis]
+        return np.exp(paths, out=paths)
+
+    def getbrownianpaths(self, dates):
+        """
+        Renvoie les valeurs du mouvement brownien qui dirige le modèle sur
+        toute la grille `dates` (dans un ordre quelconque), construites
+        selon `self.construction`, sous la forme d'un tableau de taille
+        `(len(dates), nsims)`.
+        """
+        dates = np.asarray(dates, dtype=float)
+        noises = self.randomgen.getpathnoises(sorted(dates),
+                                              self.getnoisekeys())[:, 0, :]
+        return brownianpaths(self.construction, dates, noises)
+
+    def getscenariopaths(self, dates, spot, vol, rate):
+        """
+        Renvoie les prix spot simulés sur toute la grille `dates` pour
+        chacun des scénarios de chocs, tous construits à partir des mêmes
+        bruits, sous la forme d'un tableau de taille
+        `(len(dates), nscenarios, nsims)`.
+
+        Paramètres :
+        ------------
+        dates
+            Grille de dates.
+        spot : vecteur
+            Chocs relatifs sur le prix initial.
+        vol : vecteur
+            Chocs absolus sur la volatilité.
+        rate : vecteur
+            Chocs absolus sur le taux.
+        """
+        return _scenariopaths(self.getbrownianpaths(dates), dates,
+                              self.initvalue * (1. + np.asarray(spot)),
+                              self.sigma + np.asarray(vol),
+                              self.rate + np.asarray(rate))
+
+    def getscenariodfpaths(self, dates, rate):
+        """
+        Renvoie les facteurs d'actualisation aux dates `dates` pour chacun
+        des chocs de taux `rate`, sous la forme d'un tableau de taille
+        `(len(dates), nscenarios, 1)`.
+        """
+        rates = self.rate + np.asarray(rate, dtype=float)
+        return np.exp(-np.multiply.outer(np.asarray(dates, dtype=float),
+                                         rates))[:, :, np.newaxis].astype(
+                                             getdtype())
+
+    def getspotpaths(self, dates):
+        """
+        Renvoie les prix spot simulés sur toute la grille `dates`, sous la
+        forme d'un tableau de taille `(len(dates), nsims)`.
+        """
+        paths = self.simulatepaths(dates)
+        paths *= self.initvalue
+        return paths
+
+    def getdfpaths(self, dates):
+        """
+        Renvoie les facteurs d'actualisation aux dates `dates` (par rapport
+        à l'origine des temps).
+        """
+        return np.exp(-self.rate * np.asarray(dates, dtype=float)).astype(
+            getdtype())
 
     @timecached
     def getdf(self, date):
@@ -64,12 +321,48 @@ class BlackScholesModel:
         Renvoie le facteur d'actualisation à la date `date` (par rapport
         à l'origine des temps).
         """
-        return np.exp(-self.rate * date)
+        return getdtype().type(np.exp(-self.rate * date))
 
     @timecached
     def getspot(self, date):
         "Renvoie le prix spot à la date `date`."
-        return self.initvalue * self.simulate(date)
+        values = self.simulate(date)
+        return np.multiply(values, values.dtype.type(self.initvalue),
+                           out=getbuffer(self, 'getspot', values.shape,
+                                         values.dtype))
+
+    def getspotmean(self, date):
+        """
+        Renvoie l'espérance (risque-neutre) du prix spot à la date `date`,
+        connue analytiquement (cf. `getdelta`).
+        """
+        return self.initvalue * np.exp(self.rate * date)
+
+    @timecached
+    def getbrownian(self, date):
+        """
+        Renvoie la valeur à la date `date` du mouvement brownien
+        :math:`W_t` qui dirige le modèle.
+        """
+        return (np.log(self.simulate(date)) \
+                - (self.rate - 0.5 * self.sigma**2) * date) / self.sigma
+
+    @timecached
+    def getspotderivative(self, date, param):
+        """
+        Renvoie la dérivée trajectorielle du prix spot à la date `date` par
+        rapport au paramètre `param` du modèle : 'delta' (prix initial),
+        'vega' (volatilité) ou 'rho' (taux).
+        """
+        return _spotderivative(param, self.getspot(date), self.initvalue,
+                               self.sigma, self.getbrownian(date), date)
+
+    def getdfderivative(self, date, param):
+        """
+        Renvoie la dérivée du facteur d'actualisation à la date `date` par
+        rapport au paramètre `param` du modèle.
+        """
+        return -date * self.getdf(date) if param == 'rho' else 0.
 
     @timecached
     def getfwd(self, date, maturity):
@@ -81,40 +374,51 @@ class BlackScholesModel:
                                   "forward model.")
         
 class MultiAssetsBlackScholesModel:
-    "Modèle de Black-Scholes pour plusieurs actifs : :math:`\frac{dS_t^i}{S_t^i} = r_i dt + \sigma dW_t^i`."
+    "Modèle de Black-Scholes pour plusieurs actifs : :math:`\frac{dS_t^i}{S_t^i} = r dt + \sigma_i dW_t^i`."
 
-    def __init__(self, name, numbersU, initvalue, rate, sigma, randomgen):
+    def __init__(self, name, numbersU, initvalue, rate, sigma, randomgen,
+                 construction=None):
         """
-        Initialise une nouvelle instance de la classe `BlackScholesModel`,
-        de dynamique :
-            :math:`\frac{dS_t^i}{S_t^i} = r_i dt + \sigma dW_t^i`
+        Initialise une nouvelle instance de la classe
+        `MultiAssetsBlackScholesModel`, de dynamique :
+            :math:`\frac{dS_t^i}{S_t^i} = r dt + \sigma_i dW_t^i`
+
+        Les actifs sont simulés ensemble, sous la forme de tableaux de
+        taille `(numbersU, nsims)`. Le brownien :math:`W^i` de l'actif `i`
+        (numéroté à partir de 1) est dirigé par le bruit d'identifiant
+        `"%s%d" % (name, i)` du générateur, dont la matrice de corrélation
+        donne celle des actifs (cf. `getnoisekeys`).
 
         Paramètres :
         ------------
         name
             Identifiant associé à l'instance.
         numbersU: int
-            Nombre d'actifs choisis pour le panier
-        initvalue : flottant
-            Valeur initiale de l'actif (:math:`S_0`) de chaque actif
+            Nombre d'actifs à modéliser.
+        initvalue : vecteur
+            Valeur initiale (:math:`S^i_0`) de chaque actif.
         rate : flottant
             Taux court (:math:`r`).
-        sigma : flottant, positif
-            Volatilité (:math:`\sigma`) de chaque actif
-        numbersU:
-            Nombre d'actifs à modéliser
+        sigma : vecteur, positif
+            Volatilité (:math:`\sigma_i`) de chaque actif.
         randomgen
             Générateur aléatoire permettant de simuler des bruits
             gaussiens.
+        construction : None, 'incremental', 'bridge' ou 'pca'
+            Construction des trajectoires (cf. `BlackScholesModel`).
         """
         self.name = name
         self.numbersU = numbersU
-        self.initvalue = initvalue
+        self.initvalue = np.broadcast_to(np.asarray(initvalue, dtype=float),
+                                         (numbersU,))
         self.rate = rate
-        self.sigma = sigma
+        self.sigma = np.broadcast_to(np.asarray(sigma, dtype=float),
+                                     (numbersU,))
         self.randomgen = randomgen
+        self.construction = construction
         self.cache = DateCache()
-    
+        self.workspace = None # Renseigné par `runmc` (cf. `Workspace`).
+        self.setgrid([])
 
     def getdates(self):
         """
@@ -124,24 +428,126 @@ class MultiAssetsBlackScholesModel:
         return [] # Pas besoin de schéma de discrétisation.
 
     def getnoisekeys(self):
-        "Renvoie les identifiants des bruits associés au modèle."
-        return (self.name,)
-    
+        """
+        Renvoie les identifiants des bruits associés aux actifs du modèle :
+        `"%s%d" % (self.name, i)` pour l'actif `i` (à partir de 1).
+        """
+        return tuple("%s%d" % (self.name, i + 1)
+                     for i in range(self.numbersU))
+
+    def getcorrmatrix(self):
+        """
+        Renvoie la matrice de corrélation des browniens des différents
+        actifs, extraite de celle du générateur.
+        """
+        idx = [self.randomgen.keyindex[key] for key in self.getnoisekeys()]
+        return np.asarray(self.randomgen.corrmatrix, dtype=float)[
+            np.ix_(idx, idx)]
+
+    setgrid = BlackScholesModel.setgrid
+
+    def getgridpaths(self):
+        """
+        Renvoie les trajectoires de chacun des actifs simulées sur toute la
+        grille `self.grid`, sous la forme d'un tableau de taille
+        `(numbersU, len(self.grid), nsims)`.
+        """
+        return BlackScholesModel.getgridpaths(self)
+
     @timecached
-    def simulate(self, date,index=0):
-        "Simule le modèle de l'actif i=index à la date `date`."
+    def simulate(self, date):
+        """
+        Simule le modèle de tous les actifs à la date `date` ; renvoie un
+        tableau de taille `(numbersU, nsims)`.
+        """
+        if self.construction is not None:
+            if date not in self.gridindex:
+                raise ValueError("date %s is not in the simulation grid." \
+                                 % date)
+            return self.getgridpaths()[:, self.gridindex[date]]
         try:
             prevdate, prevvalues = self.cache.getprev('simulate')
         except KeyError as e:
             prevdate = 0.
             prevvalues = 1.
         if date < prevdate:
-            raise NotImplementedError("brownian bridge not implemented.")
+            raise ValueError("dates should be simulated in increasing order "\
+                             "unless a path construction is used.")
         dt = date - prevdate
-        noises = self.randomgen.getnoises(date, self.getnoisekeys()).squeeze()
-        incr = np.exp((self.rate - 0.5 * self.sigma[index]**2) * dt \
-            + self.sigma[index] * np.sqrt(dt)*noises)
-        return incr*prevvalues
+        noises = self.randomgen.getnoises(date, self.getnoisekeys())
+        sigma = self.sigma[:, np.newaxis]
+        # Calcul en place (cf. `BlackScholesModel.simulate`).
+        values = getbuffer(self, 'simulate', noises.shape, noises.dtype, 2)
+        if values is prevvalues:
+            values = getbuffer(self, 'simulate', noises.shape, noises.dtype, 2)
+        np.multiply(noises, (sigma * np.sqrt(dt)).astype(noises.dtype),
+                    out=values)
+        values += ((self.rate - 0.5 * sigma**2) * dt).astype(noises.dtype)
+        np.exp(values, out=values)
+        values *= prevvalues
+        return values
+
+    def simulatepaths(self, dates):
+        """
+        Simule le modèle de chacun des actifs sur toute la grille `dates`
+        (dans un ordre quelconque) en une seule passe, selon la construction
+        `self.construction` ; renvoie un tableau de taille
+        `(numbersU, len(dates), nsims)`.
+        """
+        dates = np.asarray(dates, dtype=float)
+        brownian = np.moveaxis(self.getbrownianpaths(dates), 1, 0)
+        sigma = self.sigma.astype(brownian.dtype)[:, np.newaxis, np.newaxis]
+        paths = sigma * brownian
+        paths += (self.rate - 0.5 * sigma**2) * dates[:, np.newaxis]
+        return np.exp(paths, out=paths)
+
+    def getbrownianpaths(self, dates):
+        """
+        Renvoie les valeurs des browniens qui dirigent les actifs sur toute
+        la grille `dates` (dans un ordre quelconque), construites selon
+        `self.construction`, sous la forme d'un tableau de taille
+        `(len(dates), numbersU, nsims)`.
+        """
+        dates = np.asarray(dates, dtype=float)
+        noises = self.randomgen.getpathnoises(sorted(dates),
+                                              self.getnoisekeys())
+        return brownianpaths(self.construction, dates, noises)
+
+    def getspotpaths(self, dates):
+        """
+        Renvoie les prix spot de chacun des actifs simulés sur toute la
+        grille `dates`, sous la forme d'un tableau de taille
+        `(numbersU, len(dates), nsims)`.
+        """
+        paths = self.simulatepaths(dates)
+        paths *= self.initvalue[:, np.newaxis, np.newaxis]
+        return paths
+
+    def getscenariopaths(self, dates, spot, vol, rate):
+        """
+        Renvoie les prix spot de chacun des actifs simulés sur toute la
+        grille `dates` pour chacun des scénarios de chocs (cf.
+        `BlackScholesModel.getscenariopaths`, les chocs étant appliqués à
+        tous les actifs), sous la forme d'un tableau de taille
+        `(numbersU, len(dates), nscenarios, nsims)`.
+        """
+        brownian = self.getbrownianpaths(dates)
+        return np.stack([
+            _scenariopaths(brownian[:, i], dates,
+                           self.initvalue[i] * (1. + np.asarray(spot)),
+                           self.sigma[i] + np.asarray(vol),
+                           self.rate + np.asarray(rate))
+            for i in range(self.numbersU)])
+
+    getscenariodfpaths = BlackScholesModel.getscenariodfpaths
+
+    def getdfpaths(self, dates):
+        """
+        Renvoie les facteurs d'actualisation aux dates `dates` (par rapport
+        à l'origine des temps).
+        """
+        return np.exp(-self.rate * np.asarray(dates, dtype=float)).astype(
+            getdtype())
 
     @timecached
     def getdf(self, date):
@@ -149,14 +555,55 @@ class MultiAssetsBlackScholesModel:
         Renvoie le facteur d'actualisation à la date `date` (par rapport
         à l'origine des temps).
         """
-        return np.exp(-self.rate * date)
+        return getdtype().type(np.exp(-self.rate * date))
 
     @timecached
-    def getspot(self, date,index=0):
-        "Renvoie le prix spot de l'actif i=index à la date `date`. de chaque actif"
-        spot = self.initvalue[index]*self.simulate(date,index)
-        return  spot
-        
+    def getspots(self, date):
+        """
+        Renvoie les prix spot de tous les actifs à la date `date`, sous la
+        forme d'un tableau de taille `(numbersU, nsims)`.
+        """
+        values = self.simulate(date)
+        initvalue = self.initvalue.astype(values.dtype)[:, np.newaxis]
+        return np.multiply(initvalue, values,
+                           out=getbuffer(self, 'getspots', values.shape,
+                                         values.dtype))
+
+    def getspot(self, date, index=0):
+        "Renvoie le prix spot de l'actif i=index à la date `date`."
+        return self.getspots(date)[index]
+
+    def getspotmean(self, date, index=0):
+        """
+        Renvoie l'espérance (risque-neutre) du prix spot de l'actif
+        i=index à la date `date`, connue analytiquement (cf. `getdelta`).
+        """
+        return float(self.initvalue[index]) * np.exp(self.rate * date)
+
+    @timecached
+    def getbrownian(self, date, index=0):
+        """
+        Renvoie la valeur à la date `date` du mouvement brownien
+        :math:`W^i_t` qui dirige l'actif i=index.
+        """
+        sigma = float(self.sigma[index])
+        return (np.log(self.simulate(date)[index]) \
+                - (self.rate - 0.5 * sigma**2) * date) / sigma
+
+    @timecached
+    def getspotderivative(self, date, param, index=0):
+        """
+        Renvoie la dérivée trajectorielle du prix spot de l'actif i=index à
+        la date `date` par rapport au paramètre `param` de cet actif :
+        'delta' (prix initial), 'vega' (volatilité) ou 'rho' (taux, commun
+        à tous les actifs).
+        """
+        return _spotderivative(param, self.getspot(date, index),
+                               float(self.initvalue[index]),
+                               float(self.sigma[index]),
+                               self.getbrownian(date, index), date)
+
+    getdfderivative = BlackScholesModel.getdfderivative
 
     @timecached
     def getfwd(self, date, maturity):
@@ -167,3 +614,55 @@ class MultiAssetsBlackScholesModel:
         raise NotImplementedError("the MultiAssetsBlack-Scholes model is not a "\
                                   "forward model.")
 
+def _scenariopaths(brownian, dates, initvalue, sigma, rate):
+    r"""
+    Renvoie les prix spot :math:`S_0 \exp((r - \sigma^2 / 2) t + \sigma W_t)`
+    de taille `(len(dates), nscenarios, nsims)` obtenus à partir des
+    trajectoires browniennes `brownian` pour chacun des jeux de paramètres
+    `(initvalue, sigma, rate)` (vecteurs de taille `nscenarios`).
+    """
+    dates = np.asarray(dates, dtype=float)[:, np.newaxis, np.newaxis]
+    sigma = np.asarray(sigma, dtype=brownian.dtype)[:, np.newaxis]
+    paths = brownian[:, np.newaxis, :] * sigma
+    paths += (np.asarray(rate, dtype=float)[:, np.newaxis] \
+              - 0.5 * sigma**2) * dates
+    np.exp(paths, out=paths)
+    paths *= np.asarray(initvalue, dtype=float)[:, np.newaxis]
+    return paths
+
+def _spotderivative(param, spot, initvalue, sigma, brownian, date):
+    r"""
+    Renvoie la dérivée trajectorielle du prix spot
+    :math:`S_t = S_0 \exp((r - \sigma^2 / 2) t + \sigma W_t)` par rapport
+    au paramètre `param` ('delta', 'vega' ou 'rho').
+    """
+    if param == 'delta':
+        return spot / initvalue
+    elif param == 'vega':
+        return spot * (brownian - sigma * date)
+    elif param == 'rho':
+        return spot * date
+    raise ValueError("unknown parameter %s." % param)
+
+def getscores(markets, date):
+    """
+    Renvoie, pour chacun des marchés `markets` (modèles de Black-Scholes à
+    un seul bruit), la dérivée par rapport à son prix initial du logarithme
+    de la densité jointe des prix spot de tous les marchés à la date `date`
+    (fonction score, utilisée par la méthode du rapport de vraisemblance).
+    Les browniens des marchés qui partagent un générateur sont corrélés
+    selon sa matrice de corrélation.
+    """
+    corrmatrix = np.eye(len(markets))
+    for i, market1 in enumerate(markets):
+        for j, market2 in enumerate(markets[:i]):
+            if market1.randomgen is market2.randomgen:
+                gen = market1.randomgen
+                corrmatrix[i, j] = corrmatrix[j, i] = gen.corrmatrix[
+                    gen.keyindex[market1.getnoisekeys()[0]],
+                    gen.keyindex[market2.getnoisekeys()[0]]]
+    brownians = np.array([market.getbrownian(date) for market in markets])
+    scores = np.linalg.solve(corrmatrix, brownians.reshape(len(markets), -1))
+    scores = scores.astype(brownians.dtype, copy=False)
+    return [score / (market.initvalue * market.sigma * date)
+            for score, market in zip(scores, markets)]
@@ -0,0 +1,269 @@
+import numpy as np
+import json
+import os
+from efficientmc.utils import getdtype
+
+class LabeledArray:
+    "Tableau numpy contigu dont les axes sont étiquetés."
+
+    def __init__(self, values, dims, coords, weights=None, strata=None,
+                 means=None):
+        """
+        Initialise une nouvelle instance de la classe `LabeledArray`.
+
+        Paramètres :
+        ------------
+        values : numpy.ndarray
+            Données, stockées sans copie.
+        dims
+            Noms des axes de `values`.
+        coords : dictionnaire
+            Étiquettes associées à chacun des axes nommés ; un axe absent
+            de `coords` (typiquement l'axe des simulations) est indexé par
+            la position.
+        weights : numpy.ndarray, optionnel
+            Rapports de vraisemblance des simulations (échantillonnage
+            préférentiel), de taille `(ndates, nsims)` : les moyennes
+            doivent être calculées sur `values * weights`.
+        strata : numpy.ndarray, optionnel
+            Indices des strates des simulations (stratification), de taille
+            `(nsims,)`.
+        means : numpy.ndarray, optionnel
+            Espérances des réalisations lorsqu'elles sont connues, de taille
+            `values.shape[:-1]` (`NaN` si elles ne le sont pas).
+        """
+        self.values = values
+        self.weights = weights
+        self.strata = strata
+        self.means = means
+        self.dims = tuple(dims)
+        self.coords = {dim: list(labels) for dim, labels in coords.items()}
+        self._index = {dim: {label: idx for idx, label in enumerate(labels)}
+                       for dim, labels in self.coords.items()}
+
+    @property
+    def shape(self):
+        "Dimensions du tableau."
+        return self.values.shape
+
+    def index(self, dim, label):
+        "Renvoie la position de l'étiquette `label` sur l'axe `dim`."
+        return self._index[dim][label]
+
+    def sel(self, **labels):
+        """
+        Renvoie une vue (sans copie) des données correspondant aux
+        étiquettes `labels`, données sous la forme `axe=étiquette`.
+        """
+        key = tuple(self.index(dim, labels[dim]) if dim in labels
+                    else slice(None) for dim in self.dims)
+        return self.values[key]
+
+    def to_xarray(self):
+        "Convertit le tableau en `xarray.DataArray` (sans copie)."
+        import xarray as xr
+        return xr.DataArray(self.values, dims=self.dims, coords=self.coords)
+
+class Results:
+    "Cash-flows, volumes et prix simulés par `runmc`."
+
+    def __init__(self, assets, exposures, markets, dates, nsims,
+                 controls=None, weighted=False, strata=None, greeks=None,
+                 pricemeans=None, directory=None, mode='w+'):
+        """
+        Initialise une nouvelle instance de la classe `Results`, dont les
+        tableaux sont préalloués puis remplis en place pendant la
+        simulation.
+
+        Paramètres :
+        ------------
+        assets
+            Identifiants des actifs.
+        exposures
+            Couples `(actif, marché)` pour lesquels des volumes sont
+            enregistrés.
+        markets
+            Identifiants des marchés.
+        dates
+            Grille de dates, triée par ordre croissant.
+        nsims : entier positif
+            Nombre de simulations.
+        controls : dictionnaire, optionnel
+            Espérances des variables de contrôle à enregistrer, indexées
+            par des couples `(actif, rang)`. Si renseigné, les réalisations
+            des variables de contrôle (actualisées) sont stockées dans
+            `controls`.
+        weighted : booléen
+            Si `True`, les rapports de vraisemblance de chaque simulation
+            (échantillonnage préférentiel) sont stockés dans `weights`,
+            tableau de taille `(len(dates), nsims)` partagé par tous les
+            tableaux de résultats.
+        strata : numpy.ndarray, optionnel
+            Indices des strates des simulations, de taille `(nsims,)`,
+            partagés par tous les tableaux de résultats.
+        greeks : liste, optionnelle
+            Identifiants `(actif, marché, grecque)` des dérivées des
+            cash-flows actualisés à enregistrer. Si renseigné, leurs
+            réalisations sont stockées dans `greeks`.
+        pricemeans : numpy.ndarray, optionnel
+            Espérances des prix de chaque marché à chaque date, de taille
+            `(len(markets), len(dates))` (`NaN` si elles ne sont pas
+            connues, 0 aux dates où le marché n'est pas simulé), qui
+            servent à normaliser les deltas (cf. `getdelta`).
+        directory : optionnel
+            Si renseigné, chaque tableau est stocké dans un fichier `.npy`
+            de ce répertoire et manipulé sous la forme d'un
+            `numpy.memmap`, et les étiquettes des axes sont enregistrées
+            dans le fichier `index.json` (cf. `loadresults`).
+        mode : 'w+' ou 'r'
+            Création des fichiers ou ouverture en lecture seule de fichiers
+            existants (lorsque `directory` est renseigné).
+        """
+        dates = list(dates)
+        self.directory = directory
+        self.mode = mode
+        if directory is not None and mode != 'r':
+            os.makedirs(directory, exist_ok=True)
+            self._writeindex(assets, exposures, markets, dates, nsims,
+                             controls, weighted, strata, greeks, pricemeans)
+        self.weights = None
+        if weighted:
+            self.weights = self._mkarray('weights', (len(dates), nsims), 1.)
+        if strata is not None and directory is not None:
+            if mode != 'r':
+                np.save(self._getpath('strata'), strata)
+            strata = np.load(self._getpath('strata'), mmap_mode='r')
+        self.strata = strata
+        self.earnings = LabeledArray(
+            self._mkarray('earnings', (len(assets), len(dates), nsims)),
+            ('asset', 'date', 'sim'), {'asset': assets, 'date': dates},
+            self.weights, self.strata)
+        self.volumes = LabeledArray(
+            self._mkarray('volumes', (len(exposures), len(dates), nsims)),
+            ('exposure', 'date', 'sim'), {'exposure': exposures, 'date': dates},
+            self.weights, self.strata)
+        self.prices = LabeledArray(
+            self._mkarray('prices', (len(markets), len(dates), nsims), None),
+            ('market', 'date', 'sim'), {'market': markets, 'date': dates},
+            self.weights, self.strata, pricemeans)
+        self.controls = None
+        self.controlmeans = None
+        if controls is not None:
+            self.controls = LabeledArray(
+                self._mkarray('controls', (len(controls), len(dates), nsims)),
+                ('control', 'date', 'sim'),
+                {'control': list(controls), 'date': dates}, self.weights,
+                self.strata)
+            self.controlmeans = dict(controls)
+        self.greeks = None
+        if greeks is not None:
+            self.greeks = LabeledArray(
+                self._mkarray('greeks', (len(greeks), len(dates), nsims)),
+                ('greek', 'date', 'sim'),
+                {'greek': list(greeks), 'date': dates}, self.weights,
+                self.strata)
+
+    def __iter__(self):
+        "Permet d'écrire `earnings, volumes, prices = runmc(...)`."
+        return iter((self.earnings, self.volumes, self.prices))
+
+    def _getpath(self, name):
+        "Renvoie le chemin du fichier stockant le tableau `name`."
+        return os.path.join(self.directory, name + '.npy')
+
+    def _mkarray(self, name, shape, fill=0.):
+        """
+        Préalloue le tableau `name`, de taille `shape`, rempli de `fill`
+        (non initialisé si `fill` vaut `None`), en mémoire ou sur le disque,
+        dans le type flottant `getdtype()`.
+        """
+        dtype = getdtype()
+        if self.directory is None:
+            return np.empty(shape, dtype) if fill is None \
+                else np.full(shape, fill, dtype)
+        if self.mode == 'r':
+            return np.load(self._getpath(name), mmap_mode='r')
+        values = np.lib.format.open_memmap(self._getpath(name), mode='w+',
+                                           dtype=dtype, shape=shape)
+        if fill:
+            values[:] = fill
+        return values
+
+    def _writeindex(self, assets, exposures, markets, dates, nsims, controls,
+                    weighted, strata, greeks, pricemeans=None):
+        "Enregistre les étiquettes des axes dans le fichier `index.json`."
+        index = {'assets': list(assets), 'exposures': list(exposures),
+                 'markets': list(markets), 'dates': list(dates),
+                 'nsims': nsims, 'weighted': bool(weighted),
+                 'stratified': strata is not None,
+                 'controls': None, 'greeks': None, 'pricemeans': None}
+        if controls is not None:
+            index['controls'] = [[list(key), float(mean)]
+                                 for key, mean in controls.items()]
+        if greeks is not None:
+            index['greeks'] = list(greeks)
+        if pricemeans is not None:
+            index['pricemeans'] = np.asarray(pricemeans).tolist()
+        with open(os.path.join(self.directory, 'index.json'), 'w') as f:
+            json.dump(index, f)
+
+    def getarrays(self):
+        "Renvoie les tableaux de résultats renseignés, poids compris."
+        arrays = [array.values for array in (self.earnings, self.volumes,
+                                             self.prices, self.controls,
+                                             self.greeks)
+                  if array is not None]
+        if self.weights is not None:
+            arrays.append(self.weights)
+        return arrays
+
+    def write(self, offset, other):
+        """
+        Recopie les résultats `other` (de même structure) dans les
+        simulations d'indices `offset` à `offset + other.nsims - 1`.
+        """
+        for values, othervalues in zip(self.getarrays(), other.getarrays()):
+            values[..., offset:offset + othervalues.shape[-1]] = othervalues
+
+    def flush(self):
+        "Écrit sur le disque les tableaux stockés dans des fichiers."
+        for values in self.getarrays():
+            if isinstance(values, np.memmap):
+                values.flush()
+
+def loadresults(directory):
+    """
+    Ouvre en lecture seule les résultats enregistrés dans le répertoire
+    `directory` (cf. l'argument `directory` de `runmc`). Les tableaux sont
+    projetés en mémoire sans être lus : seules les tranches effectivement
+    utilisées (par exemple `earnings.sel(asset=...)`) sont chargées.
+    """
+    with open(os.path.join(directory, 'index.json')) as f:
+        index = json.load(f)
+    controls = None
+    if index['controls'] is not None:
+        controls = {_totuple(key): mean for key, mean in index['controls']}
+    greeks = None
+    if index['greeks'] is not None:
+        greeks = [_totuple(label) for label in index['greeks']]
+    pricemeans = None
+    if index['pricemeans'] is not None:
+        pricemeans = np.array(index['pricemeans'], dtype=float)
+    strata = None
+    if index['stratified']:
+        strata = np.load(os.path.join(directory, 'strata.npy'),
+                         mmap_mode='r')
+    return Results([_totuple(asset) for asset in index['assets']],
+                   [_totuple(exposure) for exposure in index['exposures']],
+                   index['markets'], index['dates'], index['nsims'],
+                   controls, index['weighted'], strata, greeks, pricemeans,
+                   directory, mode='r')
+
+def _totuple(label):
+    """
+    Convertit en tuples (récursivement) les listes d'un identifiant relu
+    depuis un fichier JSON.
+    """
+    if isinstance(label, list):
+        return tuple(_totuple(item) for item in label)
+    return label
@@ -0,0 +1,63 @@
+"Scénarios de chocs sur les paramètres des marchés."
+
+import numpy as np
+from itertools import product
+
+class Scenarios:
+    """
+    Ensemble de scénarios de chocs sur les paramètres des modèles de
+    Black-Scholes (prix initial, volatilité et taux), évalués sur les mêmes
+    bruits par `runscenarios`.
+    """
+
+    def __init__(self, spot=0., vol=0., rate=0., markets=None):
+        """
+        Initialise une nouvelle instance de la classe `Scenarios`. Les chocs
+        sont donnés par des vecteurs de même taille (ou des scalaires),
+        dont le `k`-ième élément définit le `k`-ième scénario.
+
+        Paramètres :
+        ------------
+        spot : vecteur
+            Chocs relatifs sur le prix initial (0.01 pour +1%).
+        vol : vecteur
+            Chocs absolus sur la volatilité.
+        rate : vecteur
+            Chocs absolus sur le taux.
+        markets : optionnel
+            Identifiants des marchés choqués ; par défaut, tous les marchés
+            sont choqués.
+        """
+        self.spot, self.vol, self.rate = np.broadcast_arrays(
+            *(np.atleast_1d(np.asarray(shock, dtype=float))
+              for shock in (spot, vol, rate)))
+        if self.spot.ndim != 1:
+            raise ValueError("shocks should be scalars or vectors.")
+        self.markets = None if markets is None else set(markets)
+
+    def __len__(self):
+        "Renvoie le nombre de scénarios."
+        return len(self.spot)
+
+    def getlabels(self):
+        "Renvoie les triplets `(spot, vol, rate)` identifiant les scénarios."
+        return list(zip(self.spot.tolist(), self.vol.tolist(),
+                        self.rate.tolist()))
+
+    def getshocks(self, market):
+        """
+        Renvoie les chocs `(spot, vol, rate)` appliqués au marché `market`
+        dans chacun des scénarios (nuls s'il n'est pas choqué).
+        """
+        if self.markets is None or market.name in self.markets:
+            return self.spot, self.vol, self.rate
+        zeros = np.zeros(len(self))
+        return zeros, zeros, zeros
+
+def ladder(spot=(0.,), vol=(0.,), rate=(0.,), markets=None):
+    """
+    Renvoie les scénarios obtenus en combinant tous les chocs de `spot`,
+    `vol` et `rate` (cf. `Scenarios`).
+    """
+    shocks = np.array(list(product(spot, vol, rate)), dtype=float)
+    return Scenarios(shocks[:, 0], shocks[:, 1], shocks[:, 2], markets)
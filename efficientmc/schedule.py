@@ -0,0 +1,57 @@
+class Schedule:
+    """
+    Plan de simulation d'un ensemble d'actifs sur une grille de dates : pour
+    chaque date, marchés à faire avancer et actifs à évaluer.
+    """
+
+    def __init__(self, allassets, allmarkets, dates):
+        """
+        Initialise une nouvelle instance de la classe `Schedule` à partir
+        des dépendances entre actifs et marchés (`getmarkets`) et des dates
+        auxquelles chacun nécessite un calcul (`getdates`).
+
+        Un actif n'est évalué qu'à ses propres dates. Un marché n'avance
+        qu'aux dates de ses actifs et aux siennes, sauf s'il partage son
+        générateur avec d'autres marchés : leurs bruits étant corrélés date
+        par date, ils avancent alors tous aux mêmes dates.
+
+        Paramètres :
+        ------------
+        allassets
+            Liste des actifs à simuler.
+        allmarkets
+            Liste des marchés (sans doublon) auxquels ils sont exposés.
+        dates
+            Grille de dates, triée par ordre croissant.
+        """
+        dateindex = {date: idx for idx, date in enumerate(dates)}
+        self.assets = [[] for _ in dates]
+        marketdates = {market: set(market.getdates())
+                       for market in allmarkets}
+        for aidx, asset in enumerate(allassets):
+            assetdates = list(dict.fromkeys(asset.getdates()))
+            for date in assetdates:
+                self.assets[dateindex[date]].append(aidx)
+            for market in asset.getmarkets():
+                marketdates[market].update(assetdates)
+        gendates = {}
+        for market in allmarkets:
+            gendates.setdefault(market.randomgen, set()).update(
+                marketdates[market])
+        self.markets = [[] for _ in dates]
+        self.idle = [[] for _ in dates]
+        for midx, market in enumerate(allmarkets):
+            mdates = gendates[market.randomgen]
+            for didx, date in enumerate(dates):
+                if date in mdates:
+                    self.markets[didx].append(midx)
+                else:
+                    self.idle[didx].append(midx)
+
+    def __iter__(self):
+        """
+        Itère sur les dates de la grille, en renvoyant pour chacune les
+        indices des marchés qui avancent, des marchés inactifs et des actifs
+        à évaluer.
+        """
+        return iter(zip(self.markets, self.idle, self.assets))
@@ -1,5 +1,37 @@
+import numpy as np
+import tracemalloc
+from collections import deque
+from collections.abc import MutableMapping
 from functools import wraps
 
+# Marqueur des valeurs absentes du cache (`None` pouvant être mis en cache).
+_MISSING = object()
+
+# Type flottant des tableaux de simulation (cf. `setdtype`).
+_DTYPE = np.dtype(np.float64)
+
+def setdtype(dtype):
+    """
+    Renseigne le type flottant (`numpy.float64` par défaut, ou
+    `numpy.float32`) des tableaux de simulation : bruits gaussiens,
+    trajectoires, prix spot, cash-flows, volumes et résultats stockés par
+    `runmc`. Les moyennes et variances (`getmtm`, `getdelta`,
+    `RunningStats`) sont toujours accumulées en double précision.
+
+    La simple précision divise par deux la mémoire occupée et les
+    transferts mémoire ; son erreur d'arrondi (de l'ordre de 1e-7 en
+    relatif) est très inférieure à l'erreur statistique des simulations.
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError("the dtype should be float32 or float64.")
+    global _DTYPE
+    _DTYPE = dtype
+
+def getdtype():
+    "Renvoie le type flottant des tableaux de simulation (cf. `setdtype`)."
+    return _DTYPE
+
 def timecached(func):
     """
     Décorateur permettant d'associer un cache à la fonction `func` :
@@ -14,42 +46,78 @@ def timecached(func):
     Par ailleurs, `func` doit être une méthode d'un objet disposant d'un
     membre `cache` implémentant le cache en lui-même.
     """
+    name = func.__name__
     @wraps(func) # Pour préserver la docstring et le nom de `func`.
     def wrapper(self, date, *args):
-        currdate = self.cache.currentdate
-        if currdate is not None and date != currdate:
-            self.cache.flush() # Nettoyage du cache
-        key = self.cache.makekey(func, date, *args)
-        if key not in self.cache.keys:
-            res = func(self, date, *args)
-            self.cache.register(date, key, res)
-        return self.cache.get(key)
+        cache = self.cache
+        key = (name,) + args
+        if date == cache.currentdate:
+            res = cache._currdata.get(key, _MISSING)
+            if res is not _MISSING:
+                return res
+        elif cache.currentdate is not None:
+            cache.flush() # Nettoyage du cache
+        res = func(self, date, *args)
+        cache.register(date, key, res)
+        return res
     return wrapper
 
-class DateCache:
-    "Cache indexé sur le temps."
+class DateCache(MutableMapping):
+    """
+    Cache indexé sur le temps : les valeurs de la date courante sont
+    accessibles comme celles d'un dictionnaire, et celles des `maxdates`
+    dates précédentes par `getprev`.
+    """
+
+    __slots__ = ('_currdata', '_history', 'currentdate', 'maxsize')
 
-    def __init__(self):
+    def __init__(self, maxdates=1, maxsize=None):
         """
         Initialise une nouvelle instance de la classe `DateCache`.
+
+        Paramètres :
+        ------------
+        maxdates : entier positif
+            Nombre de dates passées dont les valeurs sont conservées
+            (cf. `getprev`).
+        maxsize : entier positif, optionnel
+            Nombre maximal de valeurs stockées pour la date courante ; au
+            delà, les valeurs les plus anciennes sont évincées (et seront
+            recalculées si besoin). Par défaut, le nombre de valeurs n'est
+            pas limité.
         """
-        #FIXME: implémenter les méthodes nécessaires pour que le cache puisse
-        # être utilisé exactement comme un dictionnaire ?
-        self._prevdata = {}
+        if maxdates < 1:
+            raise ValueError("at least one past date should be kept.")
         self._currdata = {}
+        self._history = deque(maxlen=maxdates)
         self.currentdate = None
+        self.maxsize = maxsize
 
     @property
-    def keys(self):
-        "Ensemble des clefs enregistrées dans le cache."
-        return self._currdata.keys()
+    def maxdates(self):
+        "Nombre de dates passées dont les valeurs sont conservées."
+        return self._history.maxlen
 
-    def makekey(self, func, date, *args):
-        """
-        Renvoie la clef utilisée pour stocker le résultat du calcul
-        `func(date, *args)`.
-        """
-        return (func.__name__,) + args
+    def __getitem__(self, key):
+        return self._currdata[key]
+
+    def __setitem__(self, key, value):
+        if self.currentdate is None:
+            raise ValueError("no current date, values should be stored "\
+                             "with `register`.")
+        self.register(self.currentdate, key, value)
+
+    def __delitem__(self, key):
+        del self._currdata[key]
+
+    def __iter__(self):
+        return iter(self._currdata)
+
+    def __len__(self):
+        return len(self._currdata)
+
+    def __contains__(self, key):
+        return key in self._currdata
 
     def register(self, date, key, value):
         """
@@ -69,27 +137,135 @@ class DateCache:
         elif self.currentdate != date:
             raise ValueError("DateCache is meant to store data "\
                              "for only one date at at time.")
-        self._currdata[key] = value
-
-    def get(self, key):
-        "Renvoie la valeur associée à la clef `key`."
-        return self._currdata[key]
+        data = self._currdata
+        if self.maxsize is not None and key not in data:
+            while len(data) >= self.maxsize:
+                # Éviction de la valeur la plus ancienne.
+                del data[next(iter(data))]
+        data[key] = value
 
     def getprev(self, funcname, *args):
         """
-        Renvoie la dernière valeur sauvegardée dans le cache pour la
-        méthode correspondant à `funcname` avec les arguments `*args`.
+        Renvoie le couple `(date, valeur)` le plus récent sauvegardé dans le
+        cache, parmi les dates passées conservées, pour la méthode
+        correspondant à `funcname` avec les arguments `*args`.
         """
-        #FIXME: le `getprev` n'est pas très naturel...
         key = (funcname,) + args
-        if key in self._prevdata.keys():
-            return self._prevdata[key]
+        for date, data in reversed(self._history):
+            if key in data:
+                return date, data[key]
         raise KeyError("%s not in cache." % str(key))
 
     def flush(self):
-        "Nettoie le cache."
-        for key, value in self._currdata.items():
-            # On écrase une éventuelle valeur existante.
-            self._prevdata[key] = (self.currentdate, value)
+        "Passe à une nouvelle date : les valeurs courantes sont archivées."
+        if self._currdata:
+            # Le dictionnaire est archivé tel quel, sans copie.
+            self._history.append((self.currentdate, self._currdata))
+            self._currdata = {}
+        self.currentdate = None
+
+    def clear(self):
+        "Vide entièrement le cache, y compris les valeurs des dates passées."
         self._currdata = {}
+        self._history.clear()
         self.currentdate = None
+
+class Workspace:
+    """
+    Espace de travail d'une simulation : tampons préalloués dans lesquels
+    les modèles et les actifs écrivent leurs résultats (arguments `out=`
+    des ufuncs), et qui sont réutilisés d'une date (et d'un lot) à l'autre
+    au lieu d'allouer de nouveaux tableaux à chaque date.
+
+    Une valeur écrite dans un tampon n'est valable que jusqu'à ce que le
+    même tampon soit redemandé, c'est-à-dire en pratique jusqu'à la date
+    suivante (cf. `getbuffer`).
+    """
+
+    def __init__(self, trace=False):
+        """
+        Initialise une nouvelle instance de la classe `Workspace`.
+
+        Paramètres :
+        ------------
+        trace : booléen
+            Si `True`, la mémoire allouée (au sens de `tracemalloc`, que
+            numpy renseigne) pendant la simulation de chaque date est
+            mesurée et stockée dans `allocations`. Le suivi ralentit la
+            simulation et n'est destiné qu'au diagnostic.
+        """
+        self.buffers = {}
+        self.nallocs = 0
+        self.trace = trace
+        self.allocations = {}
+        self._start = None
+        self._tracing = False
+
+    def getbuffer(self, key, shape, dtype, count=1):
+        """
+        Renvoie un tampon de taille `shape` et de type `dtype` associé à
+        l'identifiant `key`. Si `count` est supérieur à 1, les appels
+        successifs renvoient à tour de rôle `count` tampons distincts, de
+        sorte que la valeur de la date précédente reste disponible pendant
+        le calcul de la suivante. Les tampons ne sont alloués qu'au premier
+        appel (ou lorsque la taille demandée change).
+        """
+        entry = self.buffers.get(key)
+        if entry is None or len(entry[1]) != count \
+           or entry[1][0].shape != shape or entry[1][0].dtype != dtype:
+            entry = [0, [np.empty(shape, dtype) for _ in range(count)]]
+            self.buffers[key] = entry
+            self.nallocs += count
+        idx = entry[0]
+        entry[0] = (idx + 1) % count
+        return entry[1][idx]
+
+    @property
+    def nbytes(self):
+        "Mémoire occupée par l'ensemble des tampons."
+        return sum(buf.nbytes for _, bufs in self.buffers.values()
+                   for buf in bufs)
+
+    def startdate(self):
+        "Signale le début de la simulation d'une date (cf. `trace`)."
+        if self.trace:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            self._start = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+    def enddate(self, date):
+        """
+        Signale la fin de la simulation de la date `date` : si `trace` vaut
+        `True`, le pic de mémoire allouée depuis `startdate` est ajouté à
+        `allocations[date]` (cumulé sur les lots).
+        """
+        if self.trace and self._start is not None:
+            peak = tracemalloc.get_traced_memory()[1] - self._start
+            self.allocations[date] = self.allocations.get(date, 0) + peak
+            self._start = None
+
+    def close(self):
+        """
+        Arrête le suivi de `tracemalloc` s'il a été démarré par cet espace
+        de travail (appelé à la fin de chaque lot de simulations). Les tampons et les
+        allocations mesurées sont conservés, et le suivi reprend si l'espace
+        est réutilisé par une autre simulation.
+        """
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        self._start = None
+
+def getbuffer(obj, name, shape, dtype, count=1):
+    """
+    Renvoie un tampon de taille `shape` et de type `dtype`, identifié par
+    `name`, de l'espace de travail `obj.workspace` (cf.
+    `Workspace.getbuffer`) s'il est renseigné (pendant `runmc`), un nouveau
+    tableau sinon.
+    """
+    workspace = getattr(obj, 'workspace', None)
+    if workspace is None:
+        return np.empty(shape, dtype)
+    return workspace.getbuffer((id(obj), name), shape, dtype, count)
@@ -1,6 +1,9 @@
+import tempfile
+import tracemalloc
 import numpy as np
 import efficientmc as mc
 from functools import partial
+from scipy.special import ndtr
 
 def runtests(allgenerators, partialmarkets, partialassets):
     """
@@ -34,18 +37,555 @@ def runtests(allgenerators, partialmarkets, partialassets):
             print("%s: %.5f [%.5f, %.5f]" % (k, v.mean, v.iclow, v.icup))
         print("")
 
+def test_analytic():
+    """
+    Vérifie que les MtM du call et du spread, corrigées par leurs variables
+    de contrôle, encadrent les prix en formule fermée (Black-Scholes et
+    Margrabe).
+    """
+    gen = mc.generators.GaussianGenerator(
+        2**16, np.array([[1., 0.5], [0.5, 1.]]), ["BS1", "BS2"],
+        mc.generators.PseudoRandomStream(0))
+    market1 = mc.pricemodels.BlackScholesModel("BS1", 100., 0.02, 0.2, gen)
+    market2 = mc.pricemodels.BlackScholesModel("BS2", 95., 0.02, 0.3, gen)
+    call = mc.assets.EuropeanCall("call", market1, 100., 1.)
+    spread = mc.assets.EuropeanSpread("spread", market1, market2, 1.)
+    mtm = mc.getmtm(mc.runmc(call, spread, controls=True), alpha=0.999)
+    price = mc.analytic.blackscholes_call(100., 100., 0.02, 0.2, 1.)
+    assert mtm["call"].iclow <= price <= mtm["call"].icup
+    price = mc.analytic.margrabe(100., 95., 0.2, 0.3, 0.5, 1.)
+    assert mtm["spread"].iclow <= price <= mtm["spread"].icup
+
+def test_basketcontrols():
+    """
+    Vérifie la variable de contrôle d'un call sur panier (call sur la
+    moyenne géométrique) : sa moyenne simulée est compatible avec son prix
+    en formule fermée, et la MtM corrigée, compatible avec la MtM brute,
+    a un intervalle de confiance bien plus étroit.
+    """
+    corrmatrix = np.array([[1., 0.5], [0.5, 1.]])
+    gen = mc.generators.GaussianGenerator(
+        2**15, corrmatrix, ["MA1", "MA2"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.MultiAssetsBlackScholesModel(
+        "MA", 2, [100., 90.], 0.02, [0.2, 0.3], gen)
+    basket = mc.assets.BasketOption("basket", market, "call", 2, [1., 1.],
+                                    1., 95.)
+    res = mc.runmc(basket, controls=True)
+    controls = res.controls.values.sum(axis=1, dtype=np.float64)[0]
+    price = mc.analytic.geometric_basket_call(
+        [100., 90.], [0.5, 0.5], 95., 0.02, [0.2, 0.3], corrmatrix, 1.)
+    assert abs(controls.mean() - price) \
+        < 4. * controls.std() / np.sqrt(len(controls))
+    plain = mc.getmtm(res.earnings, alpha=0.999)["basket"]
+    mtm = mc.getmtm(res, alpha=0.999)["basket"]
+    assert plain.iclow <= mtm.mean <= plain.icup
+    assert mtm.icup - mtm.iclow < 0.1 * (plain.icup - plain.iclow)
+    # Le panier arithmétique vaut plus que le panier géométrique.
+    assert mtm.iclow > price
+
+def test_chunks():
+    """
+    Vérifie que la simulation par lots (`chunksize`) donne les mêmes MtM et
+    deltas que la simulation de toutes les trajectoires en une fois, et
+    que des simulations successives des mêmes actifs sont identiques.
+    """
+    gen = mc.generators.GaussianGenerator(
+        2**14, np.eye(1), ["BS"],
+        mc.generators.PseudoRandomStream(1, blocksize=1024))
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+    strip = mc.assets.EuropeanStrip("strip", market, [90., 100., 110.],
+                                    [0.5, 1., 1.5])
+    cf, volumes, prices = mc.runmc(strip)
+    mtm, delta = mc.getmtm(cf), mc.getdelta(volumes, prices)
+    chunkmtm, chunkdelta = mc.runmc(strip, chunksize=4096, blocksize=1024)
+    chunkmtm, chunkdelta = mc.getmtm(chunkmtm), mc.getdelta(chunkdelta)
+    for key, value in mtm.items():
+        assert np.isclose(value.mean, chunkmtm[key].mean, rtol=1e-12)
+        assert np.isclose(value.icup, chunkmtm[key].icup, rtol=1e-12)
+    for key, value in delta.items():
+        assert np.allclose(value.mean, chunkdelta[key].mean, rtol=1e-12)
+        assert np.allclose(value.icup, chunkdelta[key].icup, rtol=1e-12)
+    assert np.array_equal(mc.runmc(strip).earnings.values, cf.values)
+    assert np.array_equal(mc.runmc(strip).earnings.values, cf.values)
+
+def test_faure():
+    """
+    Vérifie la suite de Faure contre ses premiers points en base 2, et
+    qu'un `QMCStream` n'utilise qu'une seule base pour toutes les dates.
+    """
+    gens = mc.generators
+    expected = np.array([[1/2, 1/4, 3/4, 1/8], [1/2, 3/4, 1/4, 5/8]])
+    assert np.allclose(ndtr(gens.faureF(2, 4)), expected)
+    stream = gens.QMCStream(partial(gens.faureF, base=gens.faure_base(6)))
+    assert np.array_equal(np.vstack([stream(2, 8, step=step)
+                                     for step in range(3)]),
+                          gens.faureF(6, 8))
+    try:
+        gens.QMCStream(gens.faureF)(2, 8, step=1)
+        assert False, "implicit base"
+    except ValueError:
+        pass
+
+def test_greeks():
+    """
+    Vérifie que les grecques d'un call (delta, vega et rho trajectoriels,
+    gamma par rapport de vraisemblance) encadrent leurs valeurs
+    Black-Scholes, et que leur agrégation par lots ne les modifie pas.
+    """
+    spot, strike, rate, sigma, maturity = 100., 100., 0.02, 0.2, 1.
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma**2) * maturity) \
+        / (sigma * np.sqrt(maturity))
+    density = np.exp(-0.5 * d1**2) / np.sqrt(2. * np.pi)
+    expected = {'delta': ndtr(d1),
+                'gamma': density / (spot * sigma * np.sqrt(maturity)),
+                'vega': spot * density * np.sqrt(maturity),
+                'rho': strike * maturity * np.exp(-rate * maturity) \
+                    * ndtr(d1 - sigma * np.sqrt(maturity))}
+    gen = mc.generators.GaussianGenerator(
+        2**16, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.BlackScholesModel("BS", spot, rate, sigma, gen)
+    call = mc.assets.EuropeanCall("call", market, strike, maturity)
+    greeks = mc.getgreeks(mc.runmc(call, greeks=True), alpha=0.999)
+    comps = mc.runmc(call, greeks=True, chunksize=8192, blocksize=1024,
+                     computations=[mc.GreeksComputation()])
+    chunkgreeks = mc.getgreeks(comps[0], alpha=0.999)
+    for (_, _, greek), value in greeks.items():
+        assert value.iclow <= expected[greek] <= value.icup
+        assert np.isclose(value.mean,
+                          chunkgreeks[("call", "BS", greek)].mean, rtol=1e-12)
+
+def test_halton():
+    """
+    Vérifie la suite de Halton contre ses premiers points (inverses
+    radicaux en bases 2 et 3), et que ses tranches ne dépendent pas du
+    découpage en lots.
+    """
+    gens = mc.generators
+    expected = np.array([[1/2, 1/4, 3/4, 1/8], [1/3, 2/3, 1/9, 4/9]])
+    assert np.allclose(gens.radical_inverse([1, 2, 3, 4], 2), expected[0])
+    assert np.allclose(ndtr(gens.haltonF(2, 4)), expected)
+    assert np.allclose(ndtr(gens.haltonF(1, 2, start=2, firstdim=1)),
+                       expected[1:, 2:])
+    full = gens.hammersley(3, 64)
+    assert np.array_equal(gens.hammersley(3, 16, start=32, npoints=64),
+                          full[:, 32:48])
+
+def test_multiassets():
+    """
+    Vérifie que les actifs de `MultiAssetsBlackScholesModel` sont dirigés
+    par des bruits distincts, corrélés selon la matrice du générateur, et
+    qu'un panier réduit à un seul actif a le prix Black-Scholes de cet
+    actif, avec des cash-flows identiques avec `runmc` et `runmcpaths`.
+    """
+    corrmatrix = np.array([[1., 0.5, -0.3], [0.5, 1., 0.2], [-0.3, 0.2, 1.]])
+    gen = mc.generators.GaussianGenerator(
+        2**15, corrmatrix, ["MA1", "MA2", "MA3"],
+        mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.MultiAssetsBlackScholesModel(
+        "MA", 3, [100., 90., 110.], 0.02, [0.2, 0.3, 0.25], gen)
+    assert np.array_equal(market.getcorrmatrix(), corrmatrix)
+    spots = mc.paths.Paths([market], [1.]).getspots(market, 1.)
+    assert spots.shape == (3, 2**15)
+    assert np.allclose(np.corrcoef(np.log(spots)), corrmatrix, atol=0.03)
+    first = mc.assets.BasketOption("first", market, "call", 3, [1., 0., 0.],
+                                   1., 95.)
+    last = mc.assets.BasketOption("last", market, "call", 3, [0., 0., 2.],
+                                  1., 105.)
+    prices = {"first": mc.analytic.blackscholes_call(100., 95., 0.02, 0.2, 1.),
+              "last": mc.analytic.blackscholes_call(110., 105., 0.02, 0.25,
+                                                    1.)}
+    cf = mc.runmc(first, last).earnings
+    assert np.array_equal(cf.values, mc.runmcpaths(first, last).earnings.values)
+    mtm = mc.getmtm(cf, alpha=0.999)
+    for name, price in prices.items():
+        assert mtm[name].iclow <= price <= mtm[name].icup
+
+def test_rununtil():
+    """
+    Vérifie que la simulation adaptative s'arrête dès que la précision
+    demandée (absolue ou relative) est atteinte, ou que le budget est
+    épuisé, et qu'elle effectue les premières simulations de `runmc`.
+    """
+    def mkcall(nsims):
+        gen = mc.generators.GaussianGenerator(
+            nsims, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+        market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+        return mc.assets.EuropeanCall("call", market, 100., 1.)
+    call = mkcall(2**20)
+    price = mc.analytic.blackscholes_call(100., 100., 0.02, 0.2, 1.)
+    mtm, _ = mc.rununtil(call, abstol=0.1, batchsize=4096, blocksize=1024)
+    nsims = mtm.stats.count
+    mtm = mc.getmtm(mtm)["call"]
+    assert nsims < 2**20 and mtm.icup - mtm.iclow <= 0.2
+    assert mtm.iclow <= price <= mtm.icup
+    full, _ = mc.runmc(mkcall(nsims), chunksize=4096, blocksize=1024)
+    assert mc.getmtm(full)["call"].mean == mtm.mean
+    mtm, _ = mc.rununtil(call, reltol=0.01, batchsize=4096, blocksize=1024)
+    mtm = mc.getmtm(mtm)["call"]
+    assert mtm.icup - mtm.iclow <= 0.02 * mtm.mean
+    mtm, _ = mc.rununtil(call, abstol=1e-6, batchsize=4096, blocksize=1024,
+                         maxsims=3 * 4096)
+    assert mtm.stats.count == 3 * 4096
+
+def test_scenarios():
+    """
+    Vérifie que les MtM d'un call dans chaque scénario d'une grille de
+    chocs (`ladder`), et leurs écarts au scénario central, encadrent les
+    prix Black-Scholes correspondants, les écarts étant estimés plus
+    précisément grâce aux aléas communs.
+    """
+    gen = mc.generators.GaussianGenerator(
+        2**15, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+    call = mc.assets.EuropeanCall("call", market, 100., 1.)
+    scenarios = mc.scenarios.ladder(spot=(-0.1, 0., 0.1), vol=(0., 0.05),
+                                    rate=(0., 0.01))
+    assert len(scenarios) == 12
+    cf = mc.runscenarios(call, scenarios=scenarios)
+    mtm = mc.getscenariomtm(cf, alpha=0.999)["call"]
+    diff = mc.getscenariomtm(cf, alpha=0.999, base=(0., 0., 0.))["call"]
+    base = mc.analytic.blackscholes_call(100., 100., 0.02, 0.2, 1.)
+    for label in scenarios.getlabels():
+        spot, vol, rate = label
+        price = mc.analytic.blackscholes_call(100. * (1. + spot), 100.,
+                                              0.02 + rate, 0.2 + vol, 1.)
+        assert mtm.iclow[label] <= price <= mtm.icup[label]
+        assert diff.iclow[label] <= price - base <= diff.icup[label]
+        assert diff.icup[label] - diff.iclow[label] \
+            < mtm.icup[label] - mtm.iclow[label]
+
+def test_schedule():
+    """
+    Vérifie que chaque marché n'avance qu'aux dates de ses actifs (sauf
+    s'il partage son générateur), que ses prix valent `NaN` aux autres
+    dates, et que ses actifs ont alors les mêmes cash-flows que s'ils
+    étaient simulés seuls.
+    """
+    def mkcalls(shared=False):
+        gens = [mc.generators.GaussianGenerator(
+            2**14, np.eye(1), [name], mc.generators.PseudoRandomStream(seed))
+            for seed, name in enumerate(["A", "B"])]
+        if shared:
+            gens = 2 * [mc.generators.GaussianGenerator(
+                2**14, np.array([[1., 0.5], [0.5, 1.]]), ["A", "B"],
+                mc.generators.PseudoRandomStream(0))]
+        market1 = mc.pricemodels.BlackScholesModel("A", 100., 0.02, 0.2,
+                                                   gens[0])
+        market2 = mc.pricemodels.BlackScholesModel("B", 50., 0.02, 0.3,
+                                                   gens[1])
+        return [mc.assets.EuropeanCall("callA", market1, 100., 0.5),
+                mc.assets.EuropeanCall("callB", market2, 50., 1.)]
+    calls = mkcalls()
+    markets = [call.market for call in calls]
+    assert list(mc.Schedule(calls, markets, [0.5, 1.])) \
+        == [([0], [1], [0]), ([1], [0], [1])]
+    calls = mkcalls(shared=True)
+    markets = [call.market for call in calls]
+    assert list(mc.Schedule(calls, markets, [0.5, 1.])) \
+        == [([0, 1], [], [0]), ([0, 1], [], [1])]
+    calls = mkcalls()
+    cf, _, prices = mc.runmc(*calls)
+    assert np.isnan(prices.values[1, 0]).all()
+    assert np.isnan(prices.values[0, 1]).all()
+    mtm = mc.getmtm(cf, alpha=0.999)
+    for call, (spot, sigma) in zip(mkcalls(), [(100., 0.2), (50., 0.3)]):
+        alone = mc.getmtm(mc.runmc(call).earnings)[call.name]
+        assert alone.mean == mtm[call.name].mean
+        price = mc.analytic.blackscholes_call(spot, call.strike, 0.02, sigma,
+                                              call.maturity)
+        assert mtm[call.name].iclow <= price <= mtm[call.name].icup
+
+def test_sobol():
+    """
+    Vérifie la suite de Sobol contre ses premiers points (directions de
+    Joe et Kuo), que ses tranches ne dépendent pas du découpage en lots, et
+    que le brouillage d'Owen conserve la stratification des points.
+    """
+    gens = mc.generators
+    expected = np.array([[1/2, 3/4, 1/4, 3/8, 7/8, 5/8, 1/8],
+                         [1/2, 1/4, 3/4, 3/8, 7/8, 1/8, 5/8],
+                         [1/2, 1/4, 3/4, 5/8, 1/8, 7/8, 3/8]])
+    assert np.allclose(ndtr(gens.sobolF(3, 7)), expected)
+    assert np.array_equal(gens.sobolF(2, 3, start=4, firstdim=1),
+                          gens.sobolF(3, 7)[1:, 4:])
+    points = ndtr(gens.SobolSequence('owen', 3)(2, 16))
+    for row in np.floor(points * 16):
+        assert np.array_equal(np.sort(row), np.arange(16))
+
+def test_rqmc():
+    """
+    Vérifie que les intervalles de confiance du quasi-Monte Carlo randomisé
+    (suite de Sobol brouillée, suite de Halton décalée) encadrent le prix
+    Black-Scholes d'un call, y compris en simulant par lots.
+    """
+    price = mc.analytic.blackscholes_call(100., 100., 0.02, 0.2, 1.)
+    for randomfunc in [mc.generators.SobolSequence(), mc.generators.haltonF]:
+        for kwargs in [{}, {'chunksize': 1024, 'blocksize': 512}]:
+            gen = mc.generators.GaussianGenerator(4096, np.eye(1), ["BS"],
+                                                  randomfunc)
+            market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2,
+                                                      gen)
+            call = mc.assets.EuropeanCall("call", market, 100., 1.)
+            reps = mc.runrqmc(call, nreplications=16, seed=0, **kwargs)
+            mtm = mc.getmtm(reps, alpha=0.999)["call"]
+            assert mtm.iclow <= price <= mtm.icup
+
+def test_noisestore():
+    """
+    Vérifie que les bruits relus par `NoiseStore` sont ceux du flux stocké,
+    y compris par un autre stockage partageant le même répertoire, et que
+    le nombre de fichiers ouverts reste borné.
+    """
+    stream = mc.generators.PseudoRandomStream(2, blocksize=256)
+    with tempfile.TemporaryDirectory() as directory:
+        store = mc.generators.NoiseStore(stream, directory, blocksize=256,
+                                         maxblocks=2)
+        expected = stream(3, 1000, start=100, step=1)
+        assert np.array_equal(store(3, 1000, start=100, step=1), expected)
+        assert len(store._blocks) <= 2
+        # Les bruits sont relus depuis le disque, sans utiliser le flux.
+        other = mc.generators.PseudoRandomStream(3, blocksize=256)
+        reader = mc.generators.NoiseStore(other, directory, blocksize=256,
+                                          key=store.getkey())
+        assert np.array_equal(reader(3, 1000, start=100, step=1), expected)
+        # Fermeture des fichiers avant la suppression du répertoire.
+        del store, reader
+
+def test_constructions():
+    r"""
+    Vérifie que les constructions de trajectoires (incrémentale, pont
+    brownien, ACP) reproduisent la covariance :math:`\min(s, t)` du
+    mouvement brownien, que les dates peuvent être données dans un ordre
+    quelconque, et que le quasi-Monte Carlo avec pont brownien encadre les
+    prix Black-Scholes d'une famille de calls.
+    """
+    dates = [0.25, 0.5, 1., 2., 3.]
+    for name in ['incremental', 'bridge', 'pca']:
+        matrix = mc.pricemodels.getconstruction(name, tuple(dates)).build(
+            np.eye(len(dates)))
+        assert np.allclose(matrix @ matrix.T, np.minimum.outer(dates, dates))
+    noises = np.random.default_rng(0).standard_normal((len(dates), 3))
+    order = [3, 0, 4, 1, 2]
+    assert np.array_equal(
+        mc.pricemodels.brownianpaths('bridge', np.array(dates)[order],
+                                     noises),
+        mc.pricemodels.brownianpaths('bridge', dates, noises)[order])
+    gen = mc.generators.GaussianGenerator(4096, np.eye(1), ["BS"],
+                                          mc.generators.SobolSequence())
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen,
+                                              construction='bridge')
+    strip = mc.assets.EuropeanStrip("strip", market, [90., 100., 110.],
+                                    [0.5, 1., 1.5])
+    mtm = mc.getmtm(mc.runrqmc(strip, nreplications=16, seed=0), alpha=0.999)
+    for (_, strike, maturity), value in mtm.items():
+        price = mc.analytic.blackscholes_call(100., strike, 0.02, 0.2,
+                                              maturity)
+        assert value.iclow <= price <= value.icup
+
+def test_datecache():
+    """
+    Vérifie le comportement de `DateCache` : accès aux valeurs de la date
+    courante, archivage des dates passées et éviction des valeurs les plus
+    anciennes.
+    """
+    cache = mc.utils.DateCache(maxdates=2, maxsize=2)
+    try:
+        cache[("f",)] = 0.
+        assert False, "no current date"
+    except ValueError:
+        pass
+    for date in [1., 2., 3.]:
+        cache.register(date, ("f",), date)
+        cache[("g",)] = -date
+        assert cache[("f",)] == date and len(cache) == 2
+        cache.flush()
+    assert ("f",) not in cache and cache.currentdate is None
+    assert cache.getprev("f") == (3., 3.)
+    assert cache.getprev("g") == (3., -3.)
+    cache.register(4., ("f",), 4.)
+    try:
+        cache.register(5., ("f",), 5.)
+        assert False, "two dates"
+    except ValueError:
+        pass
+    # Au delà de `maxsize` valeurs, la première stockée est évincée (la
+    # mise à jour d'une valeur ne change pas son rang).
+    cache[("g",)] = -4.
+    cache[("f",)] = 4.
+    cache[("h",)] = 0.
+    assert list(cache) == [("g",), ("h",)]
+    cache.flush()
+    cache.flush()
+    assert cache.getprev("g") == (4., -4.)
+    assert cache.getprev("f") == (3., 3.)
+    try:
+        cache.getprev("g", 1)
+        assert False, "missing key"
+    except KeyError:
+        pass
+
+def test_float32():
+    """
+    Vérifie qu'en simple précision (cf. `setdtype`) les résultats sont
+    stockés en `float32` et que les MtM restent proches de celles obtenues
+    en double précision.
+    """
+    allmtm = []
+    dtype = mc.getdtype()
+    try:
+        for newdtype in [np.float32, np.float64]:
+            mc.setdtype(newdtype)
+            gen = mc.generators.GaussianGenerator(
+                4096, np.array([[1., 0.5], [0.5, 1.]]), ["BS1", "BS2"],
+                mc.generators.PseudoRandomStream(0))
+            market1 = mc.pricemodels.BlackScholesModel("BS1", 100., 0.02,
+                                                       0.2, gen)
+            market2 = mc.pricemodels.BlackScholesModel("BS2", 95., 0.02,
+                                                       0.3, gen)
+            call = mc.assets.EuropeanCall("call", market1, 100., 1.)
+            spread = mc.assets.EuropeanSpread("spread", market1, market2, 1.)
+            cf, volumes, prices = mc.runmc(call, spread)
+            for res in [cf, volumes, prices]:
+                assert res.values.dtype == newdtype
+            allmtm.append(mc.getmtm(cf))
+        try:
+            mc.setdtype(np.int32)
+            assert False, "integer dtype"
+        except ValueError:
+            pass
+    finally:
+        mc.setdtype(dtype)
+    for key, value in allmtm[0].items():
+        assert np.isclose(value.mean, allmtm[1][key].mean, rtol=1e-5)
+
+def test_strip():
+    """
+    Vérifie qu'une famille d'options (`EuropeanStrip`) a les mêmes
+    cash-flows et deltas que les options correspondantes évaluées une à
+    une, et que ses MtM (calls et puts) encadrent les prix Black-Scholes.
+    """
+    gen = mc.generators.GaussianGenerator(
+        2**15, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+    strikes, maturities = [90., 100., 110.], [0.5, 1., 1.5]
+    strip = mc.assets.EuropeanStrip("calls", market, strikes, maturities)
+    puts = mc.assets.EuropeanStrip("puts", market, strikes, maturities,
+                                   typeO="put")
+    calls = [mc.assets.EuropeanCall(("call", strike, maturity), market,
+                                    strike, maturity)
+             for strike, maturity in zip(strikes, maturities)]
+    cf, volumes, prices = mc.runmc(strip, puts, *calls)
+    mtm = mc.getmtm(cf, alpha=0.999)
+    delta = mc.getdelta(volumes, prices)
+    for strike, maturity in zip(strikes, maturities):
+        key = ("calls", strike, maturity)
+        assert np.array_equal(cf.sel(asset=key),
+                              cf.sel(asset=("call", strike, maturity)))
+        assert np.array_equal(delta[(key, "BS")].mean,
+                              delta[(("call", strike, maturity), "BS")].mean)
+        call = mc.analytic.blackscholes_call(100., strike, 0.02, 0.2,
+                                             maturity)
+        put = call - 100. + strike * np.exp(-0.02 * maturity)
+        assert mtm[key].iclow <= call <= mtm[key].icup
+        key = ("puts", strike, maturity)
+        assert mtm[key].iclow <= put <= mtm[key].icup
+
+def test_stratification():
+    """
+    Vérifie l'allocation des simulations entre strates, et que la MtM d'un
+    call stratifié (allocations proportionnelle et de Neyman) encadre le
+    prix Black-Scholes avec un intervalle plus étroit qu'une simulation
+    classique, que les résultats soient conservés ou agrégés par lots.
+    """
+    assert list(mc.generators.allocate([1., 1., 1., 1.], 100)) == [25] * 4
+    assert list(mc.generators.allocate([0., 1., 3.], 100)) == [2, 26, 72]
+    price = mc.analytic.blackscholes_call(100., 110., 0.02, 0.2, 1.)
+    widths = []
+    for allocation in ['proportional', 'neyman']:
+        gen = mc.generators.GaussianGenerator(
+            2**14, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+        market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+        call = mc.assets.EuropeanCall("call", market, 110., 1.)
+        plain = mc.getmtm(mc.runmc(call).earnings, alpha=0.999)["call"]
+        mc.optimizestrata(call, nstrata=16, allocation=allocation)
+        mtm = mc.getmtm(mc.runmc(call).earnings, alpha=0.999)["call"]
+        chunkmtm = mc.getmtm(mc.runmc(call, chunksize=4096, blocksize=1024)[0],
+                             alpha=0.999)["call"]
+        assert mtm.iclow <= price <= mtm.icup
+        assert np.isclose(mtm.mean, chunkmtm.mean, rtol=1e-12)
+        assert np.isclose(mtm.icup, chunkmtm.icup, rtol=1e-12)
+        widths.append((mtm.icup - mtm.iclow) / (plain.icup - plain.iclow))
+    assert widths[1] < widths[0] < 0.5
+
+def test_workspace():
+    """
+    Vérifie que les tampons de l'espace de travail sont réutilisés d'un lot
+    et d'une simulation à l'autre, et que le suivi de la mémoire démarré
+    par l'espace de travail est arrêté à la fin de la simulation.
+    """
+    gen = mc.generators.GaussianGenerator(
+        4096, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0.02, 0.2, gen)
+    strip = mc.assets.EuropeanStrip("strip", market, [90., 100., 110.],
+                                    [0.5, 1., 1.5])
+    workspace = mc.Workspace(trace=not tracemalloc.is_tracing())
+    mtm = mc.getmtm(mc.runmc(strip, chunksize=1024, blocksize=512,
+                             workspace=workspace)[0])
+    nallocs = workspace.nallocs
+    again = mc.getmtm(mc.runmc(strip, chunksize=1024, blocksize=512,
+                               workspace=workspace)[0])
+    assert workspace.nallocs == nallocs
+    assert all(mtm[key].mean == again[key].mean for key in mtm)
+    if workspace.trace:
+        assert sorted(workspace.allocations) == [0.5, 1., 1.5]
+        assert not tracemalloc.is_tracing()
+
+def test_importance():
+    """
+    Vérifie que, sous échantillonnage préférentiel (`optimizedrift`), les
+    intervalles de confiance de la MtM et du delta d'un call très en
+    dehors de la monnaie encadrent le prix et le delta Black-Scholes,
+    que les résultats soient conservés ou agrégés au fil de l'eau.
+    """
+    gen = mc.generators.GaussianGenerator(
+        2**14, np.eye(1), ["BS"], mc.generators.PseudoRandomStream(0))
+    market = mc.pricemodels.BlackScholesModel("BS", 100., 0., 0.2, gen)
+    call = mc.assets.EuropeanCall("call", market, 150., 1.)
+    mc.optimizedrift(call)
+    price = mc.analytic.blackscholes_call(100., 150., 0., 0.2, 1.)
+    delta = ndtr((np.log(100. / 150.) + 0.5 * 0.2**2) / 0.2)
+    cf, volumes, prices = mc.runmc(call)
+    mtm, chunkdelta = mc.runmc(call, chunksize=4096, blocksize=1024)
+    for res in [mc.getmtm(cf, alpha=0.999), mc.getmtm(mtm, alpha=0.999)]:
+        assert res["call"].iclow <= price <= res["call"].icup
+        # Sans décalage, l'intervalle est plus large que la moitié du prix.
+        assert res["call"].icup - res["call"].iclow < 0.1 * price
+    for res in [mc.getdelta(volumes, prices, alpha=0.999),
+                mc.getdelta(chunkdelta, alpha=0.999)]:
+        res = res[("call", "BS")]
+        assert res.iclow.iloc[-1] <= delta <= res.icup.iloc[-1]
+
+def runchecks():
+    "Lance les vérifications de ce fichier (fonctions `test_*`)."
+    for name, func in sorted(globals().items()):
+        if name.startswith("test_") and callable(func):
+            func()
+            print("%s: OK" % name)
+
 if __name__ == '__main__':
+    runchecks()
+
     # Graine fixée afin d'avoir des résultats reproductibles.
     np.random.seed(0)
 
     # Calls européens, modèle de Black-Scholes :
     ALLGENERATORS = {"Classique": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], np.random.randn),
                      "Antithétique": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.antithetic_randn),
-                     "Van Der Corput": mc.generators.GaussianGenerator(5000, np.array([[1.]]), ["BlackScholes"], mc.generators.van_der_corput_dimension),
-                     "Halton2": mc.generators.GaussianGenerator(50000, np.array([[1.]]), ["BlackScholes"], mc.generators.halton2),
-                     "HaltonF": mc.generators.GaussianGenerator(5000, np.array([[1.]]), ["BlackScholes"], mc.generators.haltonF),
-                     "Hammersley": mc.generators.GaussianGenerator(5000, np.array([[1.]]), ["BlackScholes"], mc.generators.hammersley),
-                     "Faure": mc.generators.GaussianGenerator(5000, np.array([[1.]]), ["BlackScholes"], mc.generators.faureF),
+                     "Van Der Corput": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.van_der_corput_dimension),
+                     "Halton2": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.halton2),
+                     "HaltonF": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.haltonF),
+                     "Hammersley": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.hammersley),
+                     "Faure": mc.generators.GaussianGenerator(500000, np.array([[1.]]), ["BlackScholes"], mc.generators.faureF),
                      "SobolF": mc.generators.GaussianGenerator(50000, np.array([[1.]]), ["BlackScholes"], mc.generators.sobolF),
                      "Stratification": mc.generators.GaussianGenerator(50000,np.array([[1.]]),["BlackScholes"],mc.generators.stratified_samplingF)}
     PARTIALMARKETS = {"market": partial(mc.pricemodels.BlackScholesModel, "BlackScholes", 100., 0., 0.2)}
@@ -57,10 +597,11 @@ if __name__ == '__main__':
     # Spreads européens, modèle de Black-Scholes :
     ALLGENERATORS = {"Classique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], np.random.randn),
                      "Antithétique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.antithetic_randn),
-                     "Van Der Corput": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.van_der_corput_dimension),
-                     "Halton2": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.halton2),
-                     "HaltonF": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.haltonF),
-                     "Hammersley": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.hammersley),
+                     "Van Der Corput": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.van_der_corput_dimension),
+                     "Halton2": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.halton2),
+                     "HaltonF": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.haltonF),
+                     "Hammersley": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.hammersley),
+                     "Faure": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.faureF),
                      "SobolF": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.sobolF),
                      "Stratification": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["BlackScholes1", "BlackScholes2"], mc.generators.stratified_samplingF)}
     PARTIALMARKETS = {"market1": partial(mc.pricemodels.BlackScholesModel, "BlackScholes1", 100., 0., 0.2),
@@ -69,14 +610,15 @@ if __name__ == '__main__':
     runtests(ALLGENERATORS, PARTIALMARKETS, PARTIALASSETS)
 
     # Basket option, modèle de Black-Scholes :
-    ALLGENERATORS = {"Classique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], np.random.randn),
-                     "Antithétique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.antithetic_randn),
-                     "Van Der Corput": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.van_der_corput_dimension),
-                     "Halton 2": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.halton2),
-                     "Halton F": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.haltonF),
-                     "Hammersley": mc.generators.GaussianGenerator(5000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.hammersley),
-                     "SobolF": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.sobolF),
-                     "Stratification": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes"], mc.generators.stratified_samplingF)}
+    ALLGENERATORS = {"Classique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], np.random.randn),
+                     "Antithétique": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.antithetic_randn),
+                     "Van Der Corput": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.van_der_corput_dimension),
+                     "Halton 2": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.halton2),
+                     "Halton F": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.haltonF),
+                     "Hammersley": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.hammersley),
+                     "Faure": mc.generators.GaussianGenerator(500000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.faureF),
+                     "SobolF": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.sobolF),
+                     "Stratification": mc.generators.GaussianGenerator(50000, np.array([[1.0, 0.5], [0.5, 1.0]]), ["MultiAssetsBlackScholes1", "MultiAssetsBlackScholes2"], mc.generators.stratified_samplingF)}
     PARTIALMARKETS = {"markets": partial(mc.pricemodels.MultiAssetsBlackScholesModel, "MultiAssetsBlackScholes", 2, np.array([200., 190.]), 0., np.array([0.2, 0.2])) }
     PARTIALASSETS = [partial(mc.assets.BasketOption, name="basket", typeO="call",numbersU=2, numbersA=np.array([2., 2.]), maturity=1.,strike=110.)]
     runtests(ALLGENERATORS, PARTIALMARKETS, PARTIALASSETS)